@@ -0,0 +1,119 @@
+import hashlib
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from django.apps import apps
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+# Область данных -> модель, в строке которой хранится её версия
+# (колонка data_version).
+SCOPE_MODELS = {
+    'company': 'company.Company',
+    'user': 'authentication.User',
+}
+
+
+def _group_scopes(scopes: Iterable[str]) -> Dict[str, Dict[int, str]]:
+    grouped = defaultdict(dict)
+    for scope in scopes:
+        kind, pk = scope.split(':', 1)
+        grouped[kind][int(pk)] = scope
+    return grouped
+
+
+def _manager(kind: str):
+    return apps.get_model(SCOPE_MODELS[kind])._base_manager
+
+
+def get_versions(scopes: Iterable[str]) -> Dict[str, int]:
+    """
+    Текущие версии областей данных ('company:1', 'user:5').
+
+    Версия — время последнего изменения в наносекундах, хранится в
+    колонке data_version строки компании или пользователя, поэтому она
+    общая для всех процессов. Один запрос на вид области; для
+    удалённой строки версия 0.
+    """
+    versions = {}
+    for kind, scope_by_pk in _group_scopes(scopes).items():
+        found = dict(_manager(kind).filter(pk__in=list(scope_by_pk))
+                     .values_list('pk', 'data_version'))
+        for pk, scope in scope_by_pk.items():
+            versions[scope] = found.get(pk, 0)
+    return versions
+
+
+def bump_versions(*scopes: Optional[str]) -> None:
+    """
+    Помечает области изменёнными.
+
+    Версии обновляются в текущей транзакции вместе с данными, так что
+    новый ETag становится виден ровно тогда же, когда и изменения.
+    """
+    scopes = [scope for scope in scopes if scope]
+    if not scopes:
+        return
+
+    now = time.time_ns()
+    for kind, scope_by_pk in _group_scopes(scopes).items():
+        _manager(kind).filter(pk__in=list(scope_by_pk)).update(
+            data_version=now)
+
+
+def versioned_etag(scopes_func: Callable) -> Callable:
+    """
+    Декоратор view: ETag и Last-Modified по версиям областей.
+
+    scopes_func(request) возвращает (scopes, extra) или None, если
+    заголовки считать не нужно. extra — всё, что ещё влияет на ответ
+    (фильтры, id пользователя). Заголовки считаются только для GET/HEAD;
+    на совпавший If-None-Match запрос получает 304 до вызова view: только
+    чтение версий, без основных запросов и рендеринга.
+    """
+    def state(request) -> Optional[Tuple[str, datetime]]:
+        if not hasattr(request, '_version_state'):
+            result = None
+            if request.method in ('GET', 'HEAD'):
+                result = scopes_func(request)
+            if result is None:
+                request._version_state = None
+            else:
+                scopes, extra = result
+                versions = get_versions(scopes)
+                digest = hashlib.md5(
+                    repr((sorted(versions.items()), extra)).encode('utf-8')
+                ).hexdigest()
+                modified = max(versions.values(), default=0)
+                request._version_state = (
+                    f'"{digest}"',
+                    datetime.fromtimestamp(modified / 1e9, tz=timezone.utc)
+                    if modified else None,
+                )
+        return request._version_state
+
+    def etag_func(request, *args, **kwargs):
+        current = state(request)
+        return current[0] if current else None
+
+    def last_modified_func(request, *args, **kwargs):
+        current = state(request)
+        return current[1] if current else None
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func,
+                                     last_modified_func=last_modified_func)(
+            view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if state(request) is not None:
+                patch_vary_headers(response, ('Authorization', 'Cookie'))
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
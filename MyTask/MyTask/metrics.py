@@ -0,0 +1,213 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class _ThreadShards:
+    """
+    Значения метрики, разнесённые по потокам.
+
+    Каждый поток пишет только в свой dict, поэтому инкремент не берёт
+    блокировку; блокировка нужна лишь при первом обращении потока и при
+    сборе значений.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[dict] = []
+
+    def cells(self) -> dict:
+        cells = getattr(self._local, 'cells', None)
+        if cells is None:
+            cells = self._local.cells = {}
+            with self._lock:
+                self._shards.append(cells)
+        return cells
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            shards = list(self._shards)
+        return [list(cells.items()) for cells in shards]
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def _labels(self, values: LabelValues, **extra) -> Dict[str, str]:
+        labels = dict(zip(self.labelnames, values))
+        labels.update(extra)
+        return labels
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shards = _ThreadShards()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        cells = self._shards.cells()
+        cells[labels] = cells.get(labels, 0) + amount
+
+    def samples(self):
+        totals = defaultdict(float)
+        for items in self._shards.snapshot():
+            for labels, value in items:
+                totals[labels] += value
+        return [(self.name, self._labels(labels), value)
+                for labels, value in sorted(totals.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        self._shards = _ThreadShards()
+
+    def observe(self, value: float, *labels: str) -> None:
+        cells = self._shards.cells()
+        cell = cells.get(labels)
+        if cell is None:
+            cell = cells[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        cell[0][bisect_left(self.buckets, value)] += 1
+        cell[1] += value
+
+    def samples(self):
+        merged = {}
+        for items in self._shards.snapshot():
+            for labels, (counts, total) in items:
+                target = merged.setdefault(
+                    labels, [[0] * (len(self.buckets) + 1), 0.0])
+                for index, value in enumerate(counts):
+                    target[0][index] += value
+                target[1] += total
+
+        samples = []
+        for labels, (counts, total) in sorted(merged.items()):
+            cumulative = 0
+            for bound, value in zip(self.buckets + (float('inf'),), counts):
+                cumulative += value
+                samples.append((f'{self.name}_bucket',
+                                self._labels(labels, le=_format(bound)),
+                                cumulative))
+            samples.append((f'{self.name}_sum', self._labels(labels), total))
+            samples.append((f'{self.name}_count', self._labels(labels),
+                            cumulative))
+        return samples
+
+
+class Gauge(Metric):
+    """
+    Текущее значение. Если задан callback, значения берутся из него в
+    момент сбора: callback() -> {label_values: value}.
+    """
+    kind = 'gauge'
+
+    def __init__(self, *args, callback: Optional[Callable] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        values = self.callback() if self.callback else dict(self._values)
+        return [(self.name, self._labels(labels), value)
+                for labels, value in sorted(values.items())]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def exposition(self) -> str:
+        """Текстовый формат Prometheus 0.0.4."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} '
+                             f'{_format(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str,
+            labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames,
+                                       buckets=buckets))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (),
+          callback: Optional[Callable] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames,
+                                   callback=callback))
+
+
+CACHE_REQUESTS = counter(
+    'cache_requests_total', 'Обращения к кешам приложения.',
+    ('cache', 'result'))
+
+
+def _format(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"'
+                          for key, value in labels.items()) + '}'
+
+
+def _escape(value) -> str:
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
@@ -0,0 +1,21 @@
+class SyncChainMiddleware:
+    """
+    Держит цепочку middleware в sync-режиме под ASGI.
+
+    Должен стоять последним в MIDDLEWARE. Встроенные middleware Django
+    (MiddlewareMixin) в async-режиме вызывают каждый process_request и
+    process_response через sync_to_async, то есть по два переключения
+    потока на каждый. Если самый внутренний middleware умеет только
+    sync, Django собирает всю цепочку как sync и переходит в поток один
+    раз на запрос. Первым в MIDDLEWARE стоит async-only
+    counter.middleware.AsyncCountMiddleware: переход в поток делает он,
+    а учёт запроса остаётся в event loop.
+    """
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
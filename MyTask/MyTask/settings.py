@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'counter.middleware.AsyncCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -57,7 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'counter.middleware.CountMiddleware',
+    'MyTask.middleware.SyncChainMiddleware',
 ]
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
@@ -150,6 +151,25 @@ CELERY_BROKER_URL = 'amqp://localhost'
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_TASK_IGNORE_RESULT = True
 
+CELERY_BEAT_SCHEDULE = {
+    'resume-deletion-jobs': {
+        'task': 'company.tasks.resume_deletion_jobs',
+        'schedule': 600.0,
+    },
+    'rollup-route-stats': {
+        'task': 'counter.tasks.rollup_route_stats',
+        'schedule': 3600.0,
+    },
+    'enforce-chat-retention': {
+        'task': 'chat.tasks.enforce_chat_retention',
+        'schedule': 3600.0,
+    },
+    'flush-notifications': {
+        'task': 'send_mail.tasks.flush_notifications',
+        'schedule': 60.0,
+    },
+}
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 DEFAULT_FROM_EMAIL = 'yaroslav-kotov-91@mail.ru'
 
@@ -160,8 +180,73 @@ EMAIL_HOST_PASSWORD = "o3sLPzNpqZeVkPdEjgcH"
 EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
 
+# Уведомления о задачах копятся NOTIFICATION_DIGEST_WINDOW секунд и
+# уходят получателю одним письмом (send_mail.notifications). Дайджест,
+# не отправленный NOTIFICATION_MAX_ATTEMPTS раз, удаляется.
+NOTIFICATION_DIGEST_WINDOW = 60
+NOTIFICATION_CLAIM_TIMEOUT = 600
+NOTIFICATION_MAX_ATTEMPTS = 5
+
+# Группы и сообщения общие для всех процессов daphne на хосте
+# (Unix datagram сокеты в socket_dir, см. chat.layers).
 CHANNEL_LAYERS = {
   'default': {
-    'BACKEND': 'channels.layers.InMemoryChannelLayer'
+    'BACKEND': 'chat.layers.LocalSocketChannelLayer',
+    'CONFIG': {
+      'socket_dir': os.environ.get('CHANNEL_SOCKET_DIR'),
+      'capacity': 100,
+      'group_expiry': 86400,
+    },
   }
 }
+
+# Token bucket лимиты (MyTask.ratelimit). RATE_LIMIT_CACHE — алиас кеша
+# для общего хранилища между процессами, None — память процесса.
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_CACHE = None
+RATE_LIMITS = {}
+
+# company: массовые операции, фоновое удаление и кеш членства
+# (company.services.get_membership, общий для view и чата;
+# COMPANY_MEMBERSHIP_CACHE — алиас кеша, общего для процессов).
+COMPANY_BULK_PERSONNEL_LIMIT = 1000
+COMPANY_PURGE_CHUNK_SIZE = 500
+COMPANY_PURGE_STALE_AFTER = 600
+COMPANY_PURGE_MAX_ATTEMPTS = 5
+COMPANY_MEMBERSHIP_CACHE = 'default'
+COMPANY_MEMBERSHIP_CACHE_TIMEOUT = 60
+
+# counter: сброс буфера посещений в БД, хранение статистики маршрутов.
+COUNTER_FLUSH_EVERY = 100
+COUNTER_FLUSH_INTERVAL = 5.0
+COUNTER_FLUSH_MAX_FAILURES = 5
+COUNTER_MINUTE_RETENTION = 24 * 3600
+COUNTER_HOUR_RETENTION = 30 * 24 * 3600
+COUNTER_ROLLUP_CHUNK_SIZE = 1000
+COUNTER_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# chat: пакетная запись сообщений (chat.writer), буфер последних
+# сообщений комнат (chat.history), исходящие очереди подключений
+# (chat.outbound; policy 'drop' или 'disconnect'), непрочитанные
+# сообщения (chat.unread; CHAT_UNREAD_CACHE — алиас кеша, общего для
+# процессов, которые пишут сообщения), срок хранения сообщений
+# (chat.tasks; False — удалять без архива), присутствие в комнатах
+# (chat.presence; интервалы в секундах).
+CHAT_WRITE_BATCH_SIZE = 200
+CHAT_WRITE_INTERVAL = 0.005
+CHAT_WRITE_MAX_PENDING = 5000
+CHAT_HISTORY_ROOM_SIZE = 100
+CHAT_HISTORY_MAX_BYTES = 32 * 1024 * 1024
+CHAT_OUTBOUND_MAX_PENDING = 500
+CHAT_OUTBOUND_MAX_LAG = 10.0
+CHAT_OUTBOUND_BATCH_SIZE = 100
+CHAT_OUTBOUND_POLICY = 'disconnect'
+CHAT_UNREAD_CACHE = 'default'
+CHAT_UNREAD_CACHE_TIMEOUT = 300
+CHAT_READ_FLUSH_INTERVAL = 2.0
+CHAT_RETENTION_CHUNK_SIZE = 1000
+CHAT_RETENTION_MAX_CHUNKS = 50
+CHAT_RETENTION_ARCHIVE = True
+CHAT_PRESENCE_HEARTBEAT = 30
+CHAT_PRESENCE_TIMEOUT = 90
+CHAT_PRESENCE_FLUSH_INTERVAL = 0.05
@@ -17,6 +17,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from counter.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('task.urls')),
@@ -24,4 +26,6 @@ urlpatterns = [
     path('account/', include('account.urls', namespace='account')),
     path('company/', include('company.urls', namespace='company')),
     path('chat/', include('chat.urls', namespace='chat')),
+    path('counter/', include('counter.urls', namespace='counter')),
+    path('metrics', metrics, name='metrics'),
 ]
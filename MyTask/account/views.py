@@ -10,6 +10,8 @@ from django.conf import settings
 from authentication.models import User
 from django.views.decorators.cache import cache_page
 from .forms import UserUpdateForm
+from MyTask.conditional import versioned_etag
+from MyTask.ratelimit import get_token_user_id
 import jwt
 import json
 
@@ -49,8 +51,16 @@ def parse_json_body(request):
         return {}, JsonResponse({'error': 'Invalid JSON'}, status=400)
 
 
+def user_task_scopes(request):
+    user_id = get_token_user_id(request)
+    if user_id is None:
+        return None
+    return [f'user:{user_id}'], (user_id, sorted(request.GET.items()))
+
+
 @csrf_exempt
-@require_http_methods(["POST"])
+@require_http_methods(["GET", "POST"])
+@versioned_etag(user_task_scopes)
 def get_user_task(request):
     payload, error = get_user_payload(request)
     if error:
@@ -61,15 +71,19 @@ def get_user_task(request):
     except User.DoesNotExist:
         return JsonResponse({'error': 'User not found'}, status=404)
 
-    data, error = parse_json_body(request)
-    if error:
-        return error
+    if request.method == 'GET':
+        data = request.GET
+    else:
+        data, error = parse_json_body(request)
+        if error:
+            return error
 
     status_filter = data.get('status', '')
     start_date = data.get('start_date', '')
     end_date = data.get('end_date', '')
 
-    tasks = Task.objects.filter(employee=user)
+    tasks = Task.objects.filter(employee=user).select_related(
+        'employee').prefetch_related('subtasks')
 
     if status_filter:
         tasks = tasks.filter(status=status_filter)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AuthenticationConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "authentication"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .functions import register_functions
+        connection_created.connect(register_functions)
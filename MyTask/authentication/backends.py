@@ -22,8 +22,10 @@ class JWTAuthentication(authentication.BaseAuthentication):
         elif len(auth_header) > 2:
             return None
 
-        prefix = auth_header[0].decode('utf-8')
-        token = auth_header[1].decode('utf-8')
+        # Заголовок приходит в Latin-1; не UTF-8 токен не пройдёт
+        # проверку подписи, а не уронит запрос.
+        prefix = auth_header[0].decode('utf-8', errors='ignore')
+        token = auth_header[1].decode('utf-8', errors='ignore')
 
         if prefix.lower() != auth_header_prefix:
             return None
@@ -0,0 +1,33 @@
+from typing import Optional
+
+from django.db.models import Func
+
+
+def fold(value: Optional[str]) -> Optional[str]:
+    """Приведение строки для сравнения без учёта регистра (Unicode)."""
+    return value.casefold() if value is not None else None
+
+
+class Casefold(Func):
+    """
+    casefold() строки в СУБД.
+
+    LOWER() в SQLite переводит в нижний регистр только ASCII, поэтому
+    для SQLite функция CASEFOLD регистрируется на каждом подключении
+    (register_functions) и вызывает fold() — то же, что делает Python.
+    На остальных СУБД используется их LOWER(), который знает Unicode.
+    """
+    function = 'LOWER'
+    arity = 1
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='CASEFOLD',
+                              **extra_context)
+
+
+def register_functions(sender, connection, **kwargs):
+    """Обработчик connection_created."""
+    if connection.vendor == 'sqlite':
+        # deterministic обязателен: функция стоит в вычисляемых колонках.
+        connection.connection.create_function('CASEFOLD', 1, fold,
+                                              deterministic=True)
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:51
+
+import authentication.functions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_alter_user_username'),
+    ]
+
+    # Колонки вычисляет СУБД, в том числе для уже существующих строк.
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='email_folded',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=authentication.functions.Casefold('email'), output_field=models.CharField(max_length=254)),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='username_folded',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=django.db.models.functions.comparison.Coalesce(authentication.functions.Casefold('username'), models.Value('')), output_field=models.CharField(max_length=255)),
+        ),
+    ]
@@ -2,11 +2,15 @@ from datetime import timedelta
 import jwt
 
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone as dj_timezone
 from django.contrib.auth.models import (AbstractBaseUser, BaseUserManager,
                                         PermissionsMixin)
 
+from .functions import Casefold
+
 
 class UserManager(BaseUserManager):
     def create_user(self, email, username=None, password=None):
@@ -38,6 +42,19 @@ class User(AbstractBaseUser, PermissionsMixin):
     username = models.CharField(max_length=255, unique=True, null=True,
                                 blank=True)
     email = models.EmailField(db_index=True, unique=True)
+    # Вычисляемые колонки СУБД для поиска без учёта регистра по индексу;
+    # остаются верными при update() и bulk_update(). Casefold знает
+    # Unicode и на SQLite (см. authentication.functions).
+    email_folded = models.GeneratedField(
+        expression=Casefold('email'),
+        output_field=models.CharField(max_length=254),
+        db_persist=True, db_index=True)
+    username_folded = models.GeneratedField(
+        expression=Coalesce(Casefold('username'), Value('')),
+        output_field=models.CharField(max_length=255),
+        db_persist=True, db_index=True)
+    # Версия данных пользователя для ETag (MyTask.conditional).
+    data_version = models.BigIntegerField(default=0, editable=False)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
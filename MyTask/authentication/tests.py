@@ -1,3 +1,39 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from MyTask import ratelimit
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        ratelimit._store = None
+
+    def login(self, **extra):
+        return self.client.post(
+            '/api/users/login/',
+            json.dumps({'user': {'email': 'nobody@example.com',
+                                 'password': 'wrong'}}),
+            content_type='application/json', **extra)
+
+    @override_settings(RATE_LIMITS={'login': {'ip': '2/m'}})
+    def test_empty_bucket_returns_429_with_retry_after(self):
+        for _ in range(2):
+            self.assertNotEqual(self.login().status_code, 429)
+
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        # 1 токен при 2/m — 30 секунд без времени, ушедшего на запросы
+        # (проверка пароля).
+        self.assertIn(int(response['Retry-After']), range(25, 31))
+
+    @override_settings(RATE_LIMITS={'login': {'ip': None}})
+    def test_override_disables_default_rate(self):
+        for _ in range(15):
+            self.assertNotEqual(self.login().status_code, 429)
+
+    @override_settings(RATE_LIMITS={'login': {'ip': None, 'user': '1/m'}})
+    def test_undecodable_token_is_not_a_server_error(self):
+        for _ in range(2):
+            response = self.login(HTTP_AUTHORIZATION='Token \xff\xfe')
+            self.assertLess(response.status_code, 500)
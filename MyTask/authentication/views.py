@@ -4,12 +4,15 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import render
 from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from MyTask.ratelimit import rate_limit
 
 from .serializers import (RegistrationSerializer, LoginSerializer,
                           UserSerializer)
 from .renderers import UserJSONRenderer
 
 
+@method_decorator(rate_limit('register', ip_rate='5/m'), name='dispatch')
 class RegisterAPIView(APIView):
     renderer_classes = (UserJSONRenderer,)
     permission_classes = (AllowAny,)
@@ -24,6 +27,7 @@ class RegisterAPIView(APIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+@method_decorator(rate_limit('login', ip_rate='10/m'), name='dispatch')
 class LoginAPIView(APIView):
     permission_classes = (AllowAny,)
     renderer_classes = (UserJSONRenderer,)
@@ -0,0 +1,108 @@
+import zlib
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+import msgpack
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from company.models import Company
+from MyTask.conditional import bump_versions
+from .models import Message, MessageArchive
+
+ARCHIVE_FIELDS = ('id', 'user_id', 'user__username', 'message', 'created_at')
+
+
+def pack_batch(rows: List[tuple]) -> bytes:
+    """[(id, user_id, username, message, created_at), ...] -> zlib(msgpack)"""
+    return zlib.compress(msgpack.packb(
+        [[row[0], row[1], row[2], row[3], row[4].timestamp()]
+         for row in rows], use_bin_type=True), 6)
+
+
+def unpack_batch(data: bytes) -> List[list]:
+    return msgpack.unpackb(zlib.decompress(bytes(data)), raw=False)
+
+
+def archive_chunk(company_id: int, cutoff: datetime, chunk_size: int,
+                  keep_archive: bool = True) -> int:
+    """
+    Переносит в архив (или удаляет) до chunk_size самых старых сообщений
+    компании, созданных раньше cutoff.
+
+    Порция выбирается по индексу (company, created_at) и обрабатывается
+    одной короткой транзакцией: пакеты MessageArchive по комнатам и
+    дням создаются одним bulk_create, строки удаляются одним DELETE.
+    Транзакция начинается с пустого UPDATE строки компании: он берёт
+    блокировку на запись до выборки, поэтому параллельные запуски для
+    одной компании идут по очереди и не архивируют одни и те же строки.
+
+    Returns:
+        int: Число обработанных сообщений; 0 — больше нечего переносить.
+    """
+    with transaction.atomic():
+        if not Company.objects.filter(pk=company_id).update(
+                chat_retention_days=F('chat_retention_days')):
+            return 0
+        rows = list(Message.objects.filter(
+            company_id=company_id, created_at__lt=cutoff
+        ).order_by('created_at', 'id').values_list(
+            'department_id', *ARCHIVE_FIELDS)[:chunk_size])
+        if not rows:
+            return 0
+
+        if keep_archive:
+            batches = defaultdict(list)
+            for department_id, *row in rows:
+                day = timezone.localdate(row[4])
+                batches[(department_id, day)].append(row)
+            MessageArchive.objects.bulk_create([
+                MessageArchive(
+                    company_id=company_id, department_id=department_id,
+                    day=day, first_id=batch[0][0], last_id=batch[-1][0],
+                    count=len(batch), data=pack_batch(batch))
+                for (department_id, day), batch in batches.items()
+            ])
+
+        Message.objects.filter(pk__in=[row[1] for row in rows]).delete()
+        bump_versions(f'company:{company_id}')
+    return len(rows)
+
+
+def iter_archive(company_id: int, department_id: Optional[int],
+                 start: Optional[date] = None, end: Optional[date] = None,
+                 chunk_size: int = 50) -> Iterator[Dict[str, Any]]:
+    """
+    Сообщения комнаты из архива в хронологическом порядке.
+
+    Пакеты читаются с сервера порциями по chunk_size и распаковываются
+    по одному, так что в памяти одновременно держится один пакет.
+
+    Args:
+        start, end (date): Границы по дню включительно.
+    """
+    archives = MessageArchive.objects.filter(
+        company_id=company_id, department_id=department_id)
+    if start is not None:
+        archives = archives.filter(day__gte=start)
+    if end is not None:
+        archives = archives.filter(day__lte=end)
+
+    for data, in archives.order_by('day', 'first_id').values_list(
+            'data').iterator(chunk_size=chunk_size):
+        for message_id, user_id, username, text, created in \
+                unpack_batch(data):
+            yield {
+                'id': message_id,
+                'user_id': user_id,
+                'username': username,
+                'message': text,
+                'created_at': datetime.fromtimestamp(
+                    created, dt_timezone.utc).isoformat(),
+            }
+
+
+def retention_cutoff(days: int) -> datetime:
+    return timezone.now() - timedelta(days=days)
@@ -0,0 +1,104 @@
+import json
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+import msgpack
+
+MSGPACK_SUBPROTOCOL = 'chat.msgpack.v1'
+
+
+class DecodeError(ValueError):
+    pass
+
+
+class JsonCodec:
+    """Текстовые JSON-кадры; используется без подпротокола."""
+    subprotocol = None
+    binary = False
+    frame_key = 'frame'
+
+    def encode(self, payload: Dict[str, Any]) -> str:
+        return json.dumps(payload)
+
+    def history(self, message_type: str, entries: Sequence,
+                has_more: bool) -> str:
+        return '{"type": %s, "messages": [%s], "has_more": %s}' % (
+            json.dumps(message_type),
+            ', '.join(entry.fragment() for entry in entries),
+            json.dumps(has_more))
+
+    def batch(self, frames: Sequence[str]) -> str:
+        return '{"type": "batch", "messages": [%s]}' % ', '.join(frames)
+
+
+class MsgpackCodec:
+    """Бинарные MessagePack-кадры (подпротокол chat.msgpack.v1)."""
+    subprotocol = MSGPACK_SUBPROTOCOL
+    binary = True
+    frame_key = 'packed'
+
+    def encode(self, payload: Dict[str, Any]) -> bytes:
+        return msgpack.packb(payload, use_bin_type=True)
+
+    def history(self, message_type: str, entries: Sequence,
+                has_more: bool) -> bytes:
+        # Элементы уже закодированы; собираем map вокруг них.
+        packer = msgpack.Packer(use_bin_type=True)
+        return b''.join((
+            packer.pack_map_header(3),
+            packer.pack('type'), packer.pack(message_type),
+            packer.pack('messages'), packer.pack_array_header(len(entries)),
+            *(entry.packed() for entry in entries),
+            packer.pack('has_more'), packer.pack(has_more),
+        ))
+
+    def batch(self, frames: Sequence[bytes]) -> bytes:
+        packer = msgpack.Packer(use_bin_type=True)
+        return b''.join((
+            packer.pack_map_header(2),
+            packer.pack('type'), packer.pack('batch'),
+            packer.pack('messages'), packer.pack_array_header(len(frames)),
+            *frames,
+        ))
+
+
+JSON = JsonCodec()
+MSGPACK = MsgpackCodec()
+CODECS = {MSGPACK.subprotocol: MSGPACK}
+
+
+def negotiate(subprotocols: Optional[Iterable[str]]):
+    """
+    Выбирает кодек по подпротоколам из запроса клиента.
+
+    Первый поддерживаемый из предложенных выигрывает; без подходящего
+    подпротокола остаётся JSON.
+    """
+    for subprotocol in subprotocols or ():
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec
+    return JSON
+
+
+def decode(text_data: Optional[str] = None,
+           bytes_data: Optional[bytes] = None) -> Dict[str, Any]:
+    """Разбирает входящий кадр: текст — JSON, бинарный — MessagePack."""
+    try:
+        if bytes_data is not None:
+            data = msgpack.unpackb(bytes_data, raw=False)
+        else:
+            data = json.loads(text_data)
+    except (ValueError, TypeError, msgpack.UnpackException):
+        raise DecodeError('Malformed frame')
+    if not isinstance(data, dict):
+        raise DecodeError('Frame is not an object')
+    return data
+
+
+def encode_frames(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Кадр события группы во всех форматах, чтобы участники отправляли
+    его как есть, не кодируя заново.
+    """
+    return {JSON.frame_key: JSON.encode(payload),
+            MSGPACK.frame_key: MSGPACK.encode(payload)}
@@ -1,9 +1,75 @@
+import asyncio
+from collections import Counter
+from typing import List, Optional
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from company.models import Department, Company
+from channels.layers import get_channel_layer
+from django.conf import settings
+from MyTask import metrics
+from .codecs import DecodeError, decode, encode_frames, negotiate
+from .history import recent_history
 from .models import Message
+from .outbound import outbound_queue
+from .permissions import authorize_room
+from .presence import presence
+from .unread import mark_read
+from .writer import message_writer
 import json
 from asgiref.sync import sync_to_async
 
+HISTORY_PAGE_SIZE = 50
+MAX_MESSAGE_LENGTH = Message._meta.get_field('message').max_length
+SAVED_CHUNK = 32
+
+# Подключения этого процесса по группам; читается при сборе метрик.
+group_connections = Counter()
+
+metrics.gauge('chat_connections', 'Открытые WebSocket-подключения чата.',
+              callback=lambda: {(): sum(group_connections.values())})
+metrics.gauge('chat_group_connections', 'Подключения процесса по группам.',
+              ('group',),
+              callback=lambda: {(group,): count for group, count
+                                in list(group_connections.items())})
+
+
+def room_group(company_id: int, department_id: Optional[int]) -> str:
+    if department_id is None:
+        return f'chat_company_{company_id}'
+    return f'chat_department_{department_id}'
+
+
+async def announce_saved(messages: List[Message]) -> None:
+    """
+    Рассылает id записанных сообщений в группы их комнат: остальные
+    процессы дописывают их в свои буферы истории (ChatConsumer.chat_saved).
+
+    Одно событие на комнату и до SAVED_CHUNK сообщений, чтобы оно
+    поместилось в датаграмму channel layer.
+    """
+    rooms = {}
+    for message in messages:
+        rooms.setdefault((message.company_id, message.department_id),
+                         []).append([message.pk, message.user.username,
+                                     message.message])
+        # Свой буфер обновляется сразу, до того как отправители получат
+        # результат записи (update_read_pointer читает его последний id).
+        recent_history.append(message.company_id, message.department_id,
+                              message.pk, message.user.username,
+                              message.message)
+    layer = get_channel_layer()
+    for (company_id, department_id), entries in rooms.items():
+        for start in range(0, len(entries), SAVED_CHUNK):
+            await layer.group_send(room_group(company_id, department_id), {
+                'type': 'chat_saved',
+                'company_id': company_id,
+                'department_id': department_id,
+                'entries': entries[start:start + SAVED_CHUNK],
+            })
+
+
+message_writer.on_written = announce_saved
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -14,57 +80,50 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.user = self.scope['user']
         self.chat_room_name = self.scope['url_route']['kwargs'][
             'chatroom_name']
-        self.room_group_name = f'chat_{self.chat_room_name}'
-
-        if self.chat_room_name == 'company':
-            try:
-                company = await sync_to_async(Company.objects.get)(
-                    departments__personnel=self.user
-                )
-                self.company = company
-                self.department = None
-            except Company.DoesNotExist:
-                await self.close(code=4003)
-                return
-        elif self.chat_room_name.startswith('department_'):
-            try:
-                dept_id_str = self.chat_room_name.split('department_', 1)[
-                    1]
-                dept_id = int(dept_id_str)
-
-                department = await sync_to_async(
-                    Department.objects.select_related('company').get)(
-                    id=dept_id)
-
-                if not await sync_to_async(department.personnel.filter(
-                        id=self.user.id).exists)():
-                    print(
-                        f"User {self.user} not in department {department.name}")
-                    await self.close(code=4003)
-                    return
-
-                self.department = department
-                self.company = department.company
-
-            except (ValueError, Department.DoesNotExist):
-                print("Department not found or invalid ID:",
-                      self.chat_room_name)
-                await self.close(code=4004)
-                return
-        else:
-            await self.close(code=4004)
+
+        access, close_code = await authorize_room(self.user.id,
+                                                  self.chat_room_name)
+        if access is None:
+            await self.close(code=close_code)
             return
+        self.company_id, self.department_id = access
+        self.room_group_name = room_group(*access)
+        self.codec = negotiate(self.scope.get('subprotocols'))
+        self.outbound = outbound_queue(self.send_now, self.codec.batch,
+                                       self.close)
 
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
-        await self.accept()
+        group_connections[self.room_group_name] += 1
+        self.counted = True
+
+        await self.accept(subprotocol=self.codec.subprotocol)
         print(f"User {self.user.username} connected to {self.chat_room_name}")
         await self.send_chat_history()
+        await self.send_frame(self.codec.encode({
+            'type': 'presence',
+            'users': presence.members(self.room_group_name)
+        }))
+        await presence.connect(self)
 
     async def disconnect(self, close_code):
+        if getattr(self, 'counted', False):
+            self.counted = False
+            group_connections[self.room_group_name] -= 1
+            if group_connections[self.room_group_name] <= 0:
+                del group_connections[self.room_group_name]
+                # Без подключений процесс не получает события комнаты,
+                # и буфер истории перестал бы обновляться.
+                recent_history.discard(self.company_id, self.department_id)
+
+            presence.disconnect(self)
+            await self.outbound.stop()
+            await self.wait_written()
+            await self.flush_read_pointer()
+
         if hasattr(self, 'room_group_name') and self.channel_layer is not None:
             await self.channel_layer.group_discard(
                 self.room_group_name,
@@ -73,59 +132,188 @@ class ChatConsumer(AsyncWebsocketConsumer):
         else:
             print("Warning: channel_layer is None or room_group_name not set")
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
-            message_text = data.get('message', '').strip()
-        except json.JSONDecodeError:
+            data = decode(text_data, bytes_data)
+        except DecodeError:
             return
 
-        if not message_text:
+        # Любой кадр от клиента продлевает его присутствие.
+        presence.touch(self)
+        if data.get('type') == 'heartbeat':
+            return
+        if data.get('type') == 'load_older':
+            await self.send_older_history(data.get('before_id'))
             return
+        if data.get('type') == 'mark_read':
+            await self.update_read_pointer(data.get('last_id'))
+            return
+
+        message_text = str(data.get('message', '')).strip()
 
-        await self.save_message(message_text)
+        # Длина ограничена и моделью, и размером датаграммы channel layer.
+        if not message_text or len(message_text) > MAX_MESSAGE_LENGTH:
+            return
 
+        message = Message(
+            message=message_text,
+            user=self.user,
+            company_id=self.company_id,
+            department_id=self.department_id
+        )
+        self.last_write = await message_writer.put(message)
+
+        # Кадр кодируется один раз в каждом формате и рассылается
+        # участникам как есть, не дожидаясь записи; id сообщения придёт
+        # следом в chat_saved.
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message',
-                'username': self.user.username,
-                'message': message_text
+                **encode_frames({
+                    'username': self.user.username,
+                    'message': message_text
+                })
             }
         )
 
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            'username': event['username'],
-            'message': event['message']
-        }))
+        frame = event.get(self.codec.frame_key)
+        if frame is None:
+            if 'frame' in event:
+                payload = json.loads(event['frame'])
+            else:
+                payload = {'username': event['username'],
+                           'message': event['message']}
+            frame = self.codec.encode(payload)
+        await self.outbound.put(frame)
 
-    @sync_to_async
-    def save_message(self, message_text):
-        Message.objects.create(
-            message=message_text,
-            user=self.user,
-            company=self.company,
-            department=self.department
-        )
+    async def chat_saved(self, event):
+        for entry_id, username, text in event['entries']:
+            recent_history.append(event['company_id'], event['department_id'],
+                                  entry_id, username, text)
+
+    async def presence_diff(self, event):
+        await self.send_presence(presence.apply(event))
+
+    async def presence_sync(self, event):
+        await presence.answer_sync(event)
+
+    async def send_presence(self, diff):
+        """Отправляет клиенту изменение состава комнаты, если оно есть."""
+        if diff:
+            await self.send_frame(diff.frame(self.codec))
+
+    async def wait_written(self):
+        """Ждёт записи в БД последнего сообщения этого подключения."""
+        written = getattr(self, 'last_write', None)
+        if written is not None:
+            await written
+
+    async def send_frame(self, frame):
+        """
+        Ставит кадр в исходящую очередь подключения. В отличие от
+        сообщений, такие кадры не объединяются в batch.
+        """
+        await self.outbound.put(frame, batchable=False)
+
+    async def send_now(self, frame):
+        """Отправляет кадр в формате, согласованном при подключении."""
+        if self.codec.binary:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
 
     @sync_to_async
-    def get_chat_history(self):
+    def get_chat_history(self, before_id=None):
+        """
+        Страница истории комнаты от новых к старым.
+
+        Пагинация keyset по id: запрос идёт диапазоном по индексу
+        (company, department, id), поэтому глубина прокрутки не влияет
+        на стоимость страницы.
+
+        Args:
+            before_id (int): Вернуть сообщения с id меньше этого.
+
+        Returns:
+            tuple: (messages: страница в хронологическом порядке,
+            has_more: есть ли сообщения старше)
+        """
         messages = Message.objects.filter(
-            company=self.company,
-            department=self.department
-        ).select_related('user').order_by('-id')[:50]
+            company_id=self.company_id,
+            department_id=self.department_id
+        )
+        if before_id is not None:
+            messages = messages.filter(id__lt=before_id)
+        page = list(messages.select_related('user').order_by(
+            '-id')[:HISTORY_PAGE_SIZE + 1])
         return [
                    {
+                       'id': msg.id,
                        'username': msg.user.username,
                        'message': msg.message
                    }
-                   for msg in messages
-               ][::-1]
+                   for msg in page[:HISTORY_PAGE_SIZE]
+               ][::-1], len(page) > HISTORY_PAGE_SIZE
 
     async def send_chat_history(self):
-        history = await self.get_chat_history()
-        await self.send(text_data=json.dumps({
-            'type': 'history',
-            'messages': history
+        entries, has_more = await recent_history.page(
+            self.company_id, self.department_id, HISTORY_PAGE_SIZE)
+        await self.send_frame(self.codec.history('history', entries,
+                                                 has_more))
+
+    async def send_older_history(self, before_id):
+        try:
+            before_id = int(before_id)
+        except (TypeError, ValueError):
+            return
+
+        history, has_more = await self.get_chat_history(before_id)
+        await self.send_frame(self.codec.encode({
+            'type': 'older_history',
+            'messages': history,
+            'has_more': has_more
         }))
+
+    async def update_read_pointer(self, last_id=None):
+        """
+        Запоминает прочитанное до last_id (без него — до последнего
+        сообщения комнаты) и сохраняет не чаще раза в
+        CHAT_READ_FLUSH_INTERVAL секунд; остаток пишется при отключении.
+        """
+        if last_id is None:
+            await self.wait_written()
+            entries, _ = await recent_history.page(
+                self.company_id, self.department_id, 1)
+            last_id = entries[-1].id if entries else None
+        try:
+            last_id = int(last_id)
+        except (TypeError, ValueError):
+            return
+
+        if last_id <= getattr(self, 'read_id', 0):
+            return
+        self.read_id = last_id
+        self.read_pending = True
+        if getattr(self, 'read_task', None) is None:
+            self.read_task = asyncio.create_task(self.flush_read_later())
+
+    async def flush_read_later(self):
+        try:
+            await asyncio.sleep(getattr(settings, 'CHAT_READ_FLUSH_INTERVAL',
+                                        2.0))
+        finally:
+            self.read_task = None
+        await self.flush_read_pointer()
+
+    async def flush_read_pointer(self):
+        task = getattr(self, 'read_task', None)
+        if task is not None:
+            task.cancel()
+        if not getattr(self, 'read_pending', False):
+            return
+        self.read_pending = False
+        await database_sync_to_async(mark_read)(
+            self.user.id, self.company_id, self.department_id,
+            self.read_id)
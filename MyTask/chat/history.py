@@ -0,0 +1,211 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import List, Optional, Set, Tuple
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from MyTask import metrics
+from MyTask.metrics import CACHE_REQUESTS
+from .codecs import JSON, MSGPACK
+from .models import Message
+
+# Примерные накладные расходы на запись сверх текста, байт.
+ENTRY_OVERHEAD = 200
+
+RoomKey = Tuple[int, Optional[int]]
+
+
+class HistoryEntry:
+    __slots__ = ('id', 'username', 'text', '_fragment', '_packed', 'size')
+
+    def __init__(self, username: str, text: str, id: int):
+        self.id = id
+        self.username = username
+        self.text = text
+        self._fragment = None
+        self._packed = None
+        self.size = ENTRY_OVERHEAD + len(text.encode('utf-8')) + \
+            len(username.encode('utf-8'))
+
+    def payload(self) -> dict:
+        return {'id': self.id, 'username': self.username,
+                'message': self.text}
+
+    def fragment(self) -> str:
+        """JSON элемента истории; кодируется один раз."""
+        if self._fragment is None:
+            self._fragment = JSON.encode(self.payload())
+        return self._fragment
+
+    def packed(self) -> bytes:
+        """То же в MessagePack."""
+        if self._packed is None:
+            self._packed = MSGPACK.encode(self.payload())
+        return self._packed
+
+
+class RoomHistory:
+    __slots__ = ('entries', 'ids', 'truncated', 'size', 'ready', 'failed',
+                 'pending')
+
+    def __init__(self, capacity: int):
+        self.entries = deque(maxlen=capacity)
+        self.ids: Set[int] = set()
+        self.truncated = False
+        self.size = 0
+        self.ready = asyncio.Event()
+        self.failed = False
+        self.pending: List[HistoryEntry] = []
+
+
+def load_rows(company_id: int, department_id: Optional[int], limit: int):
+    return list(Message.objects.filter(
+        company_id=company_id, department_id=department_id
+    ).order_by('-id').values_list('id', 'user__username', 'message')[:limit])
+
+
+class HistoryCache:
+    """
+    Последние сообщения комнат в памяти процесса.
+
+    Буфер комнаты заполняется из БД при первом обращении одним запросом,
+    дальше в него дописываются записанные сообщения: свои после записи
+    пакета, других процессов — из событий chat_saved (см.
+    chat.consumers.announce_saved), так что подключение к активной
+    комнате обходится без БД. В буфере только сообщения с id из БД;
+    элементы упорядочены по id, а повторы (одно событие получают все
+    consumer'ы комнаты) отбрасываются. Буфер верен, пока у процесса есть
+    подключения к комнате: с последним из них он сбрасывается.
+    Каждая комната хранит не больше room_size сообщений; при превышении
+    max_bytes по всем комнатам вытесняются давно не читанные (LRU).
+
+    Все методы вызываются из event loop процесса.
+    """
+
+    def __init__(self, room_size: int = 100, max_bytes: int = 32 << 20):
+        self.room_size = room_size
+        self.max_bytes = max_bytes
+        self._rooms: 'OrderedDict[RoomKey, RoomHistory]' = OrderedDict()
+        self._bytes = 0
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    async def page(self, company_id: int, department_id: Optional[int],
+                   limit: int) -> Tuple[List[HistoryEntry], bool]:
+        """
+        Последние limit сообщений комнаты.
+
+        Returns:
+            tuple: (entries: элементы в хронологическом порядке,
+            has_more: есть ли сообщения старше)
+        """
+        key = (company_id, department_id)
+        room = self._rooms.get(key)
+        if room is None:
+            CACHE_REQUESTS.inc('chat_history', 'miss')
+            room = await self._load(key)
+        else:
+            CACHE_REQUESTS.inc('chat_history', 'hit')
+            self._rooms.move_to_end(key)
+            if not room.ready.is_set():
+                await room.ready.wait()
+            if room.failed:
+                return await self.page(company_id, department_id, limit)
+
+        entries = list(room.entries)[-limit:] if limit else []
+        has_more = room.truncated or len(room.entries) > len(entries)
+        return entries, has_more
+
+    def append(self, company_id: int, department_id: Optional[int],
+               entry_id: int, username: str, text: str) -> None:
+        """Дописывает записанное в БД сообщение, если комната в памяти."""
+        room = self._rooms.get((company_id, department_id))
+        if room is None or entry_id in room.ids:
+            return
+        entry = HistoryEntry(username, text, id=entry_id)
+        if not room.ready.is_set():
+            room.pending.append(entry)
+            return
+        self._push(room, entry)
+        self._evict()
+
+    def discard(self, company_id: int, department_id: Optional[int]) -> None:
+        """Забывает буфер комнаты; он перечитается при обращении."""
+        room = self._rooms.get((company_id, department_id))
+        if room is not None and room.ready.is_set():
+            self._drop((company_id, department_id))
+
+    def clear(self) -> None:
+        self._rooms.clear()
+        self._bytes = 0
+
+    async def _load(self, key: RoomKey) -> RoomHistory:
+        room = RoomHistory(self.room_size)
+        self._rooms[key] = room
+        try:
+            rows = await database_sync_to_async(load_rows)(
+                *key, self.room_size + 1)
+        except BaseException:
+            room.failed = True
+            if self._rooms.get(key) is room:
+                del self._rooms[key]
+            room.ready.set()
+            raise
+
+        room.truncated = len(rows) > self.room_size
+        for entry_id, username, text in reversed(rows[:self.room_size]):
+            self._push(room, HistoryEntry(username, text, id=entry_id))
+
+        # Пришедшее во время загрузки могло уже попасть в выборку.
+        for entry in room.pending:
+            if entry.id not in room.ids:
+                self._push(room, entry)
+        room.pending = []
+        room.ready.set()
+        self._evict()
+        return room
+
+    def _push(self, room: RoomHistory, entry: HistoryEntry) -> None:
+        entries = room.entries
+        position = len(entries)
+        # Сообщения разных процессов могут прийти не по порядку id.
+        while position and entries[position - 1].id > entry.id:
+            position -= 1
+        if len(entries) == entries.maxlen:
+            if position == 0:
+                # Старше всего буфера: такое сообщение уже за его краем.
+                room.truncated = True
+                return
+            dropped = entries.popleft()
+            room.ids.discard(dropped.id)
+            room.size -= dropped.size
+            self._bytes -= dropped.size
+            room.truncated = True
+            position -= 1
+        entries.insert(position, entry)
+        room.ids.add(entry.id)
+        room.size += entry.size
+        self._bytes += entry.size
+
+    def _drop(self, key: RoomKey) -> None:
+        room = self._rooms.pop(key)
+        self._bytes -= room.size
+
+    def _evict(self) -> None:
+        for key in list(self._rooms):
+            if self._bytes <= self.max_bytes:
+                break
+            if self._rooms[key].ready.is_set():
+                self._drop(key)
+
+
+recent_history = HistoryCache(
+    room_size=getattr(settings, 'CHAT_HISTORY_ROOM_SIZE', 100),
+    max_bytes=getattr(settings, 'CHAT_HISTORY_MAX_BYTES', 32 << 20),
+)
+
+metrics.gauge('chat_history_bytes', 'Оценка памяти буферов истории чата.',
+              callback=lambda: {(): recent_history.bytes})
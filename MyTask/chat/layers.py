@@ -0,0 +1,286 @@
+import asyncio
+import atexit
+import logging
+import os
+import random
+import socket
+import stat
+import string
+import tempfile
+import time
+from typing import Dict, Optional
+
+import msgpack
+from channels.layers import InMemoryChannelLayer
+from django.core.exceptions import ImproperlyConfigured
+
+from MyTask import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_DATAGRAM = 256 * 1024
+
+
+class MessageTooLarge(ValueError):
+    """Сообщение не помещается в одну датаграмму (MAX_DATAGRAM)."""
+
+
+PEER_SENDS = metrics.counter(
+    'channel_layer_peer_sends_total', 'Датаграммы другим процессам.',
+    ('result',))
+
+
+class LocalSocketChannelLayer(InMemoryChannelLayer):
+    """
+    Channel layer для нескольких процессов на одном хосте без Redis.
+
+    Каждый процесс держит свои каналы и группы в памяти (как
+    InMemoryChannelLayer) и слушает Unix datagram сокет
+    socket_dir/<tag>.sock. Имя канала содержит tag процесса, поэтому
+    send() в чужой канал уходит одной датаграммой в сокет владельца.
+    group_send доставляет сообщение локальным участникам группы и
+    рассылает его всем соседним сокетам; каждый процесс доставляет его
+    своим участникам.
+
+    В отличие от InMemoryChannelLayer, очистка просроченных сообщений и
+    членства выполняется не чаще раза в clean_interval секунд (она
+    проходит по всем каналам и группам), а group_send кладёт в очереди
+    участников поверхностные копии события без отдельной задачи и
+    deepcopy на каждого.
+
+    Истечение членства в группах (group_expiry) и ёмкость каналов
+    (capacity, channel_capacity) работают как в InMemoryChannelLayer, в
+    пределах процесса. Если очередь получателя или буфер сокета соседа
+    переполнены, сообщение отбрасывается. Сокеты завершившихся процессов
+    удаляются при первой неудачной отправке. Сообщение больше
+    MAX_DATAGRAM отклоняется в send/group_send исключением
+    MessageTooLarge, до доставки кому-либо.
+
+    Каталог сокетов должен принадлежать пользователю процесса и быть
+    закрыт для остальных (0700): любой, кто может создавать в нём
+    файлы, читает и подделывает события. По умолчанию это
+    <tmp>/mytask-channels-<uid>; он создаётся с правами 0700, а чужой
+    или открытый каталог не используется (ImproperlyConfigured).
+    """
+
+    def __init__(self, socket_dir: Optional[str] = None,
+                 peer_refresh: float = 1.0, clean_interval: float = 1.0,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.clean_interval = clean_interval
+        self._cleaned_at = 0.0
+        self.socket_dir = socket_dir or os.path.join(
+            tempfile.gettempdir(), f'mytask-channels-{os.getuid()}')
+        self.peer_refresh = peer_refresh
+        self.tag = 'p%d%s' % (os.getpid(), ''.join(
+            random.choice(string.ascii_lowercase) for _ in range(4)))
+        self.path = os.path.join(self.socket_dir, f'{self.tag}.sock')
+        self._sock: Optional[socket.socket] = None
+        self._bound = False
+        self._reader_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._peers: Dict[str, str] = {}
+        self._peers_at = 0.0
+        atexit.register(self._unlink)
+
+    # Сокет процесса
+
+    def _socket(self) -> socket.socket:
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.setblocking(False)
+            # Буфер по умолчанию (около 208 КБ) меньше MAX_DATAGRAM.
+            for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+                try:
+                    self._sock.setsockopt(socket.SOL_SOCKET, option,
+                                          4 * MAX_DATAGRAM)
+                except OSError:
+                    pass
+        return self._sock
+
+    def _prepare_dir(self) -> None:
+        os.makedirs(self.socket_dir, mode=0o700, exist_ok=True)
+        info = os.lstat(self.socket_dir)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() \
+                or info.st_mode & 0o077:
+            raise ImproperlyConfigured(
+                f'Channel socket dir {self.socket_dir} must be a directory '
+                f'owned by uid {os.getuid()} with mode 0700')
+
+    def _listen(self) -> None:
+        """Привязывает сокет и подписывается на него в текущем event loop."""
+        sock = self._socket()
+        if not self._bound:
+            self._prepare_dir()
+            self._unlink()
+            sock.bind(self.path)
+            self._bound = True
+
+        loop = asyncio.get_running_loop()
+        if self._reader_loop is not loop:
+            if self._reader_loop is not None and \
+                    not self._reader_loop.is_closed():
+                self._reader_loop.remove_reader(sock.fileno())
+            loop.add_reader(sock.fileno(), self._on_readable)
+            self._reader_loop = loop
+
+    def _unlink(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                data = self._sock.recv(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.error(f"Channel layer socket read failed: {e}")
+                return
+
+            try:
+                packet = msgpack.unpackb(data, raw=False)
+            except Exception:
+                continue
+            message = packet['m']
+            if 'g' in packet:
+                for channel in list(self.groups.get(packet['g'], ())):
+                    self._put_local(channel, dict(message))
+            else:
+                self._put_local(packet['c'], message)
+
+    def _queue(self, channel: str) -> asyncio.Queue:
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(
+                maxsize=self.get_capacity(channel))
+        return queue
+
+    def _put_local(self, channel: str, message: dict) -> None:
+        queue = self._queue(channel)
+        try:
+            queue.put_nowait((time.time() + self.expiry, message))
+        except asyncio.QueueFull:
+            pass
+
+    # Соседние процессы
+
+    def _peer_paths(self) -> Dict[str, str]:
+        now = time.monotonic()
+        if now - self._peers_at >= self.peer_refresh:
+            peers = {}
+            try:
+                with os.scandir(self.socket_dir) as entries:
+                    for entry in entries:
+                        tag, ext = os.path.splitext(entry.name)
+                        if ext == '.sock' and tag != self.tag:
+                            peers[tag] = entry.path
+            except FileNotFoundError:
+                pass
+            self._peers = peers
+            self._peers_at = now
+        return self._peers
+
+    def _send_to_peer(self, tag: str, path: str, payload: bytes) -> bool:
+        try:
+            self._socket().sendto(payload, path)
+        except (BlockingIOError, InterruptedError):
+            PEER_SENDS.inc('full')
+            return False
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Процесс завершился, не убрав сокет.
+            self._peers.pop(tag, None)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            PEER_SENDS.inc('gone')
+            return False
+        except OSError as e:
+            logger.error(f"Channel layer send to {tag} failed: {e}")
+            PEER_SENDS.inc('error')
+            return False
+        PEER_SENDS.inc('ok')
+        return True
+
+    def _clean_expired(self) -> None:
+        now = time.monotonic()
+        if now - self._cleaned_at >= self.clean_interval:
+            self._cleaned_at = now
+            super()._clean_expired()
+
+    @staticmethod
+    def _channel_tag(channel: str) -> Optional[str]:
+        if '!' not in channel:
+            return None
+        return channel[:channel.index('!')].rsplit('.', 1)[-1]
+
+    # Channel layer API
+
+    async def new_channel(self, prefix='specific.'):
+        self._listen()
+        return '%s.%s!%s' % (prefix, self.tag, ''.join(
+            random.choice(string.ascii_letters) for _ in range(12)))
+
+    @staticmethod
+    def _pack(packet: dict) -> bytes:
+        payload = msgpack.packb(packet, use_bin_type=True)
+        if len(payload) > MAX_DATAGRAM:
+            PEER_SENDS.inc('too_large')
+            raise MessageTooLarge(
+                f'Channel message of {len(payload)} bytes exceeds '
+                f'{MAX_DATAGRAM}')
+        return payload
+
+    async def send(self, channel, message):
+        tag = self._channel_tag(channel)
+        if tag is None or tag == self.tag:
+            return await super().send(channel, message)
+
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        path = os.path.join(self.socket_dir, f'{tag}.sock')
+        self._send_to_peer(tag, path, self._pack({'c': channel,
+                                                  'm': message}))
+
+    async def receive(self, channel):
+        self._listen()
+        self.require_valid_channel_name(channel)
+        self._clean_expired()
+
+        queue = self._queue(channel)
+        try:
+            _, message = await queue.get()
+        finally:
+            if queue.empty():
+                self.channels.pop(channel, None)
+        return message
+
+    async def group_add(self, group, channel):
+        self._listen()
+        await super().group_add(group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+
+        payload = self._pack({'g': group, 'm': message})
+        for tag, path in list(self._peer_paths().items()):
+            self._send_to_peer(tag, path, payload)
+
+        self._clean_expired()
+        for channel in list(self.groups.get(group, ())):
+            self._put_local(channel, dict(message))
+
+    async def close(self):
+        if self._sock is not None:
+            if self._reader_loop is not None and \
+                    not self._reader_loop.is_closed():
+                self._reader_loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            self._reader_loop = None
+        if self._bound:
+            self._bound = False
+            self._unlink()
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+        ('company', '0004_soft_delete_and_deletion_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['company', 'department', 'id'], name='chat_message_room_id'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# External content: FTS5 хранит только индекс, текст читается из
+# chat_message по rowid. Триггеры держат индекс в согласии с таблицей,
+# в том числе для bulk_create и пакетного удаления.
+CREATE_SEARCH_INDEX = [
+    """
+    CREATE VIRTUAL TABLE chat_message_fts USING fts5(
+        message,
+        content='chat_message',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message
+    BEGIN
+        INSERT INTO chat_message_fts(rowid, message)
+        VALUES (new.id, new.message);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message
+    BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, message)
+        VALUES ('delete', old.id, old.message);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF message
+    ON chat_message
+    BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, message)
+        VALUES ('delete', old.id, old.message);
+        INSERT INTO chat_message_fts(rowid, message)
+        VALUES (new.id, new.message);
+    END
+    """,
+    "INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')",
+]
+
+DROP_SEARCH_INDEX = [
+    'DROP TRIGGER IF EXISTS chat_message_fts_update',
+    'DROP TRIGGER IF EXISTS chat_message_fts_delete',
+    'DROP TRIGGER IF EXISTS chat_message_fts_insert',
+    'DROP TABLE IF EXISTS chat_message_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 есть только в SQLite; на других СУБД поиск идёт без индекса
+    # (см. chat.search).
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SEARCH_INDEX:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SEARCH_INDEX:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_room_read_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
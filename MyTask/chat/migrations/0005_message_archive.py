@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:37
+
+import chat.search_sql
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_search'),
+        ('company', '0005_chat_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # AddField пересоздаёт chat_message в SQLite, и триггеры FTS5
+        # теряются; при откате то же делает RemoveField.
+        migrations.RunPython(migrations.RunPython.noop,
+                             chat.search_sql.create_search_triggers),
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('first_id', models.BigIntegerField()),
+                ('last_id', models.BigIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+            ],
+        ),
+        # Более точного времени у старых сообщений нет: все они получают
+        # время миграции, и срок хранения отсчитывается от него.
+        migrations.AddField(
+            model_name='message',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['company', 'created_at'], name='chat_message_company_created'),
+        ),
+        migrations.AddField(
+            model_name='messagearchive',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='company.company'),
+        ),
+        migrations.AddField(
+            model_name='messagearchive',
+            name='department',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='company.department'),
+        ),
+        migrations.AddIndex(
+            model_name='messagearchive',
+            index=models.Index(fields=['company', 'department', 'day', 'first_id'], name='chat_archive_room_day'),
+        ),
+        migrations.RunPython(chat.search_sql.create_search_triggers,
+                             migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from authentication.models import User
 from company.models import Company, Department
 
@@ -10,3 +11,59 @@ class Message(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
     department = models.ForeignKey(Department, on_delete=models.CASCADE,
                                    null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'department', 'id'],
+                         name='chat_message_room_id'),
+            models.Index(fields=['company', 'created_at'],
+                         name='chat_message_company_created'),
+        ]
+
+
+class RoomReadState(models.Model):
+    """Последнее прочитанное пользователем сообщение комнаты."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='chat_read_states')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    department = models.ForeignKey(Department, on_delete=models.CASCADE,
+                                   null=True)
+    last_read_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULL в unique не совпадают, поэтому общий чат компании
+            # ограничивается отдельным условным индексом.
+            models.UniqueConstraint(
+                fields=['user', 'company'],
+                condition=models.Q(department__isnull=True),
+                name='chat_read_state_company_room'),
+            models.UniqueConstraint(
+                fields=['user', 'department'],
+                condition=models.Q(department__isnull=False),
+                name='chat_read_state_department_room'),
+        ]
+
+
+class MessageArchive(models.Model):
+    """
+    Сообщения комнаты за день, вынесенные из chat_message по сроку
+    хранения компании. data — zlib-сжатый msgpack-список
+    [id, user_id, username, message, created_at (unix time)]; за один
+    день у комнаты может быть несколько пакетов.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    department = models.ForeignKey(Department, on_delete=models.CASCADE,
+                                   null=True)
+    day = models.DateField()
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'department', 'day', 'first_id'],
+                         name='chat_archive_room_day'),
+        ]
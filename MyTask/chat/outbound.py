@@ -0,0 +1,167 @@
+import asyncio
+import time
+import weakref
+from collections import deque
+from typing import Awaitable, Callable, Deque, Tuple, Union
+
+from django.conf import settings
+
+from MyTask import metrics
+
+Frame = Union[str, bytes]
+
+DROPPED = metrics.counter(
+    'chat_outbound_dropped_total',
+    'Кадры чата, отброшенные из-за отставания клиента.', ('reason',))
+DISCONNECTS = metrics.counter(
+    'chat_outbound_disconnects_total',
+    'Клиенты чата, отключённые из-за отставания.', ('reason',))
+BATCH_SIZE = metrics.histogram(
+    'chat_outbound_batch_size', 'Сообщений в одном исходящем кадре.',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250))
+
+# Очереди открытых подключений процесса; читаются при сборе метрик.
+_queues = weakref.WeakSet()
+
+
+def _depths():
+    depths = [len(queue) for queue in list(_queues)]
+    return {('total',): sum(depths), ('max',): max(depths, default=0)}
+
+
+metrics.gauge('chat_outbound_queue_depth',
+              'Кадры в исходящих очередях подключений чата.', ('stat',),
+              callback=_depths)
+
+DROP = 'drop'
+DISCONNECT = 'disconnect'
+
+
+class OutboundQueue:
+    """
+    Исходящая очередь одного WebSocket-подключения.
+
+    chat_message только кладёт кадр в очередь и сразу возвращается, так
+    что канал consumer'а в channel layer разбирается с той скоростью, с
+    которой приходят события, а не с той, с которой клиент их читает.
+    Отдельная задача отправляет кадры по одному; сообщения, накопившиеся
+    за время отправки, уходят одним кадром batch (не больше batch_size).
+
+    Клиент считается отставшим, если в очереди больше max_pending кадров
+    или самый старый ждёт дольше max_lag секунд. При policy='drop'
+    старейшие сообщения отбрасываются, при policy='disconnect'
+    соединение закрывается с кодом 4008 и очередь очищается.
+    """
+
+    def __init__(self, send: Callable[[Frame], Awaitable],
+                 batch: Callable[[list], Frame],
+                 close: Callable[[int], Awaitable],
+                 max_pending: int = 500, max_lag: float = 10.0,
+                 batch_size: int = 100, policy: str = DISCONNECT):
+        self._send = send
+        self._batch = batch
+        self._close = close
+        self.max_pending = max_pending
+        self.max_lag = max_lag
+        self.batch_size = batch_size
+        self.policy = policy
+        # (время постановки, кадр, можно ли объединять в batch)
+        self._items: Deque[Tuple[float, Frame, bool]] = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.closed = False
+        _queues.add(self)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def put(self, frame: Frame, batchable: bool = True) -> bool:
+        """
+        Ставит кадр в очередь.
+
+        Returns:
+            bool: False, если кадр не принят (очередь закрыта или клиент
+            отключён за отставание).
+        """
+        if self.closed:
+            return False
+
+        reason = self._lagging()
+        if reason is not None:
+            if self.policy == DISCONNECT:
+                await self._disconnect(reason)
+                return False
+            self._drop(reason)
+
+        self._items.append((time.monotonic(), frame, batchable))
+        self._wakeup.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return True
+
+    async def stop(self) -> None:
+        """Останавливает отправку; неотправленные кадры отбрасываются."""
+        self.closed = True
+        self._items.clear()
+        _queues.discard(self)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _lagging(self):
+        if len(self._items) >= self.max_pending:
+            return 'overflow'
+        if self._items and \
+                time.monotonic() - self._items[0][0] > self.max_lag:
+            return 'lag'
+        return None
+
+    def _drop(self, reason: str) -> None:
+        deadline = time.monotonic() - self.max_lag
+        dropped = 0
+        while self._items and (len(self._items) >= self.max_pending or
+                               self._items[0][0] < deadline):
+            self._items.popleft()
+            dropped += 1
+        DROPPED.inc(reason, amount=dropped)
+
+    async def _disconnect(self, reason: str) -> None:
+        DISCONNECTS.inc(reason)
+        DROPPED.inc(reason, amount=len(self._items))
+        await self.stop()
+        await self._close(4008)
+
+    def _next_frame(self) -> Frame:
+        _, frame, batchable = self._items.popleft()
+        if not batchable:
+            return frame
+
+        frames = [frame]
+        while self._items and self._items[0][2] and \
+                len(frames) < self.batch_size:
+            frames.append(self._items.popleft()[1])
+        BATCH_SIZE.observe(len(frames))
+        return frames[0] if len(frames) == 1 else self._batch(frames)
+
+    async def _run(self) -> None:
+        while not self.closed:
+            if not self._items:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._send(self._next_frame())
+
+
+def outbound_queue(send, batch, close) -> OutboundQueue:
+    """Очередь с параметрами из настроек CHAT_OUTBOUND_*."""
+    return OutboundQueue(
+        send, batch, close,
+        max_pending=getattr(settings, 'CHAT_OUTBOUND_MAX_PENDING', 500),
+        max_lag=getattr(settings, 'CHAT_OUTBOUND_MAX_LAG', 10.0),
+        batch_size=getattr(settings, 'CHAT_OUTBOUND_BATCH_SIZE', 100),
+        policy=getattr(settings, 'CHAT_OUTBOUND_POLICY', DISCONNECT),
+    )
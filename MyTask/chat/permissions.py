@@ -0,0 +1,61 @@
+from typing import NamedTuple, Optional, Tuple
+
+from channels.db import database_sync_to_async
+
+from company.services import Membership, get_membership
+
+
+class RoomAccess(NamedTuple):
+    company_id: int
+    department_id: Optional[int]
+
+
+def parse_room(room_name: str) -> Optional[Tuple[str, Optional[int]]]:
+    """
+    Разбирает имя комнаты из URL.
+
+    Returns:
+        tuple or None: ('company', None), ('department', id) или None
+        для неизвестного формата.
+    """
+    if room_name == 'company':
+        return 'company', None
+    if room_name.startswith('department_'):
+        try:
+            return 'department', int(room_name.split('department_', 1)[1])
+        except ValueError:
+            return None
+    return None
+
+
+def room_access(membership: Optional[Membership], kind: str,
+                department_id: Optional[int]) -> Optional[RoomAccess]:
+    if membership is None or membership.company_id is None:
+        return None
+    if kind == 'company':
+        return RoomAccess(membership.company_id, None)
+    if department_id in membership.department_ids:
+        return RoomAccess(membership.company_id, department_id)
+    return None
+
+
+async def authorize_room(user_id: int, room_name: str):
+    """
+    Проверяет доступ пользователя к комнате чата.
+
+    Членство берётся через get_membership — из того же кеша, что и у
+    view компании, при промахе одним запросом.
+
+    Returns:
+        tuple: (access: RoomAccess или None, close_code: код закрытия
+        сокета при отказе)
+    """
+    room = parse_room(room_name)
+    if room is None:
+        return None, 4004
+
+    membership = await database_sync_to_async(get_membership)(user_id)
+    access = room_access(membership, *room)
+    if access is None:
+        return None, 4003
+    return access, None
@@ -0,0 +1,302 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+
+from MyTask import metrics
+
+# Отметка процесса в событиях присутствия: по ней видно, какой процесс
+# держит пользователя и что событие пришло из другого процесса.
+ORIGIN = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+PRESENCE_EVENTS = metrics.counter(
+    'chat_presence_events_total', 'События присутствия в чате.', ('kind',))
+
+
+class PresenceDiff:
+    """Изменение состава комнаты; кадр кодируется один раз на кодек."""
+    __slots__ = ('joined', 'left', '_frames')
+
+    def __init__(self, joined: List[Tuple[int, str]], left: List[int]):
+        self.joined = joined
+        self.left = left
+        self._frames = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.joined or self.left)
+
+    def frame(self, codec):
+        frame = self._frames.get(codec.frame_key)
+        if frame is None:
+            frame = self._frames[codec.frame_key] = codec.encode({
+                'type': 'presence_diff',
+                'joined': [{'id': user_id, 'username': username}
+                           for user_id, username in self.joined],
+                'left': self.left,
+            })
+        return frame
+
+
+EMPTY = PresenceDiff([], [])
+
+
+class PresenceTracker:
+    """
+    Кто в сети в комнатах чата.
+
+    Процесс считает свои подключения по пользователям (несколько вкладок —
+    одна запись со счётчиком) и публикует в группу комнаты только
+    изменения: пользователь появился или пропал. Изменения за
+    flush_interval секунд объединяются в одно событие presence_diff;
+    вход и выход в пределах окна взаимно сокращаются. Поэтому стоимость
+    присутствия растёт с числом изменений, а не с размером комнаты.
+
+    Каждое событие применяется к состоянию процесса один раз, кто бы из
+    локальных consumer'ов его ни получил. Пользователь виден, пока его
+    держит хотя бы один процесс; клиенту отправляются только переходы
+    "не виден -> виден" и обратно.
+
+    Подключение, от которого timeout секунд не было ни одного кадра,
+    закрывается с кодом 4009. Раз в heartbeat секунд процесс отправляет
+    в комнаты со своими пользователями пустое событие; пользователи
+    процесса, молчащего дольше timeout, считаются ушедшими. Первое
+    подключение процесса к комнате запрашивает у остальных процессов
+    их состав (presence_sync).
+
+    Все методы вызываются из event loop процесса.
+    """
+
+    def __init__(self, heartbeat: float = 30.0,
+                 timeout: Optional[float] = 90.0,
+                 flush_interval: float = 0.05):
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+        self.flush_interval = flush_interval
+        self._loop = None
+        self._layer = None
+        self._reset()
+
+    def _reset(self) -> None:
+        # Локальные подключения: группа -> consumer -> время последнего кадра
+        self._consumers: Dict[str, Dict[object, float]] = {}
+        # Локальные пользователи: группа -> user_id -> [подключений, имя]
+        self._local: Dict[str, Dict[int, list]] = {}
+        # Видимые пользователи: группа -> user_id -> (имя, процессы)
+        self._online: Dict[str, Dict[int, Tuple[str, Set[str]]]] = {}
+        # Когда процесс в последний раз давал о себе знать
+        self._heard: Dict[str, float] = {}
+        self._pending: Dict[str, Tuple[Dict[int, str], Set[int]]] = {}
+        self._applied: 'OrderedDict[Tuple[str, int], PresenceDiff]' = \
+            OrderedDict()
+        self._seq = 0
+        self._flush_task = None
+        self._sweep_task = None
+
+    # Локальные подключения
+
+    async def connect(self, consumer) -> None:
+        self._ensure_loop(consumer)
+        group = consumer.room_group_name
+        consumers = self._consumers.setdefault(group, {})
+        if not consumers:
+            self._online.pop(group, None)
+            await self._publish(group, {'type': 'presence_sync'})
+        consumers[consumer] = time.monotonic()
+
+        users = self._local.setdefault(group, {})
+        entry = users.get(consumer.user.id)
+        if entry is not None:
+            entry[0] += 1
+            return
+        users[consumer.user.id] = [1, consumer.user.username]
+        self._queue(group, joined=(consumer.user.id, consumer.user.username))
+
+    def disconnect(self, consumer) -> None:
+        group = consumer.room_group_name
+        consumers = self._consumers.get(group)
+        if not consumers or consumers.pop(consumer, None) is None:
+            return
+        if not consumers:
+            # Событий группы процесс больше не получает.
+            del self._consumers[group]
+            self._online.pop(group, None)
+
+        users = self._local[group]
+        entry = users[consumer.user.id]
+        entry[0] -= 1
+        if entry[0] == 0:
+            del users[consumer.user.id]
+            if not users:
+                del self._local[group]
+            self._queue(group, left=consumer.user.id)
+
+    def touch(self, consumer) -> None:
+        consumers = self._consumers.get(consumer.room_group_name)
+        if consumers is not None and consumer in consumers:
+            consumers[consumer] = time.monotonic()
+
+    def members(self, group: str) -> List[Dict[str, object]]:
+        return [{'id': user_id, 'username': username}
+                for user_id, (username, _) in self._online.get(
+                    group, {}).items()]
+
+    # События группы
+
+    def apply(self, event: dict) -> PresenceDiff:
+        """Применяет presence_diff (один раз на процесс)."""
+        key = (event['origin'], event['seq'])
+        diff = self._applied.get(key)
+        if diff is not None:
+            return diff
+
+        origin, group = event['origin'], event['group']
+        self._heard[origin] = time.monotonic()
+        diff = EMPTY
+        if group in self._consumers:
+            online = self._online.setdefault(group, {})
+            joined, left = [], []
+            for user_id, username in event['joined']:
+                entry = online.get(user_id)
+                if entry is None:
+                    online[user_id] = (username, {origin})
+                    joined.append((user_id, username))
+                else:
+                    entry[1].add(origin)
+            for user_id in event['left']:
+                entry = online.get(user_id)
+                if entry is not None and origin in entry[1]:
+                    entry[1].discard(origin)
+                    if not entry[1]:
+                        del online[user_id]
+                        left.append(user_id)
+            if joined or left:
+                diff = PresenceDiff(joined, left)
+        self._remember(key, diff)
+        return diff
+
+    async def answer_sync(self, event: dict) -> None:
+        """Отвечает на presence_sync составом своих пользователей."""
+        key = (event['origin'], event['seq'])
+        if event['origin'] == ORIGIN or key in self._applied:
+            return
+        self._remember(key, EMPTY)
+        users = self._local.get(event['group'])
+        if users:
+            await self._publish(event['group'], {
+                'type': 'presence_diff',
+                'joined': [[user_id, entry[1]]
+                           for user_id, entry in users.items()],
+                'left': [],
+            })
+
+    # Внутреннее
+
+    def _ensure_loop(self, consumer) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Состояние и задачи привязаны к циклу (тесты, async_to_sync).
+            self._reset()
+            self._loop = loop
+        self._layer = consumer.channel_layer
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = loop.create_task(self._sweep())
+
+    def _remember(self, key, diff: PresenceDiff) -> None:
+        self._applied[key] = diff
+        while len(self._applied) > 4096:
+            self._applied.popitem(last=False)
+
+    def _queue(self, group: str, joined=None, left=None) -> None:
+        pending_joined, pending_left = self._pending.setdefault(
+            group, ({}, set()))
+        if joined is not None:
+            user_id, username = joined
+            if user_id in pending_left:
+                pending_left.discard(user_id)
+            else:
+                pending_joined[user_id] = username
+        if left is not None:
+            if left in pending_joined:
+                del pending_joined[left]
+            else:
+                pending_left.add(left)
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(
+                self._flush_later())
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(self.flush_interval)
+        finally:
+            self._flush_task = None
+        pending, self._pending = self._pending, {}
+        for group, (joined, left) in pending.items():
+            if joined or left:
+                await self._publish(group, {
+                    'type': 'presence_diff',
+                    'joined': [[user_id, username]
+                               for user_id, username in joined.items()],
+                    'left': list(left),
+                })
+
+    async def _publish(self, group: str, event: dict) -> None:
+        self._seq += 1
+        PRESENCE_EVENTS.inc(event['type'])
+        await self._layer.group_send(group, {
+            **event, 'origin': ORIGIN, 'seq': self._seq, 'group': group})
+
+    async def _sweep(self) -> None:
+        while self._consumers:
+            await asyncio.sleep(self.heartbeat)
+            now = time.monotonic()
+            for group in list(self._local):
+                await self._publish(group, {'type': 'presence_diff',
+                                            'joined': [], 'left': []})
+            if self.timeout is None:
+                continue
+
+            for group, consumers in list(self._consumers.items()):
+                for consumer, seen in list(consumers.items()):
+                    if now - seen > self.timeout:
+                        # Клиент может не ответить на закрытие, поэтому
+                        # из присутствия он убирается сразу.
+                        PRESENCE_EVENTS.inc('expired')
+                        self.disconnect(consumer)
+                        await consumer.close(code=4009)
+
+            silent = {origin for origin, heard in self._heard.items()
+                      if origin != ORIGIN and now - heard > self.timeout}
+            for origin in silent:
+                del self._heard[origin]
+            if silent:
+                await self._forget(silent)
+
+    async def _forget(self, origins: Set[str]) -> None:
+        """Убирает пользователей завершившихся процессов."""
+        for group, online in list(self._online.items()):
+            left = []
+            for user_id, (_, holders) in list(online.items()):
+                if holders & origins:
+                    holders -= origins
+                    if not holders:
+                        del online[user_id]
+                        left.append(user_id)
+            if left:
+                diff = PresenceDiff([], left)
+                for consumer in list(self._consumers.get(group, ())):
+                    await consumer.send_presence(diff)
+
+
+presence = PresenceTracker(
+    heartbeat=getattr(settings, 'CHAT_PRESENCE_HEARTBEAT', 30.0),
+    timeout=getattr(settings, 'CHAT_PRESENCE_TIMEOUT', 90.0),
+    flush_interval=getattr(settings, 'CHAT_PRESENCE_FLUSH_INTERVAL', 0.05),
+)
+
+metrics.gauge('chat_presence_users', 'Пользователи в сети по данным процесса.',
+              callback=lambda: {(): sum(len(online) for online
+                                        in list(presence._online.values()))})
@@ -0,0 +1,153 @@
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.db import connection
+from django.db.models import Q
+
+from authentication.models import User
+from .models import Message
+
+SEARCH_TABLE = 'chat_message_fts'
+
+# Границы совпадения в snippet; клиент экранирует текст и подсвечивает
+# фрагменты между ними.
+HIGHLIGHT = ('\x02', '\x03')
+SNIPPET_TOKENS = 16
+
+Cursor = Tuple[float, int]
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+_index_found = False
+
+
+def has_search_index() -> bool:
+    """Есть ли FTS5-индекс (создаётся миграцией chat 0004 на SQLite)."""
+    global _index_found
+    if not _index_found:
+        with connection.cursor() as cursor:
+            _index_found = SEARCH_TABLE in \
+                connection.introspection.table_names(cursor)
+    return _index_found
+
+
+def build_match(query: str) -> Optional[str]:
+    """
+    Превращает пользовательский ввод в выражение FTS5 MATCH.
+
+    Каждое слово берётся в кавычки, поэтому операторы и спецсимволы FTS5
+    из ввода не интерпретируются; слова объединяются через AND, последнее
+    ищется как префикс (поиск по мере ввода).
+    """
+    terms = _TERM.findall(query)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def _room_filter(department_ids: Sequence[Optional[int]],
+                 column: str) -> Tuple[str, List[Any]]:
+    conditions, params = [], []
+    if None in department_ids:
+        conditions.append(f'{column} IS NULL')
+    departments = [d for d in department_ids if d is not None]
+    if departments:
+        conditions.append(f'{column} IN (%s)' % ', '.join(
+            ['%s'] * len(departments)))
+        params.extend(departments)
+    return '(%s)' % ' OR '.join(conditions), params
+
+
+def search_messages(company_id: int, department_ids: Sequence[Optional[int]],
+                    query: str, after: Optional[Cursor] = None,
+                    limit: int = 20) -> Tuple[List[Dict[str, Any]],
+                                              Optional[Cursor]]:
+    """
+    Полнотекстовый поиск по сообщениям комнат компании.
+
+    Совпадения ранжируются bm25 (лучшие первыми, при равенстве — новые),
+    для каждого возвращается фрагмент текста вокруг найденных слов.
+    Пагинация keyset по (rank, id). CROSS JOIN фиксирует порядок: сначала
+    совпадения из индекса, затем их строки по первичному ключу; иначе
+    планировщик SQLite перебирает все сообщения компании и для каждого
+    проверяет MATCH. Без FTS5-индекса (не SQLite) поиск идёт подстрокой
+    по тексту, от новых к старым.
+
+    Args:
+        company_id (int): Компания пользователя.
+        department_ids (list): Доступные комнаты; None — общий чат.
+        query (str): Поисковая строка.
+        after (tuple): Курсор (rank, id) последнего результата.
+        limit (int): Размер страницы.
+
+    Returns:
+        tuple: (hits: страница результатов, next_cursor: курсор или None)
+    """
+    match = build_match(query)
+    if match is None or not department_ids:
+        return [], None
+    if not has_search_index():
+        return _search_without_index(company_id, department_ids, query,
+                                     after, limit)
+
+    rooms, params = _room_filter(department_ids, 'm.department_id')
+    keyset = ''
+    if after is not None:
+        keyset = (f'AND (bm25({SEARCH_TABLE}) > %s OR '
+                  f'(bm25({SEARCH_TABLE}) = %s AND m.id < %s))')
+        params.extend([after[0], after[0], after[1]])
+
+    sql = f"""
+        SELECT m.id, m.department_id, u.username,
+               snippet({SEARCH_TABLE}, 0, %s, %s, '…', %s),
+               bm25({SEARCH_TABLE}) AS rank
+        FROM {SEARCH_TABLE}
+        CROSS JOIN chat_message m ON m.id = {SEARCH_TABLE}.rowid
+        JOIN {User._meta.db_table} u
+            ON u.id = m.user_id
+        WHERE {SEARCH_TABLE} MATCH %s AND m.company_id = %s AND {rooms}
+        {keyset}
+        ORDER BY rank, m.id DESC
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*HIGHLIGHT, SNIPPET_TOKENS, match, company_id,
+                             *params, limit + 1])
+        rows = cursor.fetchall()
+
+    hits = [{
+        'id': message_id,
+        'room_name': _room_name(department_id),
+        'username': username,
+        'snippet': snippet,
+    } for message_id, department_id, username, snippet, _ in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = (rows[limit - 1][4], rows[limit - 1][0])
+    return hits, next_cursor
+
+
+def _search_without_index(company_id, department_ids, query, after, limit):
+    rooms = Q(department_id__in=[d for d in department_ids if d is not None])
+    if None in department_ids:
+        rooms |= Q(department__isnull=True)
+    messages = Message.objects.filter(
+        rooms, company_id=company_id, message__icontains=query.strip())
+    if after is not None:
+        messages = messages.filter(id__lt=after[1])
+    rows = list(messages.order_by('-id').values_list(
+        'id', 'department_id', 'user__username', 'message')[:limit + 1])
+
+    hits = [{
+        'id': message_id,
+        'room_name': _room_name(department_id),
+        'username': username,
+        'snippet': text,
+    } for message_id, department_id, username, text in rows[:limit]]
+    next_cursor = (0.0, rows[limit - 1][0]) if len(rows) > limit else None
+    return hits, next_cursor
+
+
+def _room_name(department_id: Optional[int]) -> str:
+    return 'company' if department_id is None else \
+        f'department_{department_id}'
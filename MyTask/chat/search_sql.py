@@ -0,0 +1,44 @@
+# Триггеры FTS5-индекса chat_message_fts (создаётся миграцией chat 0004).
+# SQLite удаляет триггеры вместе с таблицей, поэтому миграции, которые
+# пересоздают chat_message (AddField, RemoveField), ставят их заново
+# через create_search_triggers.
+
+SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message
+    BEGIN
+        INSERT INTO chat_message_fts(rowid, message)
+        VALUES (new.id, new.message);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message
+    BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, message)
+        VALUES ('delete', old.id, old.message);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF message
+    ON chat_message
+    BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, message)
+        VALUES ('delete', old.id, old.message);
+        INSERT INTO chat_message_fts(rowid, message)
+        VALUES (new.id, new.message);
+    END
+    """,
+]
+
+DROP_SEARCH_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS chat_message_fts_update',
+    'DROP TRIGGER IF EXISTS chat_message_fts_delete',
+    'DROP TRIGGER IF EXISTS chat_message_fts_insert',
+]
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SEARCH_TRIGGERS + SEARCH_TRIGGERS:
+        schema_editor.execute(statement)
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from MyTask.conditional import bump_versions
+from .models import Message
+from .unread import bump_rooms
+
+
+@receiver(post_save, sender=Message)
+def message_created(sender, instance, created, **kwargs):
+    if created:
+        bump_versions(f'company:{instance.company_id}')
+        bump_rooms([instance])
+
@@ -0,0 +1,53 @@
+from celery import shared_task
+from django.conf import settings
+
+from company.models import Company
+from .archive import archive_chunk, retention_cutoff
+
+
+@shared_task
+def enforce_chat_retention() -> int:
+    """
+    Ставит в очередь очистку чата для компаний со сроком хранения.
+
+    Returns:
+        int: Количество компаний, для которых запущена очистка.
+    """
+    company_ids = list(Company.objects.filter(
+        chat_retention_days__isnull=False).values_list('id', flat=True))
+    for company_id in company_ids:
+        archive_company_chat.delay(company_id)
+    return len(company_ids)
+
+
+@shared_task
+def archive_company_chat(company_id: int) -> int:
+    """
+    Переносит сообщения компании старше chat_retention_days в
+    MessageArchive (или удаляет при CHAT_RETENTION_ARCHIVE = False).
+
+    Работает порциями по CHAT_RETENTION_CHUNK_SIZE, каждая — отдельная
+    транзакция. После CHAT_RETENTION_MAX_CHUNKS порций задача ставит
+    себя в очередь заново, чтобы не занимать воркер надолго.
+
+    Returns:
+        int: Количество обработанных сообщений.
+    """
+    days = Company.objects.filter(pk=company_id).values_list(
+        'chat_retention_days', flat=True).first()
+    if days is None:
+        return 0
+
+    cutoff = retention_cutoff(days)
+    chunk_size = getattr(settings, 'CHAT_RETENTION_CHUNK_SIZE', 1000)
+    keep_archive = getattr(settings, 'CHAT_RETENTION_ARCHIVE', True)
+
+    processed = 0
+    for _ in range(getattr(settings, 'CHAT_RETENTION_MAX_CHUNKS', 50)):
+        moved = archive_chunk(company_id, cutoff, chunk_size, keep_archive)
+        processed += moved
+        if moved < chunk_size:
+            return processed
+
+    archive_company_chat.delay(company_id)
+    return processed
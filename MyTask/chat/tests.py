@@ -1,3 +1,475 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+import asyncio
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from authentication.models import User
+from company.models import Company, Department
+from company.services import invalidate_memberships, membership_cache
+from . import routing
+from .archive import archive_chunk, iter_archive
+from .history import HistoryCache, recent_history
+from .layers import MAX_DATAGRAM, LocalSocketChannelLayer, MessageTooLarge
+from .middleware import JWTAuthMiddlewareStack
+from .models import Message, MessageArchive
+from .outbound import DISCONNECT, DROP, OutboundQueue
+from .permissions import authorize_room
+from .presence import PresenceTracker
+from .unread import get_cache, mark_read, unread_counts
+from .writer import message_writer, write_messages
+
+
+class RoomAuthorizationTests(TestCase):
+    def setUp(self):
+        membership_cache().clear()
+        self.owner = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        self.member = User.objects.create_user(
+            email='member@example.com', username='member', password='pw')
+        company = Company.objects.create(name='Acme', owner=self.owner)
+        self.department = Department.objects.create(name='Dev',
+                                                    company=company)
+        self.department.personnel.add(self.member)
+        self.room = f'department_{self.department.id}'
+
+    def authorize(self):
+        return async_to_sync(authorize_room)(self.member.id, self.room)
+
+    def test_uses_membership_cache_until_invalidated(self):
+        self.assertIsNotNone(self.authorize()[0])
+        # Так выглядит удаление, сделанное другим процессом.
+        Department.personnel.through.objects.filter(
+            department=self.department, user=self.member).delete()
+
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(self.authorize()[0])
+
+        invalidate_memberships([self.member.id])
+        self.assertEqual(self.authorize(), (None, 4003))
+
+
+class HistoryCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        self.company = Company.objects.create(name='Acme', owner=self.user)
+        self.messages = [Message.objects.create(
+            message=f'm{i}', user=self.user, company=self.company)
+            for i in range(3)]
+
+    def page(self, history, limit=10):
+        return async_to_sync(history.page)(self.company.id, None, limit)
+
+    def test_events_are_appended_in_id_order_once(self):
+        history = HistoryCache(room_size=10)
+        self.page(history)
+        last = self.messages[-1].id
+
+        # Событие другого процесса приходит каждому consumer'у комнаты,
+        # сообщения разных процессов — не по порядку id.
+        for entry_id in (last + 2, last + 2, last + 1):
+            history.append(self.company.id, None, entry_id, 'other',
+                           f'r{entry_id}')
+
+        entries, has_more = self.page(history)
+        self.assertEqual([entry.id for entry in entries],
+                         [m.id for m in self.messages] + [last + 1, last + 2])
+        self.assertFalse(has_more)
+
+    def test_full_room_drops_oldest(self):
+        history = HistoryCache(room_size=3)
+        self.page(history)
+        first, last = self.messages[0].id, self.messages[-1].id
+
+        history.append(self.company.id, None, first - 1, 'other', 'old')
+        history.append(self.company.id, None, last + 1, 'other', 'new')
+
+        entries, has_more = self.page(history)
+        self.assertEqual([entry.id for entry in entries],
+                         [m.id for m in self.messages[1:]] + [last + 1])
+        self.assertTrue(has_more)
+
+    def test_unloaded_room_is_not_created(self):
+        history = HistoryCache(room_size=10)
+        history.append(self.company.id, None, 999, 'other', 'x')
+
+        with self.assertNumQueries(1):
+            entries, _ = self.page(history)
+        self.assertEqual([entry.id for entry in entries],
+                         [m.id for m in self.messages])
+
+
+class UnreadCountTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        self.reader = User.objects.create_user(
+            email='reader@example.com', username='reader', password='pw')
+        self.company = Company.objects.create(name='Acme', owner=self.owner)
+        self.department = Department.objects.create(name='Dev',
+                                                    company=self.company)
+        get_cache().clear()
+
+    def write(self, count, department=None, user=None):
+        messages = [Message(message=f'm{i}', user=user or self.owner,
+                            company=self.company, department=department)
+                    for i in range(count)]
+        write_messages(messages)
+        return messages
+
+    def counts(self):
+        return unread_counts(self.reader.id, self.company.id,
+                             [None, self.department.id])
+
+    def test_counts_follow_writes_and_read_pointer(self):
+        self.write(2)
+        self.assertEqual(self.counts(), {None: 2, self.department.id: 0})
+
+        # Снимок досчитывается по счётчикам комнат без запросов к БД;
+        # свои сообщения в приросте учитываются.
+        messages = self.write(3, department=self.department)
+        self.write(1, user=self.reader)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts(),
+                             {None: 3, self.department.id: 3})
+
+        mark_read(self.reader.id, self.company.id, self.department.id,
+                  messages[1].id)
+        self.assertEqual(self.counts(), {None: 2, self.department.id: 1})
+
+    def test_read_pointer_only_moves_forward(self):
+        messages = self.write(3)
+        mark_read(self.reader.id, self.company.id, None, messages[2].id)
+        mark_read(self.reader.id, self.company.id, None, messages[0].id)
+        self.assertEqual(self.counts()[None], 0)
+
+
+class SearchViewTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        company = Company.objects.create(name='Acme', owner=self.owner)
+        Department.objects.create(name='Dev', company=company
+                                  ).personnel.add(self.owner)
+        Message.objects.create(message='hello world', user=self.owner,
+                               company=company)
+
+    def post(self, body):
+        return self.client.post(
+            '/chat/api/search/', body, content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {self.owner.token}')
+
+    def test_finds_message(self):
+        response = self.post(json.dumps({'query': 'hello'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_malformed_body_is_rejected(self):
+        for body in ('[]', '"hello"', b'\xff\xfe{', '{'):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+
+
+class ArchiveChunkTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        self.company = Company.objects.create(name='Acme', owner=self.owner,
+                                              chat_retention_days=30)
+        old = timezone.now() - timedelta(days=40)
+        self.old = [Message.objects.create(
+            message=f'm{i}', user=self.owner, company=self.company,
+            created_at=old) for i in range(3)]
+        self.recent = Message.objects.create(
+            message='new', user=self.owner, company=self.company)
+        self.cutoff = timezone.now() - timedelta(days=30)
+
+    def test_locks_company_before_selecting(self):
+        with CaptureQueriesContext(connection) as queries:
+            moved = archive_chunk(self.company.id, self.cutoff, 10)
+
+        self.assertEqual(moved, 3)
+        statements = [query['sql'].split()[0] for query in queries
+                      if not query['sql'].startswith(('SAVEPOINT',
+                                                      'RELEASE'))]
+        self.assertEqual(statements[:2], ['UPDATE', 'SELECT'])
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)),
+                         [self.recent.id])
+        self.assertEqual(
+            [row['id'] for row in iter_archive(self.company.id, None)],
+            [message.id for message in self.old])
+
+    def test_second_run_finds_nothing(self):
+        archive_chunk(self.company.id, self.cutoff, 10)
+        self.assertEqual(archive_chunk(self.company.id, self.cutoff, 10), 0)
+        self.assertEqual(MessageArchive.objects.count(), 1)
+
+    def test_deleted_company_is_skipped(self):
+        Company.objects.filter(pk=self.company.id).update(
+            deleted_at=timezone.now())
+        self.assertEqual(archive_chunk(self.company.id, self.cutoff, 10), 0)
+        self.assertEqual(Message.objects.count(), 4)
+
+
+class ChatSocketTests(TransactionTestCase):
+    app = JWTAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns))
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        company = Company.objects.create(name='Acme', owner=self.user)
+        self.department = Department.objects.create(name='Dev',
+                                                    company=company)
+        self.department.personnel.add(self.user)
+        recent_history.clear()
+
+    def communicator(self):
+        return WebsocketCommunicator(
+            self.app, f'/ws/chat/department_{self.department.id}/',
+            headers=[(b'authorization', f'Token {self.user.token}'.encode())])
+
+    def test_broadcast_does_not_wait_for_write(self):
+        async def scenario():
+            socket = self.communicator()
+            connected, _ = await socket.connect()
+            self.assertTrue(connected)
+            for _ in range(2):  # история и состав комнаты
+                await socket.receive_from()
+
+            with mock.patch.object(message_writer, 'interval', 0.5):
+                await socket.send_to(text_data=json.dumps({'message': 'hi'}))
+                frame = json.loads(await socket.receive_from(timeout=0.3))
+                self.assertEqual(frame['message'], 'hi')
+                self.assertFalse(await database_sync_to_async(
+                    Message.objects.exists)())
+
+                await asyncio.sleep(0.6)
+            entries, _ = await recent_history.page(
+                self.department.company_id, self.department.id, 10)
+            saved = await database_sync_to_async(Message.objects.get)()
+            self.assertEqual([entry.id for entry in entries], [saved.id])
+            await socket.disconnect()
+
+        async_to_sync(scenario)()
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def queue(self, **options):
+        """Очередь, чей клиент не читает, пока не установлен self.release."""
+        self.sent, self.closed = [], []
+        self.release = asyncio.Event()
+
+        async def send(frame):
+            await self.release.wait()
+            self.sent.append(frame)
+
+        async def close(code):
+            self.closed.append(code)
+
+        return OutboundQueue(send, list, close, **options)
+
+    def test_drop_policy_discards_oldest_frames(self):
+        async def scenario():
+            queue = self.queue(max_pending=3, policy=DROP)
+            await queue.put('f1')
+            await asyncio.sleep(0)  # f1 уже отправляется
+            for frame in ('f2', 'f3', 'f4', 'f5'):
+                self.assertTrue(await queue.put(frame))
+            await queue.put('presence', batchable=False)
+
+            self.release.set()
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.sent,
+                             ['f1', ['f4', 'f5'], 'presence'])
+            self.assertEqual(self.closed, [])
+            await queue.stop()
+
+        async_to_sync(scenario)()
+
+    def test_disconnect_policy_closes_lagging_client(self):
+        async def scenario():
+            queue = self.queue(max_pending=2, max_lag=0.05,
+                               policy=DISCONNECT)
+            await queue.put('f1')
+            await asyncio.sleep(0)
+            await queue.put('f2')
+            await asyncio.sleep(0.1)  # f2 ждёт дольше max_lag
+
+            self.assertFalse(await queue.put('f3'))
+            self.assertEqual(self.closed, [4008])
+            self.assertEqual(len(queue), 0)
+            self.assertFalse(await queue.put('f4'))
+
+        async_to_sync(scenario)()
+
+
+class FakeLayer:
+    def __init__(self):
+        self.events = []
+
+    async def group_send(self, group, event):
+        self.events.append(event)
+
+
+class FakeConsumer:
+    def __init__(self, layer, user_id, username, group='chat_company_1'):
+        self.channel_layer = layer
+        self.room_group_name = group
+        self.user = SimpleNamespace(id=user_id, username=username)
+        self.close_codes = []
+        self.diffs = []
+
+    async def close(self, code=None):
+        self.close_codes.append(code)
+
+    async def send_presence(self, diff):
+        self.diffs.append(diff)
+
+
+class PresenceTrackerTests(SimpleTestCase):
+    def setUp(self):
+        self.layer = FakeLayer()
+
+    def consumer(self, user_id, username):
+        return FakeConsumer(self.layer, user_id, username)
+
+    def published(self, kind='presence_diff'):
+        events = [event for event in self.layer.events
+                  if event['type'] == kind]
+        self.layer.events.clear()
+        return events
+
+    def test_diffs_carry_only_transitions(self):
+        async def scenario():
+            tracker = PresenceTracker(heartbeat=60, timeout=None,
+                                      flush_interval=0.01)
+            ann, ann_tab = self.consumer(1, 'ann'), self.consumer(1, 'ann')
+            bob = self.consumer(2, 'bob')
+            for consumer in (ann, ann_tab, bob):
+                await tracker.connect(consumer)
+            await asyncio.sleep(0.03)
+
+            event, = self.published()
+            self.assertEqual(event['joined'], [[1, 'ann'], [2, 'bob']])
+            diff = tracker.apply(event)
+            self.assertEqual(diff.joined, [(1, 'ann'), (2, 'bob')])
+            # Другой consumer процесса получает то же событие.
+            self.assertIs(tracker.apply(event), diff)
+
+            # Вторая вкладка и вход с выходом в одном окне не видны.
+            tracker.disconnect(ann_tab)
+            carl = self.consumer(3, 'carl')
+            await tracker.connect(carl)
+            tracker.disconnect(carl)
+            tracker.disconnect(bob)
+            await asyncio.sleep(0.03)
+
+            event, = self.published()
+            self.assertEqual((event['joined'], event['left']), ([], [2]))
+            self.assertEqual(tracker.apply(event).left, [2])
+            self.assertEqual(tracker.members('chat_company_1'),
+                             [{'id': 1, 'username': 'ann'}])
+            tracker.disconnect(ann)
+            tracker._sweep_task.cancel()
+
+        async_to_sync(scenario)()
+
+    def test_silent_connections_and_processes_expire(self):
+        async def scenario():
+            tracker = PresenceTracker(heartbeat=0.02, timeout=0.1,
+                                      flush_interval=0.01)
+            quiet, active = self.consumer(1, 'ann'), self.consumer(2, 'bob')
+            await tracker.connect(quiet)
+            await tracker.connect(active)
+            tracker.apply({'type': 'presence_diff', 'origin': 'remote',
+                           'seq': 1, 'group': 'chat_company_1',
+                           'joined': [[9, 'zed']], 'left': []})
+
+            for _ in range(10):
+                tracker.touch(active)
+                await asyncio.sleep(0.02)
+
+            self.assertEqual(quiet.close_codes, [4009])
+            self.assertEqual(active.close_codes, [])
+            self.assertEqual([diff.left for diff in active.diffs], [[9]])
+            # Пока процесс держит пользователей, он шлёт пустые события.
+            self.assertTrue(self.published())
+            tracker.disconnect(active)
+            tracker._sweep_task.cancel()
+
+        async_to_sync(scenario)()
+
+
+class LocalSocketChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.socket_dir = directory.name
+
+    def layers(self, count=2):
+        return [LocalSocketChannelLayer(socket_dir=self.socket_dir)
+                for _ in range(count)]
+
+    def test_group_send_reaches_other_instance(self):
+        async def scenario():
+            sender, receiver = self.layers()
+            local = await sender.new_channel()
+            remote = await receiver.new_channel()
+            await sender.group_add('room', local)
+            await receiver.group_add('room', remote)
+
+            await sender.group_send('room', {'type': 'chat.message',
+                                             'text': 'hi'})
+            for layer, channel in ((sender, local), (receiver, remote)):
+                message = await asyncio.wait_for(layer.receive(channel), 2)
+                self.assertEqual(message['text'], 'hi')
+
+            await receiver.send(local, {'type': 'direct'})
+            message = await asyncio.wait_for(sender.receive(local), 2)
+            self.assertEqual(message['type'], 'direct')
+            await sender.close()
+            await receiver.close()
+
+        async_to_sync(scenario)()
+
+    def test_too_large_message_is_not_delivered(self):
+        async def scenario():
+            sender, receiver = self.layers()
+            local = await sender.new_channel()
+            remote = await receiver.new_channel()
+            await sender.group_add('room', local)
+            await receiver.group_add('room', remote)
+
+            with self.assertRaises(MessageTooLarge):
+                await sender.group_send('room', {'type': 'chat.message',
+                                                 'text': 'x' * MAX_DATAGRAM})
+            with self.assertRaises(MessageTooLarge):
+                await sender.send(remote, {'type': 'chat.message',
+                                           'text': 'x' * MAX_DATAGRAM})
+            await asyncio.sleep(0.05)
+            self.assertNotIn(local, sender.channels)
+            self.assertNotIn(remote, receiver.channels)
+            await sender.close()
+            await receiver.close()
+
+        async_to_sync(scenario)()
+
+    def test_socket_dir_open_to_others_is_refused(self):
+        os.chmod(self.socket_dir, 0o777)
+        layer, = self.layers(1)
+        with self.assertRaises(ImproperlyConfigured):
+            async_to_sync(layer.new_channel)()
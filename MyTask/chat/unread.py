@@ -0,0 +1,149 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q
+
+from MyTask.metrics import CACHE_REQUESTS
+from .models import Message, RoomReadState
+
+ROOM_SEQ_KEY = 'chat:room_seq:{}:{}'
+UNREAD_CACHE_KEY = 'chat:unread:{}:{}'
+
+Room = Optional[int]
+
+
+def get_cache():
+    return caches[getattr(settings, 'CHAT_UNREAD_CACHE', 'default')]
+
+
+def room_seq_key(company_id: int, department_id: Room) -> str:
+    return ROOM_SEQ_KEY.format(company_id, department_id or 0)
+
+
+def bump_rooms(messages: Iterable[Message]) -> None:
+    """
+    Увеличивает счётчики сообщений комнат в кеше.
+
+    Счётчик комнаты растёт на число новых сообщений; из его прироста с
+    момента подсчёта получаются непрочитанные без запроса к БД. Если
+    счётчика в кеше нет, прибавлять не к чему: снимки по этой комнате
+    пересчитаются из БД.
+    """
+    cache = get_cache()
+    for (company_id, department_id), count in Counter(
+            (message.company_id, message.department_id)
+            for message in messages).items():
+        try:
+            cache.incr(room_seq_key(company_id, department_id), count)
+        except ValueError:
+            pass
+
+
+def _room_seqs(company_id: int,
+               department_ids: List[Room]) -> Dict[Room, int]:
+    cache = get_cache()
+    keys = {room_seq_key(company_id, department_id): department_id
+            for department_id in department_ids}
+    for key in set(keys) - set(cache.get_many(list(keys))):
+        cache.add(key, 0, None)
+    return {keys[key]: value for key, value in
+            cache.get_many(list(keys)).items()}
+
+
+def load_unread(user_id: int, company_id: int,
+                department_ids: List[Room]) -> Dict[Room, int]:
+    """
+    Непрочитанные сообщения комнат пользователя из БД.
+
+    Указатели прочтения читаются одним запросом, счётчики — одним
+    агрегатом с GROUP BY по комнате: для каждой комнаты условие
+    id > last_read_id идёт диапазоном по индексу (company, department,
+    id), так что стоимость пропорциональна числу непрочитанных, а не
+    размеру истории. Свои сообщения не считаются.
+    """
+    read = dict(RoomReadState.objects.filter(
+        user_id=user_id, company_id=company_id
+    ).values_list('department_id', 'last_read_id'))
+
+    # company_id в каждой ветке OR: иначе SQLite использует индекс
+    # только по компании и читает все её сообщения.
+    rooms = Q()
+    for department_id in department_ids:
+        rooms |= Q(company_id=company_id, department_id=department_id,
+                   id__gt=read.get(department_id, 0))
+
+    counts = dict(Message.objects.filter(rooms).exclude(
+        user_id=user_id
+    ).order_by().values('department_id').annotate(
+        unread=Count('id')
+    ).values_list('department_id', 'unread'))
+    return {department_id: counts.get(department_id, 0)
+            for department_id in department_ids}
+
+
+def unread_counts(user_id: int, company_id: int,
+                  department_ids: Iterable[Room]) -> Dict[Room, int]:
+    """
+    Непрочитанные сообщения по комнатам компании (None — общий чат).
+
+    Снимок (счётчик комнаты, непрочитанные) хранится в кеше
+    CHAT_UNREAD_CACHE; пока он есть, ответ — снимок плюс прирост
+    счётчиков комнат, один get_many к кешу. Без снимка или при
+    сброшенном счётчике выполняется load_unread. В приросте учитываются
+    и свои сообщения: клиент отмечает их прочитанными (mark_read),
+    получив от сервера.
+
+    Returns:
+        dict: {department_id: число непрочитанных}
+    """
+    department_ids = list(department_ids)
+    if not department_ids:
+        return {}
+    cache = get_cache()
+    seqs = _room_seqs(company_id, department_ids)
+
+    key = UNREAD_CACHE_KEY.format(user_id, company_id)
+    snapshot = cache.get(key) or {}
+    counts = {}
+    for department_id in department_ids:
+        entry = snapshot.get(department_id)
+        seq = seqs.get(department_id)
+        if entry is None or seq is None or seq < entry[0]:
+            break
+        counts[department_id] = entry[1] + seq - entry[0]
+    else:
+        CACHE_REQUESTS.inc('chat_unread', 'hit')
+        return counts
+
+    CACHE_REQUESTS.inc('chat_unread', 'miss')
+    # Счётчики взяты до запроса: сообщение, пришедшее между ними,
+    # посчитается дважды, но не потеряется.
+    counts = load_unread(user_id, company_id, department_ids)
+    cache.set(key, {department_id: (seqs[department_id], count)
+                    for department_id, count in counts.items()
+                    if department_id in seqs},
+              getattr(settings, 'CHAT_UNREAD_CACHE_TIMEOUT', 300))
+    return counts
+
+
+def mark_read(user_id: int, company_id: int, department_id: Room,
+              last_read_id: int) -> None:
+    """
+    Сдвигает указатель прочтения комнаты вперёд.
+
+    Указатель только растёт: устаревший mark_read ничего не меняет.
+    Снимок пользователя в кеше удаляется и пересчитается при следующем
+    запросе.
+    """
+    updated = RoomReadState.objects.filter(
+        user_id=user_id, company_id=company_id, department_id=department_id,
+        last_read_id__lt=last_read_id
+    ).update(last_read_id=last_read_id)
+    if not updated:
+        RoomReadState.objects.bulk_create([RoomReadState(
+            user_id=user_id, company_id=company_id,
+            department_id=department_id, last_read_id=last_read_id,
+        )], ignore_conflicts=True)
+    get_cache().delete(UNREAD_CACHE_KEY.format(user_id, company_id))
@@ -4,4 +4,6 @@ from . import views
 app_name = 'chat'
 urlpatterns = [
     path('', views.chat_view, name='chat'),
+    path('api/search/', views.search_chat, name='search'),
+    path('api/archive/', views.chat_archive, name='archive'),
 ]
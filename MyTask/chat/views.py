@@ -1,11 +1,35 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from company.models import Department
+from company.services import get_membership
 from authentication.models import User
 from rest_framework import authentication
 from django.conf import settings
+from MyTask.ratelimit import rate_limit
+from datetime import date
+import base64
+import json
 import jwt
 
+from .archive import iter_archive
+from .permissions import parse_room, room_access
+from .search import search_messages
+from .unread import unread_counts
+
+
+def parse_json_body(request):
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        # JSONDecodeError и UnicodeDecodeError для тела не в UTF-8.
+        return {}, JsonResponse({'error': 'Invalid JSON'}, status=400)
+    if not isinstance(data, dict):
+        return {}, JsonResponse({'error': 'JSON object expected'},
+                                status=400)
+    return data, None
+
 
 def get_user_payload(request):
     auth_header = authentication.get_authorization_header(request).split()
@@ -51,7 +75,139 @@ def chat_view(request, room_name=None):
             'display_name': f' {dept.name}'
         })
 
+    membership = get_membership(user.id)
+    if membership and membership.company_id is not None:
+        unread = unread_counts(user.id, membership.company_id,
+                               [None, *membership.department_ids])
+        for chat in chats:
+            department_id = None if chat['room_name'] == 'company' else \
+                int(chat['room_name'].split('department_')[1])
+            chat['unread'] = unread.get(department_id, 0)
+
     return render(request, 'chat.html', {
         'chats_json': chats,
         'user': user
     })
+
+
+def encode_cursor(cursor):
+    return base64.urlsafe_b64encode(
+        json.dumps(cursor).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(value):
+    try:
+        rank, message_id = json.loads(base64.urlsafe_b64decode(value))
+        return float(rank), int(message_id)
+    except (ValueError, TypeError):
+        return None
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@rate_limit('chat_search', ip_rate='120/m', user_rate='60/m')
+def search_chat(request):
+    """
+    Поиск по сообщениям доступных пользователю комнат.
+
+    Комнаты проверяются теми же правилами, что и при подключении к
+    сокету (chat.permissions.room_access). Без room ищет во всех
+    комнатах пользователя.
+    """
+    payload, error = get_user_payload(request)
+    if error:
+        return error
+
+    membership = get_membership(payload['user_id'])
+    if membership is None:
+        return JsonResponse({'error': 'User not found'}, status=404)
+    if not membership.company_id:
+        return JsonResponse({'error': 'User is not assigned to any company'},
+                            status=403)
+
+    data, error = parse_json_body(request)
+    if error:
+        return error
+
+    query = str(data.get('query') or '').strip()
+    if not query:
+        return JsonResponse({'error': 'Query is required'}, status=400)
+
+    if data.get('room'):
+        room = parse_room(str(data['room']))
+        if room is None:
+            return JsonResponse({'error': 'Unknown room'}, status=400)
+        access = room_access(membership, *room)
+        if access is None:
+            return JsonResponse({'error': 'Access denied'}, status=403)
+        department_ids = [access.department_id]
+    else:
+        department_ids = [None, *membership.department_ids]
+
+    try:
+        limit = min(max(int(data.get('limit', 20)), 1), 100)
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    after = None
+    if data.get('cursor'):
+        after = decode_cursor(data['cursor'])
+        if after is None:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    hits, next_cursor = search_messages(membership.company_id,
+                                        department_ids, query, after, limit)
+    return JsonResponse({
+        'results': hits,
+        'next_cursor': encode_cursor(next_cursor) if next_cursor else None
+    }, status=200)
+
+
+def stream_lines(items, lines_per_chunk=200):
+    lines = []
+    for item in items:
+        lines.append(json.dumps(item, ensure_ascii=False))
+        if len(lines) >= lines_per_chunk:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+@require_http_methods(["GET"])
+@rate_limit('chat_archive', ip_rate='60/m', user_rate='30/m')
+def chat_archive(request):
+    """
+    Архив сообщений комнаты (NDJSON, по строке на сообщение).
+
+    Параметры: room, from и to (YYYY-MM-DD, включительно). Ответ
+    отдаётся потоком: пакеты архива читаются и распаковываются по мере
+    отправки. Права на комнату — как у сокета чата.
+    """
+    payload, error = get_user_payload(request)
+    if error:
+        return error
+
+    membership = get_membership(payload['user_id'])
+    if membership is None:
+        return JsonResponse({'error': 'User not found'}, status=404)
+
+    room = parse_room(request.GET.get('room', ''))
+    if room is None:
+        return JsonResponse({'error': 'Unknown room'}, status=400)
+    access = room_access(membership, *room)
+    if access is None:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    try:
+        start = date.fromisoformat(request.GET['from']) \
+            if request.GET.get('from') else None
+        end = date.fromisoformat(request.GET['to']) \
+            if request.GET.get('to') else None
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be YYYY-MM-DD'}, status=400)
+
+    return StreamingHttpResponse(
+        stream_lines(iter_archive(access.company_id, access.department_id,
+                                  start, end)),
+        content_type='application/x-ndjson; charset=utf-8')
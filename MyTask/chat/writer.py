@@ -0,0 +1,164 @@
+import asyncio
+import atexit
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from MyTask import metrics
+from MyTask.conditional import bump_versions
+from .models import Message
+from .unread import bump_rooms
+
+logger = logging.getLogger(__name__)
+
+MESSAGES_WRITTEN = metrics.counter(
+    'chat_messages_written_total', 'Сохранённые сообщения чата.')
+MESSAGES_DROPPED = metrics.counter(
+    'chat_messages_dropped_total', 'Сообщения чата, которые не удалось '
+                                   'сохранить.')
+WRITE_BATCH_SIZE = metrics.histogram(
+    'chat_write_batch_size', 'Размер пакета записи сообщений.',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+
+def write_messages(messages: List[Message]) -> None:
+    """
+    Сохраняет пакет сообщений одним bulk_create.
+
+    bulk_create не отправляет post_save, поэтому версии компаний и
+    счётчики комнат (chat.unread) обновляются здесь. Если пакет не
+    записался (например, отдел удалили), сообщения сохраняются по
+    одному и теряются только ошибочные.
+    """
+    try:
+        with transaction.atomic():
+            Message.objects.bulk_create(messages)
+            bump_versions(*{f'company:{message.company_id}'
+                            for message in messages})
+        MESSAGES_WRITTEN.inc(amount=len(messages))
+        bump_rooms(messages)
+        return
+    except Exception as e:
+        logger.error(f"Chat batch of {len(messages)} messages failed, "
+                     f"saving one by one: {e}")
+
+    for message in messages:
+        message.pk = None
+        message._state.adding = True
+        try:
+            message.save()
+            MESSAGES_WRITTEN.inc()
+        except Exception as e:
+            MESSAGES_DROPPED.inc()
+            logger.error(f"Dropped chat message from user "
+                         f"{message.user_id}: {e}")
+
+
+class MessageWriter:
+    """
+    Write-behind запись сообщений чата.
+
+    Consumer кладёт сообщение в очередь процесса и сразу рассылает его,
+    не дожидаясь записи. Фоновая задача event loop собирает сообщения за
+    interval секунд (не больше batch_size) и пишет их одним bulk_create
+    в одном переходе в поток. Очередь ограничена max_pending: если БД не
+    успевает, put() ждёт и отправители замедляются.
+
+    put() возвращает future, который завершается после записи пакета
+    с этим сообщением: подключение ждёт только свои сообщения, а не
+    опустошения общей очереди. После записи пакета вызывается
+    on_written(сохранённые сообщения) — так id доходят до буферов
+    истории (chat.consumers.announce_saved). flush() дожидается записи
+    всего, что уже в очереди. При завершении процесса синхронно пишется
+    остаток очереди и незаписанная часть пакета, который был в работе.
+    """
+
+    def __init__(self, batch_size: int = 200, interval: float = 0.005,
+                 max_pending: int = 5000):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: List[Message] = []
+        self.on_written: Optional[
+            Callable[[List[Message]], Awaitable[None]]] = None
+
+    def _ensure_running(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Очередь привязана к циклу; остаток от старого цикла
+            # переносится в новую очередь, его future никто не ждёт.
+            leftover = self._drain()
+            self._loop = loop
+            self._queue = asyncio.Queue(self.max_pending)
+            self._task = None
+            for message in leftover:
+                self._queue.put_nowait((message, None))
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run(self._queue))
+        return self._queue
+
+    def _drain(self) -> List[Message]:
+        messages = []
+        while self._queue is not None and not self._queue.empty():
+            messages.append(self._queue.get_nowait()[0])
+        return messages
+
+    async def put(self, message: Message) -> asyncio.Future:
+        queue = self._ensure_running()
+        written = self._loop.create_future()
+        await queue.put((message, written))
+        return written
+
+    async def flush(self) -> None:
+        if self._queue is not None and \
+                self._loop is asyncio.get_running_loop():
+            await self._ensure_running().join()
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        while True:
+            batch = [await queue.get()]
+            if self.interval:
+                await asyncio.sleep(self.interval)
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            messages = self._inflight = [message for message, _ in batch]
+            try:
+                WRITE_BATCH_SIZE.observe(len(batch))
+                await database_sync_to_async(write_messages)(messages)
+            finally:
+                self._inflight = []
+                for _, written in batch:
+                    if written is not None and not written.done():
+                        written.set_result(None)
+                    queue.task_done()
+
+            saved = [message for message in messages if message.pk is not None]
+            if saved and self.on_written is not None:
+                try:
+                    await self.on_written(saved)
+                except Exception as e:
+                    logger.error(f"Announcing {len(saved)} saved chat "
+                                 f"messages failed: {e}")
+
+    def flush_sync(self) -> None:
+        """Запись остатка без event loop (atexit)."""
+        # У записанных сообщений пакета в работе уже есть pk.
+        messages = [message for message in self._inflight
+                    if message.pk is None] + self._drain()
+        self._inflight = []
+        if messages:
+            write_messages(messages)
+
+
+message_writer = MessageWriter(
+    batch_size=getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 200),
+    interval=getattr(settings, 'CHAT_WRITE_INTERVAL', 0.005),
+    max_pending=getattr(settings, 'CHAT_WRITE_MAX_PENDING', 5000),
+)
+atexit.register(message_writer.flush_sync)
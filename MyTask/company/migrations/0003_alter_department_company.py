@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0002_alter_company_name_alter_company_owner_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='department',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='departments', to='company.company'),
+        ),
+    ]
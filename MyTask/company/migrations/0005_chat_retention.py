@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0004_soft_delete_and_deletion_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='chat_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0005_chat_retention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='data_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0006_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deletionjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
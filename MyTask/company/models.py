@@ -2,9 +2,24 @@ from django.db import models
 from authentication.models import User
 
 
+class ActiveManager(models.Manager):
+    """Скрывает записи, помеченные на фоновое удаление."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Company(models.Model):
     name = models.CharField(max_length=200)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # Сколько дней хранить сообщения чата; None — без ограничения.
+    chat_retention_days = models.PositiveIntegerField(null=True, blank=True)
+    # Версия данных компании для ETag (MyTask.conditional).
+    data_version = models.BigIntegerField(default=0, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.name
@@ -14,6 +29,38 @@ class Department(models.Model):
     name = models.CharField(max_length=50)
     company = models.ForeignKey(Company, on_delete=models.CASCADE,  related_name='departments')
     personnel = models.ManyToManyField(User, related_name='assigned_departments')
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.name
+
+
+class DeletionJob(models.Model):
+    ENTITY_CHOICES = (
+        ('company', 'Company'),
+        ('department', 'Department'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    entity_id = models.BigIntegerField()
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL,
+                                     null=True, related_name='+')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES,
+                              default='pending')
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.entity} {self.entity_id}: {self.status}'
@@ -0,0 +1,335 @@
+import logging
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Exists, IntegerField, Max, OuterRef, \
+    Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+from django.dispatch import Signal
+from django.utils import timezone
+
+from authentication.functions import Casefold, fold
+from authentication.models import User
+from MyTask.conditional import bump_versions
+from MyTask.metrics import CACHE_REQUESTS
+from .models import Company, Department, DeletionJob
+
+logger = logging.getLogger(__name__)
+
+# Отправляется с user_ids при каждом изменении членства; по нему
+# сбрасывается кеш get_membership (company.signals).
+memberships_invalidated = Signal()
+
+MEMBERSHIP_CACHE_KEY = 'company:membership:{}'
+
+
+class Membership(NamedTuple):
+    company_id: Optional[int]
+    department_ids: Tuple[int, ...]
+    is_owner: bool
+
+
+NO_COMPANY = Membership(None, (), False)
+
+
+def membership_cache():
+    return caches[getattr(settings, 'COMPANY_MEMBERSHIP_CACHE', 'default')]
+
+
+def load_membership(user_id: int) -> Optional[Membership]:
+    """Членство из БД одним запросом по индексу through-таблицы."""
+    rows = list(
+        Department.objects.filter(personnel=user_id).order_by('id')
+        .values_list('id', 'company_id', 'company__owner_id')
+    )
+    if not rows:
+        if not User.objects.filter(id=user_id).exists():
+            return None
+        return NO_COMPANY
+
+    company_id = rows[0][1]
+    return Membership(
+        company_id=company_id,
+        department_ids=tuple(row[0] for row in rows if row[1] == company_id),
+        is_owner=rows[0][2] == user_id,
+    )
+
+
+def get_membership(user_id: int) -> Optional[Membership]:
+    """
+    Возвращает компанию, отделы и признак владельца для пользователя.
+
+    Результат хранится в кеше COMPANY_MEMBERSHIP_CACHE и удаляется по
+    memberships_invalidated. Единственная политика кеширования членства
+    для view и чата: при общем для процессов кеше изменение видно всем
+    процессам сразу, при кеше процесса — остальным не позже чем через
+    COMPANY_MEMBERSHIP_CACHE_TIMEOUT секунд.
+
+    Args:
+        user_id (int): id пользователя из JWT.
+
+    Returns:
+        Membership or None: None, если пользователь не существует.
+    """
+    cache = membership_cache()
+    key = MEMBERSHIP_CACHE_KEY.format(user_id)
+    cached = cache.get(key)
+    if cached is not None:
+        CACHE_REQUESTS.inc('company_membership', 'hit')
+        return Membership(*cached) if cached else None
+
+    CACHE_REQUESTS.inc('company_membership', 'miss')
+    membership = load_membership(user_id)
+    cache.set(key, tuple(membership) if membership else (),
+              getattr(settings, 'COMPANY_MEMBERSHIP_CACHE_TIMEOUT', 60))
+    return membership
+
+
+def invalidate_memberships(user_ids: Iterable[int]) -> None:
+    memberships_invalidated.send(sender=Membership, user_ids=list(user_ids))
+
+
+def resolve_emails(emails: Iterable[str]) -> Tuple[List[int], List[str]]:
+    """
+    Находит пользователей по списку email одним IN-запросом.
+
+    Сравнение идёт по email_folded (casefold email), а ввод приводится
+    той же fold(), поэтому регистр не важен и вне ASCII.
+
+    Returns:
+        tuple: (user_ids: найденные id, unknown: email без пользователя)
+    """
+    normalized = list(dict.fromkeys(
+        email.strip() for email in emails
+        if isinstance(email, str) and email.strip()))
+    found = dict(User.objects.filter(
+        email_folded__in=[fold(email) for email in normalized]
+    ).values_list('email_folded', 'id'))
+    unknown = [email for email in normalized
+               if fold(email) not in found]
+    return list(dict.fromkeys(found.values())), unknown
+
+
+def bulk_add_personnel(department: Department,
+                       emails: Iterable[str]) -> Tuple[List[int], List[str]]:
+    """
+    Добавляет в отдел всех пользователей из списка email.
+
+    Запись идёт напрямую в through-таблицу одним bulk_create, поэтому
+    m2m_changed не отправляется: кеш членства и версия компании
+    сбрасываются вручную после коммита.
+
+    Returns:
+        tuple: (user_ids: id новых сотрудников отдела, без тех, кто уже
+        в нём состоял; unknown: неизвестные email)
+    """
+    through = Department.personnel.through
+    with transaction.atomic():
+        user_ids, unknown = resolve_emails(emails)
+        existing = set(through.objects.filter(
+            department_id=department.id, user_id__in=user_ids
+        ).values_list('user_id', flat=True))
+        added = [user_id for user_id in user_ids if user_id not in existing]
+        through.objects.bulk_create(
+            [through(department_id=department.id, user_id=user_id)
+             for user_id in added],
+            ignore_conflicts=True,
+        )
+        transaction.on_commit(lambda: invalidate_memberships(added))
+        bump_versions(f'company:{department.company_id}')
+    return added, unknown
+
+
+def bulk_remove_personnel(department: Department,
+                          emails: Iterable[str]) -> Tuple[int, List[str]]:
+    """
+    Удаляет из отдела всех пользователей из списка email одним DELETE.
+
+    Returns:
+        tuple: (removed: число удалённых связей, unknown: неизвестные email)
+    """
+    through = Department.personnel.through
+    with transaction.atomic():
+        user_ids, unknown = resolve_emails(emails)
+        removed, _ = through.objects.filter(
+            department_id=department.id, user_id__in=user_ids).delete()
+        transaction.on_commit(lambda: invalidate_memberships(user_ids))
+        bump_versions(f'company:{department.company_id}')
+    return removed, unknown
+
+
+DIRECTORY_FIELDS = {'email': 'email_folded', 'username': 'username_folded'}
+
+
+def search_directory(company_id: int, query: str = '', field: str = 'email',
+                     department_ids: Optional[List[int]] = None,
+                     after: Optional[Tuple[str, int]] = None,
+                     limit: int = 50) -> Tuple[List[Dict[str, Any]],
+                                               Optional[Tuple[str, int]]]:
+    """
+    Справочник сотрудников компании с префиксным поиском.
+
+    Префикс ищется диапазоном по вычисляемой колонке Casefold(...),
+    поэтому запрос идёт по индексу, а не через LIKE. Префикс приводится
+    той же функцией СУБД, что и колонка. Пагинация keyset по (колонка, id).
+
+    Args:
+        company_id (int): Компания текущего пользователя.
+        query (str): Префикс email или имени пользователя.
+        field (str): 'email' или 'username'.
+        department_ids (list): Ограничить выборку этими отделами.
+        after (tuple): Курсор (значение колонки, id) последней записи.
+        limit (int): Размер страницы.
+
+    Returns:
+        tuple: (users: страница сотрудников, next_cursor: курсор или None)
+    """
+    column = DIRECTORY_FIELDS[field]
+    through = Department.personnel.through
+
+    members = through.objects.filter(user_id=OuterRef('pk'),
+                                     department__company_id=company_id,
+                                     department__deleted_at__isnull=True)
+    if department_ids:
+        members = members.filter(department_id__in=department_ids)
+
+    users = User.objects.filter(Exists(members))
+
+    if query:
+        prefix = Casefold(Value(query))
+        users = users.filter(**{
+            f'{column}__gte': prefix,
+            f'{column}__lt': Concat(prefix, Value('\U0010ffff')),
+        })
+
+    if after:
+        value, last_id = after
+        users = users.filter(Q(**{f'{column}__gt': value}) |
+                             Q(**{column: value, 'id__gt': last_id}))
+
+    page = list(users.order_by(column, 'id')
+                .values('id', 'username', 'email', column)[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    departments = {}
+    for user_id, department_id in through.objects.filter(
+            department__company_id=company_id,
+            department__deleted_at__isnull=True,
+            user_id__in=[user['id'] for user in page]
+    ).values_list('user_id', 'department_id'):
+        departments.setdefault(user_id, []).append(department_id)
+
+    result = [{
+        'id': user['id'],
+        'username': user['username'],
+        'email': user['email'],
+        'department_ids': departments.get(user['id'], []),
+    } for user in page]
+
+    next_cursor = (page[-1][column], page[-1]['id']) if has_more else None
+    return result, next_cursor
+
+
+def _room_aggregate(queryset, aggregate):
+    return Subquery(queryset.order_by().values('department_id')
+                    .annotate(value=aggregate).values('value')[:1],
+                    output_field=IntegerField())
+
+
+def departments_with_stats(company_id: int, members_limit: int = 0):
+    """
+    Отделы компании со счётчиками за один запрос.
+
+    Численность считается через Count(distinct=True), открытые задачи и
+    активность чата — коррелированными подзапросами, чтобы JOIN'ы не
+    перемножали строки. При members_limit > 0 первые N сотрудников
+    каждого отдела подгружаются одним Prefetch в members_preview.
+
+    Returns:
+        QuerySet: отделы с personnel_count, open_task_count,
+        message_count и last_message_id.
+    """
+    from chat.models import Message
+    from task.models import Task
+
+    open_tasks = Task.objects.filter(
+        employee__assigned_departments=OuterRef('pk')
+    ).exclude(status='done').order_by().values(
+        'employee__assigned_departments'
+    ).annotate(value=Count('id')).values('value')[:1]
+    messages = Message.objects.filter(department_id=OuterRef('pk'))
+
+    departments = Department.objects.filter(
+        company_id=company_id
+    ).select_related('company').annotate(
+        personnel_count=Count('personnel', distinct=True),
+        open_task_count=Coalesce(
+            Subquery(open_tasks, output_field=IntegerField()), 0),
+        message_count=Coalesce(
+            _room_aggregate(messages, Count('id')), 0),
+        last_message_id=_room_aggregate(messages, Max('id')),
+    ).order_by('id')
+
+    if members_limit > 0:
+        departments = departments.prefetch_related(Prefetch(
+            'personnel',
+            queryset=User.objects.order_by('id').only(
+                'id', 'username', 'email')[:members_limit],
+            to_attr='members_preview',
+        ))
+    return departments
+
+
+def _schedule_purge(job: DeletionJob) -> None:
+    from .tasks import purge_deleted
+
+    def enqueue():
+        try:
+            purge_deleted.delay(job.id)
+        except Exception as e:
+            logger.error(f"Failed to enqueue deletion job {job.id}: {e}")
+
+    transaction.on_commit(enqueue)
+
+
+def schedule_department_deletion(department: Department,
+                                 user_id: int) -> DeletionJob:
+    """
+    Помечает отдел удалённым и ставит очистку зависимых данных в Celery.
+
+    Отдел сразу пропадает из Department.objects; сообщения чата и
+    связи с сотрудниками удаляет задача purge_deleted порциями.
+    """
+    with transaction.atomic():
+        Department.objects.filter(pk=department.pk).update(
+            deleted_at=timezone.now())
+        job = DeletionJob.objects.create(entity='department',
+                                         entity_id=department.pk,
+                                         requested_by_id=user_id)
+        user_ids = list(department.personnel.values_list('id', flat=True))
+        transaction.on_commit(lambda: invalidate_memberships(user_ids))
+        bump_versions(f'company:{department.company_id}')
+        _schedule_purge(job)
+    return job
+
+
+def schedule_company_deletion(company_id: int, user_id: int) -> DeletionJob:
+    """Как schedule_department_deletion, но для компании и всех её отделов."""
+    with transaction.atomic():
+        now = timezone.now()
+        Company.objects.filter(pk=company_id).update(deleted_at=now)
+        Department.objects.filter(company_id=company_id).update(
+            deleted_at=now)
+        job = DeletionJob.objects.create(entity='company',
+                                         entity_id=company_id,
+                                         requested_by_id=user_id)
+        user_ids = list(Department.personnel.through.objects.filter(
+            department__company_id=company_id
+        ).values_list('user_id', flat=True))
+        transaction.on_commit(lambda: invalidate_memberships(user_ids))
+        bump_versions(f'company:{company_id}')
+        _schedule_purge(job)
+    return job
@@ -0,0 +1,82 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+    pre_delete
+from django.dispatch import receiver
+
+from authentication.models import User
+from MyTask.conditional import bump_versions
+from .models import Company, Department
+from .services import MEMBERSHIP_CACHE_KEY, get_membership, \
+    invalidate_memberships, membership_cache, memberships_invalidated
+
+
+def _personnel_ids(**filters):
+    return Department.personnel.through.objects.filter(
+        **filters).values_list('user_id', flat=True)
+
+
+def company_scope(company_id):
+    return f'company:{company_id}' if company_id else None
+
+
+@receiver(memberships_invalidated)
+def memberships_changed(sender, user_ids, **kwargs):
+    membership_cache().delete_many([MEMBERSHIP_CACHE_KEY.format(user_id)
+                                    for user_id in user_ids])
+
+
+@receiver(m2m_changed, sender=Department.personnel.through)
+def personnel_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and not reverse:
+        instance._cleared_personnel = list(
+            _personnel_ids(department=instance))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            invalidate_memberships([instance.pk])
+            bump_versions(*(company_scope(company_id) for company_id in
+                            Department.objects.filter(pk__in=pk_set or ())
+                            .values_list('company_id', flat=True)))
+        else:
+            if action == 'post_clear':
+                invalidate_memberships(instance.__dict__.pop(
+                    '_cleared_personnel', []))
+            else:
+                invalidate_memberships(pk_set)
+            bump_versions(company_scope(instance.company_id))
+
+
+@receiver(pre_delete, sender=Department)
+def department_deleting(sender, instance, **kwargs):
+    instance._cleared_personnel = list(_personnel_ids(department=instance))
+
+
+@receiver(post_delete, sender=Department)
+def department_deleted(sender, instance, **kwargs):
+    invalidate_memberships(instance.__dict__.pop('_cleared_personnel', []))
+    bump_versions(company_scope(instance.company_id))
+
+
+@receiver(post_save, sender=Department)
+def department_saved(sender, instance, **kwargs):
+    bump_versions(company_scope(instance.company_id))
+
+
+@receiver(post_save, sender=Company)
+def company_changed(sender, instance, **kwargs):
+    invalidate_memberships(_personnel_ids(department__company=instance))
+    bump_versions(company_scope(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login; данные, которые
+    # отдают версионированные view, он не меняет.
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    membership = get_membership(instance.pk)
+    bump_versions(f'user:{instance.pk}',
+                  company_scope(membership and membership.company_id))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_memberships([instance.pk])
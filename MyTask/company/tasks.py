@@ -0,0 +1,125 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from chat.models import Message
+from .models import Company, Department, DeletionJob
+
+
+def _delete_in_chunks(queryset, job: DeletionJob, chunk_size: int) -> None:
+    model = queryset.model
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            # Считаются строки, удалённые этой порцией: параллельный
+            # запуск мог удалить часть из них раньше.
+            _, deleted = model._base_manager.filter(pk__in=ids).delete()
+            DeletionJob.objects.filter(pk=job.pk).update(
+                processed=F('processed') + deleted.get(model._meta.label, 0),
+                updated_at=timezone.now())
+
+
+@shared_task
+def purge_deleted(job_id: int) -> str:
+    """
+    Фоновая очистка удалённого отдела или компании.
+
+    Сообщения чата и связи отделов с сотрудниками удаляются порциями по
+    COMPANY_PURGE_CHUNK_SIZE строк, каждая порция — отдельная короткая
+    транзакция, поэтому SQLite не блокируется надолго. Прогресс
+    сохраняется в DeletionJob.processed/total.
+
+    Задание выполняет один запуск: он переводит его в 'running' и
+    увеличивает attempts одним условным UPDATE. Повторная постановка в
+    очередь, пока задание выполняется, ничего не делает.
+
+    Args:
+        job_id (int): id записи DeletionJob.
+
+    Returns:
+        str: Итоговый статус задания.
+    """
+    claimed = DeletionJob.objects.filter(
+        _resumable(timezone.now()) | Q(status='pending'), pk=job_id,
+    ).update(status='running', attempts=F('attempts') + 1,
+             updated_at=timezone.now())
+    job = DeletionJob.objects.get(pk=job_id)
+    if not claimed:
+        return job.status
+
+    chunk_size = getattr(settings, 'COMPANY_PURGE_CHUNK_SIZE', 500)
+    through = Department.personnel.through
+
+    if job.entity == 'company':
+        department_ids = list(Department.all_objects.filter(
+            company_id=job.entity_id).values_list('id', flat=True))
+        messages = Message.objects.filter(company_id=job.entity_id)
+    else:
+        department_ids = [job.entity_id]
+        messages = Message.objects.filter(department_id=job.entity_id)
+    links = through.objects.filter(department_id__in=department_ids)
+
+    job.total = job.processed + messages.count() + links.count()
+    job.save(update_fields=['total', 'updated_at'])
+
+    try:
+        _delete_in_chunks(messages, job, chunk_size)
+        _delete_in_chunks(links, job, chunk_size)
+
+        with transaction.atomic():
+            Department.all_objects.filter(id__in=department_ids).delete()
+            if job.entity == 'company':
+                Company.all_objects.filter(id=job.entity_id).delete()
+    except Exception as e:
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status='failed', error=str(e), updated_at=timezone.now())
+        raise
+
+    DeletionJob.objects.filter(pk=job.pk).update(status='done',
+                                                 updated_at=timezone.now())
+    return 'done'
+
+
+def _resumable(now) -> Q:
+    """
+    Задания, которые можно запустить снова: 'failed' или 'running' без
+    прогресса дольше COMPANY_PURGE_STALE_AFTER секунд (воркер упал).
+    """
+    stale = now - timedelta(
+        seconds=getattr(settings, 'COMPANY_PURGE_STALE_AFTER', 600))
+    return Q(status__in=('failed', 'running'), updated_at__lt=stale,
+             attempts__lt=getattr(settings, 'COMPANY_PURGE_MAX_ATTEMPTS', 5))
+
+
+@shared_task
+def resume_deletion_jobs() -> int:
+    """
+    Повторно ставит в очередь застрявшие задания удаления: 'pending',
+    'running' или 'failed', не менявшиеся дольше
+    COMPANY_PURGE_STALE_AFTER секунд (брокер был недоступен, воркер
+    упал). Повторные попытки идут с удвоением паузы, не больше
+    COMPANY_PURGE_MAX_ATTEMPTS; после них задание остаётся 'failed'.
+
+    Returns:
+        int: Количество перезапущенных заданий.
+    """
+    now = timezone.now()
+    stale_after = getattr(settings, 'COMPANY_PURGE_STALE_AFTER', 600)
+    jobs = DeletionJob.objects.filter(
+        _resumable(now) | Q(status='pending',
+                            updated_at__lt=now - timedelta(
+                                seconds=stale_after))
+    ).values_list('id', 'attempts', 'updated_at')
+
+    job_ids = [job_id for job_id, attempts, updated_at in jobs
+               if now - updated_at >= timedelta(
+                   seconds=stale_after * 2 ** max(attempts - 1, 0))]
+    for job_id in job_ids:
+        purge_deleted.delay(job_id)
+    return len(job_ids)
@@ -1,3 +1,202 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+
+from authentication.models import User
+from chat.models import Message
+from .models import Company, Department, DeletionJob
+from .services import invalidate_memberships, membership_cache, \
+    schedule_department_deletion, search_directory
+from .tasks import purge_deleted, resume_deletion_jobs
+
+
+class MembershipAccessTests(TestCase):
+    def setUp(self):
+        membership_cache().clear()
+        self.owner = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        self.member = User.objects.create_user(
+            email='member@example.com', username='member', password='pw')
+        company = Company.objects.create(name='Acme', owner=self.owner)
+        self.department = Department.objects.create(name='Dev',
+                                                    company=company)
+        self.department.personnel.add(self.member)
+
+    def view_department(self):
+        return self.client.post(
+            '/company/api/view-department/',
+            json.dumps({'department_id': self.department.id}),
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {self.member.token}')
+
+    def test_removed_member_is_refused_immediately(self):
+        self.assertEqual(self.view_department().status_code, 200)
+
+        self.department.personnel.remove(self.member)
+
+        self.assertEqual(self.view_department().status_code, 403)
+
+    def test_removal_in_other_process_is_seen_after_invalidation(self):
+        # Так выглядит удаление, сделанное другим процессом: до сигнала
+        # memberships_invalidated действует членство из кеша.
+        self.assertEqual(self.view_department().status_code, 200)
+
+        Department.personnel.through.objects.filter(
+            department=self.department, user=self.member).delete()
+        self.assertEqual(self.view_department().status_code, 200)
+
+        invalidate_memberships([self.member.id])
+        self.assertEqual(self.view_department().status_code, 403)
+
+
+class BulkPersonnelTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        company = Company.objects.create(name='Acme', owner=self.owner)
+        self.department = Department.objects.create(name='Dev',
+                                                    company=company)
+        self.department.personnel.add(self.owner)
+        self.member = User.objects.create_user(
+            email='Foo@example.com', username='foo', password='pw')
+
+    def post(self, body):
+        return self.client.post(
+            '/company/api/add-personnel-bulk/', body,
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {self.owner.token}')
+
+    def test_added_counts_only_new_members(self):
+        response = self.post(json.dumps({
+            'department_id': self.department.id,
+            'emails': ['FOO@example.com', 'owner@example.com',
+                       'nobody@example.com'],
+        }))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['added'], 1)
+        self.assertEqual(response.json()['unknown_emails'],
+                         ['nobody@example.com'])
+        self.assertTrue(self.department.personnel.filter(
+            pk=self.member.pk).exists())
+
+    def test_non_ascii_email_is_case_insensitive(self):
+        user = User.objects.create_user(
+            email='Ölga@example.com', username='olga', password='pw')
+        response = self.post(json.dumps({
+            'department_id': self.department.id,
+            'emails': ['öLGA@example.com'],
+        }))
+        self.assertEqual(response.json()['unknown_emails'], [])
+        self.assertTrue(self.department.personnel.filter(
+            pk=user.pk).exists())
+
+    def test_non_object_body_is_rejected(self):
+        self.assertEqual(self.post('[]').status_code, 400)
+
+
+class DirectoryTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        self.company = Company.objects.create(name='Acme', owner=self.owner)
+        department = Department.objects.create(name='Dev',
+                                               company=self.company)
+        self.member = User.objects.create_user(
+            email='member@example.com', username='member', password='pw')
+        department.personnel.add(self.owner, self.member)
+
+    def test_prefix_search_sees_queryset_update(self):
+        User.objects.filter(pk=self.member.pk).update(
+            username='Zelda', email='Zelda@example.com')
+
+        users, _ = search_directory(self.company.id, 'zel', 'username')
+        self.assertEqual([user['id'] for user in users], [self.member.pk])
+        users, _ = search_directory(self.company.id, 'ZEL', 'email')
+        self.assertEqual([user['id'] for user in users], [self.member.pk])
+        users, _ = search_directory(self.company.id, 'mem', 'username')
+        self.assertEqual(users, [])
+
+    def test_prefix_search_folds_non_ascii(self):
+        User.objects.filter(pk=self.member.pk).update(username='Иван')
+
+        users, _ = search_directory(self.company.id, 'иВ', 'username')
+        self.assertEqual([user['id'] for user in users], [self.member.pk])
+
+    def test_keyset_pages(self):
+        first, cursor = search_directory(self.company.id, limit=1)
+        second, last = search_directory(self.company.id, after=cursor,
+                                        limit=1)
+        self.assertEqual([first[0]['id'], second[0]['id']],
+                         [self.member.pk, self.owner.pk])
+        self.assertIsNone(last)
+
+
+class VersionedEtagTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        self.company = Company.objects.create(name='Acme', owner=self.owner)
+        Department.objects.create(name='Dev', company=self.company)
+        Department.objects.get().personnel.add(self.owner)
+
+    def get(self, **headers):
+        return self.client.get(
+            '/company/api/get-departments/',
+            HTTP_AUTHORIZATION=f'Token {self.owner.token}', **headers)
+
+    def test_not_modified_until_company_changes(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Версия хранится в строке компании и видна любому процессу.
+        Department.objects.create(name='Ops', company=self.company)
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_login_does_not_bump_versions(self):
+        before = User.objects.get(pk=self.owner.pk).data_version
+        self.owner.last_login = timezone.now()
+        self.owner.save(update_fields=['last_login'])
+        self.assertEqual(User.objects.get(pk=self.owner.pk).data_version,
+                         before)
+
+
+class DeletionJobTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pw')
+        company = Company.objects.create(name='Acme', owner=self.owner)
+        self.department = Department.objects.create(name='Dev',
+                                                    company=company)
+        self.department.personnel.add(self.owner)
+        Message.objects.bulk_create([
+            Message(message=f'm{i}', user=self.owner, company=company,
+                    department=self.department) for i in range(3)])
+
+    def test_purge_runs_once_and_counts_deleted_rows(self):
+        job = schedule_department_deletion(self.department, self.owner.id)
+
+        self.assertEqual(purge_deleted(job.id), 'done')
+        self.assertEqual(purge_deleted(job.id), 'done')
+
+        job.refresh_from_db()
+        self.assertEqual((job.processed, job.total, job.attempts), (4, 4, 1))
+
+    def test_resume_skips_fresh_and_exhausted_jobs(self):
+        job = schedule_department_deletion(self.department, self.owner.id)
+        with mock.patch.object(purge_deleted, 'delay') as delay:
+            self.assertEqual(resume_deletion_jobs(), 0)
+
+            DeletionJob.objects.filter(pk=job.pk).update(
+                updated_at=timezone.now() - timedelta(hours=1))
+            self.assertEqual(resume_deletion_jobs(), 1)
 
-# Create your tests here.
+            DeletionJob.objects.filter(pk=job.pk).update(
+                status='failed', attempts=5)
+            self.assertEqual(resume_deletion_jobs(), 0)
+        delay.assert_called_once_with(job.id)
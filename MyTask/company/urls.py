@@ -18,9 +18,18 @@ urlpatterns = [
          name='add_personnel'),
     path('api/view-department/', views.view_department,
          name='view_department'),
+    path('api/people/', views.people_directory, name='people_directory'),
     path('api/delete-department/', views.delete_department,
          name='delete_department'),
+    path('api/delete-company/', views.delete_company,
+         name='delete_company'),
+    path('api/deletion-status/', views.deletion_status,
+         name='deletion_status'),
     path('api/remove-personnel/', views.remove_personnel,
          name='remove_personnel'),
+    path('api/add-personnel-bulk/', views.add_personnel_bulk,
+         name='add_personnel_bulk'),
+    path('api/remove-personnel-bulk/', views.remove_personnel_bulk,
+         name='remove_personnel_bulk'),
 
 ]
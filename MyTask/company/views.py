@@ -5,7 +5,13 @@ from django.views.decorators.csrf import csrf_exempt
 from rest_framework import authentication
 from django.conf import settings
 from authentication.models import User
-from .models import Company, Department
+from .models import Company, Department, DeletionJob
+from .services import get_membership, bulk_add_personnel, \
+    bulk_remove_personnel, search_directory, departments_with_stats, \
+    schedule_department_deletion, schedule_company_deletion, DIRECTORY_FIELDS
+from MyTask.conditional import versioned_etag
+from MyTask.ratelimit import rate_limit, get_token_user_id
+import base64
 import jwt
 import json
 
@@ -33,9 +39,13 @@ def get_user_payload(request):
 
 def parse_json_body(request):
     try:
-        return json.loads(request.body), None
+        data = json.loads(request.body)
     except json.JSONDecodeError:
         return {}, JsonResponse({'error': 'Invalid JSON'}, status=400)
+    if not isinstance(data, dict):
+        return {}, JsonResponse({'error': 'JSON object expected'},
+                                status=400)
+    return data, None
 
 
 def company_profile_page(request):
@@ -47,41 +57,81 @@ def list_departments(request):
     return render(request, 'departments.html')
 
 
+def company_scopes(request):
+    user_id = get_token_user_id(request)
+    if user_id is None:
+        return None
+
+    membership = get_membership(user_id)
+    if not membership or not membership.company_id:
+        return None
+    return ([f'company:{membership.company_id}'],
+            (tuple(membership), sorted(request.GET.items())))
+
+
 @csrf_exempt
-@require_http_methods(["POST"])
+@require_http_methods(["GET", "POST"])
+@versioned_etag(company_scopes)
 def get_departments(request):
     payload, error = get_user_payload(request)
     if error:
         return error
 
-    try:
-        user = User.objects.get(id=payload['user_id'])
-    except User.DoesNotExist:
+    membership = get_membership(payload['user_id'])
+    if membership is None:
         return JsonResponse({'error': 'User not found'}, status=404)
 
-    all_departments = Department.objects.filter(
-        company__in=Department.objects.filter(personnel=user).values('company')
-    ).select_related('company').distinct()
+    if request.method == 'GET':
+        data = request.GET
+    else:
+        data, error = parse_json_body(request) if request.body else ({},
+                                                                     None)
+        if error:
+            return error
+
+    if not membership.company_id:
+        return JsonResponse({'departments': []}, status=200)
+
+    try:
+        members_limit = min(int(data.get('members', 0)), 50)
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Invalid members limit'}, status=400)
+
+    departments = departments_with_stats(membership.company_id,
+                                         members_limit)
 
-    data = [
-        {
+    data = []
+    for dept in departments:
+        item = {
             'id': dept.id,
             'name': dept.name,
-            'company_name': dept.company.name
+            'company_id': dept.company_id,
+            'company_name': dept.company.name,
+            'personnel_count': dept.personnel_count,
+            'open_task_count': dept.open_task_count,
+            'message_count': dept.message_count,
+            'last_message_id': dept.last_message_id,
         }
-        for dept in all_departments
-    ]
+        if members_limit > 0:
+            item['members'] = [
+                {'id': u.id, 'username': u.username, 'email': u.email}
+                for u in dept.members_preview
+            ]
+        data.append(item)
 
     return JsonResponse({'departments': data}, status=200)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('company_write', ip_rate='120/m', user_rate='60/m')
 def create_department(request):
     payload, error = get_user_payload(request)
-    try:
-        user = User.objects.get(id=payload['user_id'])
-    except User.DoesNotExist:
+    if error:
+        return error
+
+    membership = get_membership(payload['user_id'])
+    if membership is None:
         return JsonResponse({'error': 'User not found'}, status=404)
 
     data, error = parse_json_body(request)
@@ -90,16 +140,14 @@ def create_department(request):
 
     name = data.get('name')
 
-    company_id = Department.objects.filter(personnel=user).values_list(
-        'company_id', flat=True).first()
-    if not company_id:
+    if not membership.company_id:
         return JsonResponse({'error': 'User is not assigned to any company'},
                             status=403)
 
     try:
         department = Department.objects.create(
             name=name,
-            company_id=company_id
+            company_id=membership.company_id
         )
     except Exception as e:
         return JsonResponse({'error': f'Failed to create department:'
@@ -122,9 +170,8 @@ def view_department(request):
     if error:
         return error
 
-    try:
-        user = User.objects.get(id=payload['user_id'])
-    except User.DoesNotExist:
+    membership = get_membership(payload['user_id'])
+    if membership is None:
         return JsonResponse({'error': 'User not found'}, status=404)
 
     data, error = parse_json_body(request)
@@ -143,10 +190,8 @@ def view_department(request):
     except Department.DoesNotExist:
         return JsonResponse({'error': 'Department not found'}, status=404)
 
-    user_company_id = Department.objects.filter(personnel=user).values_list(
-        'company_id', flat=True).first()
-
-    if not user_company_id or department.company_id != user_company_id:
+    if not membership.company_id or \
+            department.company_id != membership.company_id:
         return JsonResponse({'error': 'Permission denied'}, status=403)
 
     users = department.personnel.all().values('id', 'username', 'email')
@@ -154,23 +199,82 @@ def view_department(request):
     return JsonResponse({'users': list(users)}, status=200)
 
 
+def encode_cursor(cursor):
+    return base64.urlsafe_b64encode(
+        json.dumps(cursor).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(value):
+    try:
+        folded, user_id = json.loads(base64.urlsafe_b64decode(value))
+        return str(folded), int(user_id)
+    except (ValueError, TypeError):
+        return None
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def company_profile(request):
+def people_directory(request):
     payload, error = get_user_payload(request)
     if error:
         return error
 
-    try:
-        user = User.objects.get(id=payload['user_id'])
-    except User.DoesNotExist:
+    membership = get_membership(payload['user_id'])
+    if membership is None:
         return JsonResponse({'error': 'User not found'}, status=404)
 
-    company_id = Department.objects.filter(personnel=user).values_list(
-        'company_id', flat=True).first()
+    if not membership.company_id:
+        return JsonResponse({'error': 'User is not assigned to any company'},
+                            status=403)
+
+    data, error = parse_json_body(request)
+    if error:
+        return error
+
+    query = str(data.get('query') or '').strip()
+    field = data.get('field', 'email')
+    if field not in DIRECTORY_FIELDS:
+        return JsonResponse({'error': 'Field must be email or username'},
+                            status=400)
 
-    if company_id:
-        company = Company.objects.get(id=company_id)
+    try:
+        limit = min(int(data.get('limit', 50)), 200)
+        department_ids = [int(d) for d in data.get('department_ids') or []]
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Invalid limit or department IDs'},
+                            status=400)
+
+    after = None
+    if data.get('cursor'):
+        after = decode_cursor(data['cursor'])
+        if after is None:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    users, next_cursor = search_directory(
+        membership.company_id, query, field, department_ids, after,
+        max(limit, 1))
+
+    return JsonResponse({
+        'users': users,
+        'next_cursor': encode_cursor(next_cursor) if next_cursor else None
+    }, status=200)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+@versioned_etag(company_scopes)
+def company_profile(request):
+    payload, error = get_user_payload(request)
+    if error:
+        return error
+
+    membership = get_membership(payload['user_id'])
+    if membership is None:
+        return JsonResponse({'error': 'User not found'}, status=404)
+
+    if membership.company_id:
+        company = Company.objects.select_related('owner').get(
+            id=membership.company_id)
         return JsonResponse({
             'company': {
                 'name': company.name,
@@ -186,6 +290,7 @@ def company_profile(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('company_write', ip_rate='120/m', user_rate='60/m')
 def create_company(request):
     payload, error = get_user_payload(request)
     if error:
@@ -227,39 +332,50 @@ def create_company(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('company_write', ip_rate='120/m', user_rate='60/m')
 def edit_company(request):
     payload, error = get_user_payload(request)
     if error:
         return error
 
-    try:
-        user = User.objects.get(id=payload['user_id'])
-    except User.DoesNotExist:
+    membership = get_membership(payload['user_id'])
+    if membership is None:
         return JsonResponse({'error': 'User not found'}, status=404)
 
     data, error = parse_json_body(request)
     if error:
         return error
 
-    company_id = Department.objects.filter(personnel=user).values_list(
-        'company_id', flat=True).first()
-
-    if not company_id:
+    if not membership.company_id:
         return JsonResponse({'error': 'No company found'}, status=404)
 
+    if not membership.is_owner:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
     try:
-        company = Company.objects.get(id=company_id)
+        company = Company.objects.select_related('owner').get(
+            id=membership.company_id)
     except Company.DoesNotExist:
         return JsonResponse({'error': 'Company not found'}, status=404)
 
-    if company.owner != user:
-        return JsonResponse({'error': 'Permission denied'}, status=403)
-
     new_name = data.get('name')
     new_owner = data.get('owner')
     if not new_name:
         return JsonResponse({'error': 'Name is required'}, status=400)
 
+    if 'chat_retention_days' in data:
+        days = data['chat_retention_days']
+        if days is not None:
+            try:
+                days = int(days)
+            except (ValueError, TypeError):
+                days = 0
+            if days < 1:
+                return JsonResponse({'error': 'chat_retention_days must be '
+                                              'a positive number or null'},
+                                    status=400)
+        company.chat_retention_days = days
+
     company.name = new_name
     if new_owner:
         company.owner = new_owner
@@ -269,21 +385,22 @@ def edit_company(request):
         'company': {
             'id': company.id,
             'name': company.name,
-            'owner': company.owner.username
+            'owner': company.owner.username,
+            'chat_retention_days': company.chat_retention_days
         }
     }, status=200)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('company_write', ip_rate='120/m', user_rate='60/m')
 def edit_department(request):
     payload, error = get_user_payload(request)
     if error:
         return error
 
-    try:
-        user = User.objects.get(id=payload['user_id'])
-    except User.DoesNotExist:
+    membership = get_membership(payload['user_id'])
+    if membership is None:
         return JsonResponse({'error': 'User not found'}, status=404)
 
     data, error = parse_json_body(request)
@@ -294,13 +411,13 @@ def edit_department(request):
     new_name = data.get('name')
 
     try:
-        department = Department.objects.get(id=dept_id)
+        department = Department.objects.select_related('company').get(
+            id=dept_id)
     except Department.DoesNotExist:
         return JsonResponse({'error': 'Department not found'}, status=404)
 
-    company_id = Department.objects.filter(personnel=user).values_list(
-        'company_id', flat=True).first()
-    if not company_id or company_id != department.company.id:
+    if not membership.company_id or \
+            membership.company_id != department.company_id:
         return JsonResponse({'error': 'Permission denied'}, status=403)
 
     department.name = new_name
@@ -317,15 +434,14 @@ def edit_department(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('company_write', ip_rate='120/m', user_rate='60/m')
 def add_personnel(request):
     payload, error = get_user_payload(request)
     if error:
         return error
 
-    try:
-        user = User.objects.get(id=payload['user_id'])
-
-    except User.DoesNotExist:
+    membership = get_membership(payload['user_id'])
+    if membership is None:
         return JsonResponse({'error': 'User not found'}, status=404)
 
     data, error = parse_json_body(request)
@@ -346,10 +462,8 @@ def add_personnel(request):
     except Department.DoesNotExist:
         return JsonResponse({'error': 'Department not found'}, status=404)
 
-    user_company_id = Department.objects.filter(personnel=user).values_list(
-        'company_id', flat=True).first()
-    print(user_company_id)
-    if not user_company_id or department.company_id != user_company_id:
+    if not membership.company_id or \
+            department.company_id != membership.company_id:
         return JsonResponse({'error': 'Permission denied'}, status=403)
 
     try:
@@ -369,14 +483,14 @@ def add_personnel(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('company_write', ip_rate='120/m', user_rate='60/m')
 def remove_personnel(request):
     payload, error = get_user_payload(request)
     if error:
         return error
 
-    try:
-        user = User.objects.get(id=payload['user_id'])
-    except User.DoesNotExist:
+    membership = get_membership(payload['user_id'])
+    if membership is None:
         return JsonResponse({'error': 'User not found'}, status=404)
 
     data = json.loads(request.body)
@@ -395,9 +509,8 @@ def remove_personnel(request):
     except Department.DoesNotExist:
         return JsonResponse({'error': 'Department not found'}, status=404)
 
-    company_id = (Department.objects.filter(personnel=user).values_list
-                  ('company_id', flat=True).first())
-    if not company_id or department.company_id != company_id:
+    if not membership.company_id or \
+            department.company_id != membership.company_id:
         return JsonResponse({'error': 'Permission denied'}, status=403)
 
     try:
@@ -412,16 +525,96 @@ def remove_personnel(request):
     }, status=200)
 
 
+def parse_bulk_personnel(request):
+    payload, error = get_user_payload(request)
+    if error:
+        return None, None, error
+
+    membership = get_membership(payload['user_id'])
+    if membership is None:
+        return None, None, JsonResponse({'error': 'User not found'},
+                                        status=404)
+
+    data, error = parse_json_body(request)
+    if error:
+        return None, None, error
+
+    department_id = data.get('department_id')
+    emails = data.get('emails')
+
+    if not department_id or not isinstance(emails, list) or not emails:
+        return None, None, JsonResponse(
+            {'error': 'Department ID and list of emails are required'},
+            status=400)
+
+    limit = getattr(settings, 'COMPANY_BULK_PERSONNEL_LIMIT', 1000)
+    if len(emails) > limit:
+        return None, None, JsonResponse(
+            {'error': f'No more than {limit} emails per request'},
+            status=400)
+
+    if not all(isinstance(email, str) for email in emails):
+        return None, None, JsonResponse({'error': 'Invalid email list'},
+                                        status=400)
+
+    try:
+        department = Department.objects.get(id=department_id)
+    except Department.DoesNotExist:
+        return None, None, JsonResponse({'error': 'Department not found'},
+                                        status=404)
+
+    if not membership.company_id or \
+            department.company_id != membership.company_id:
+        return None, None, JsonResponse({'error': 'Permission denied'},
+                                        status=403)
+
+    return department, emails, None
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@rate_limit('company_write', ip_rate='120/m', user_rate='60/m')
+def add_personnel_bulk(request):
+    department, emails, error = parse_bulk_personnel(request)
+    if error:
+        return error
+
+    user_ids, unknown = bulk_add_personnel(department, emails)
+
+    return JsonResponse({
+        'success': True,
+        'added': len(user_ids),
+        'unknown_emails': unknown
+    }, status=200)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@rate_limit('company_write', ip_rate='120/m', user_rate='60/m')
+def remove_personnel_bulk(request):
+    department, emails, error = parse_bulk_personnel(request)
+    if error:
+        return error
+
+    removed, unknown = bulk_remove_personnel(department, emails)
+
+    return JsonResponse({
+        'success': True,
+        'removed': removed,
+        'unknown_emails': unknown
+    }, status=200)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('company_write', ip_rate='120/m', user_rate='60/m')
 def delete_department(request):
     payload, error = get_user_payload(request)
     if error:
         return error
 
-    try:
-        user = User.objects.get(id=payload['user_id'])
-    except User.DoesNotExist:
+    membership = get_membership(payload['user_id'])
+    if membership is None:
         return JsonResponse({'error': 'User not found'}, status=404)
 
     data = json.loads(request.body)
@@ -435,17 +628,78 @@ def delete_department(request):
     except Department.DoesNotExist:
         return JsonResponse({'error': 'Department not found'}, status=404)
 
-    company_id = Department.objects.filter(personnel=user).values_list(
-        'company_id', flat=True).first()
-    owner_company = Company.objects.get(id=company_id).owner
-    if owner_company != user:
+    if not membership.is_owner or \
+            department.company_id != membership.company_id:
         return JsonResponse({'error': 'Permission denied'}, status=403)
 
-    department.personnel.clear()
+    job = schedule_department_deletion(department, payload['user_id'])
+
+    return JsonResponse({
+        'success': True,
+        'message': 'Department deleted successfully',
+        'job_id': job.id
+    }, status=200)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@rate_limit('company_write', ip_rate='120/m', user_rate='60/m')
+def delete_company(request):
+    payload, error = get_user_payload(request)
+    if error:
+        return error
+
+    membership = get_membership(payload['user_id'])
+    if membership is None:
+        return JsonResponse({'error': 'User not found'}, status=404)
+
+    if not membership.company_id:
+        return JsonResponse({'error': 'No company found'}, status=404)
 
-    department.delete()
+    if not membership.is_owner:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    job = schedule_company_deletion(membership.company_id,
+                                    payload['user_id'])
 
     return JsonResponse({
         'success': True,
-        'message': 'Department deleted successfully'
+        'message': 'Company deleted successfully',
+        'job_id': job.id
+    }, status=200)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def deletion_status(request):
+    payload, error = get_user_payload(request)
+    if error:
+        return error
+
+    if request.method == 'GET':
+        data = request.GET
+    else:
+        data, error = parse_json_body(request)
+        if error:
+            return error
+
+    job_id = data.get('job_id')
+    if not job_id:
+        return JsonResponse({'error': 'Job ID is required'}, status=400)
+
+    try:
+        job = DeletionJob.objects.get(id=job_id,
+                                      requested_by_id=payload['user_id'])
+    except (DeletionJob.DoesNotExist, ValueError):
+        return JsonResponse({'error': 'Job not found'}, status=404)
+
+    return JsonResponse({
+        'job': {
+            'id': job.id,
+            'entity': job.entity,
+            'entity_id': job.entity_id,
+            'status': job.status,
+            'processed': job.processed,
+            'total': job.total
+        }
     }, status=200)
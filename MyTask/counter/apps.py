@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CounterConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "counter"
+
+    def ready(self):
+        from .instrumentation import connect_signals
+        connect_signals()
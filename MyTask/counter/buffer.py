@@ -0,0 +1,274 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+from . import histogram
+from .models import RouteStat, Session_counter
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """
+    Буфер посещений маршрутов в памяти процесса (write-behind).
+
+    Инкременты копятся в dict и сбрасываются в БД каждые
+    COUNTER_FLUSH_EVERY обращений или COUNTER_FLUSH_INTERVAL секунд
+    запросами вида count = count + delta, а также при завершении процесса.
+    Если запись не удаётся max_failures раз подряд, накопленное
+    отбрасывается, чтобы буфер не рос без предела.
+    """
+
+    def __init__(self, flush_every: int = 100, flush_interval: float = 5.0,
+                 max_failures: int = 5):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.max_failures = max_failures
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, route: str) -> bool:
+        """
+        Учитывает обращение к маршруту (имя view из resolver_match).
+
+        Returns:
+            bool: True, если пора сбросить буфер.
+        """
+        with self._lock:
+            self._counts[route] += 1
+            self._pending += 1
+            return (self._pending >= self.flush_every or
+                    time.monotonic() - self._last_flush >=
+                    self.flush_interval)
+
+    def take(self) -> Dict[str, int]:
+        with self._lock:
+            counts, self._counts = self._counts, defaultdict(int)
+            self._pending = 0
+            self._last_flush = time.monotonic()
+        return counts
+
+    def restore(self, counts: Dict[str, int]) -> None:
+        with self._lock:
+            for route, delta in counts.items():
+                self._counts[route] += delta
+                self._pending += delta
+
+    def flush(self) -> None:
+        counts = self.take()
+        if not counts:
+            return
+
+        try:
+            self._write(counts)
+        except Exception as e:
+            self._failures += 1
+            if self._failures >= self.max_failures:
+                logger.error(f"Counter flush failed {self._failures} times, "
+                             f"dropping {len(counts)} routes: {e}")
+                self._failures = 0
+            else:
+                logger.error(f"Counter flush failed, keeping {len(counts)} "
+                             f"routes for the next attempt: {e}")
+                self.restore(counts)
+        else:
+            self._failures = 0
+
+    @staticmethod
+    def _write(counts: Dict[str, int]) -> None:
+        by_delta = defaultdict(list)
+        for route, delta in counts.items():
+            by_delta[delta].append(route)
+
+        with transaction.atomic():
+            Session_counter.objects.bulk_create(
+                [Session_counter(route=route, count=0) for route in counts],
+                ignore_conflicts=True,
+            )
+            for delta, routes in by_delta.items():
+                Session_counter.objects.filter(route__in=routes).update(
+                    count=F('count') + delta)
+
+
+class RouteStatsBuffer:
+    """
+    Поминутная статистика по маршрутам в памяти процесса.
+
+    Ключ — (имя маршрута, начало минуты), значение — число запросов,
+    суммарное время и гистограмма задержек. Сбрасывается вместе с
+    CounterBuffer слиянием с уже сохранёнными строками RouteStat; после
+    max_failures неудачных попыток подряд накопленное отбрасывается.
+    """
+
+    def __init__(self, max_failures: int = 5):
+        self.max_failures = max_failures
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, int], list] = {}
+
+    def record(self, route: str, elapsed_ms: float) -> None:
+        key = (route, int(time.time()) // 60 * 60)
+        index = histogram.bucket_index(elapsed_ms)
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                stat = self._stats[key] = [0, 0.0, histogram.empty()]
+            stat[0] += 1
+            stat[1] += elapsed_ms
+            stat[2][index] += 1
+
+    def take(self) -> Dict[Tuple[str, int], list]:
+        with self._lock:
+            stats, self._stats = self._stats, {}
+        return stats
+
+    def restore(self, stats: Dict[Tuple[str, int], list]) -> None:
+        with self._lock:
+            for key, (count, total_ms, hist) in stats.items():
+                stat = self._stats.get(key)
+                if stat is None:
+                    self._stats[key] = [count, total_ms, hist]
+                else:
+                    stat[0] += count
+                    stat[1] += total_ms
+                    histogram.merge(stat[2], hist)
+
+    def flush(self) -> None:
+        stats = self.take()
+        if not stats:
+            return
+
+        try:
+            write_route_stats(
+                [(route, datetime.fromtimestamp(start, tz=timezone.utc),
+                  count, total_ms, hist)
+                 for (route, start), (count, total_ms, hist)
+                 in stats.items()],
+                resolution=60,
+            )
+        except Exception as e:
+            self._failures += 1
+            if self._failures >= self.max_failures:
+                logger.error(f"Route stats flush failed {self._failures} "
+                             f"times, dropping {len(stats)} buckets: {e}")
+                self._failures = 0
+            else:
+                logger.error(f"Route stats flush failed, keeping "
+                             f"{len(stats)} buckets for the next attempt: {e}")
+                self.restore(stats)
+        else:
+            self._failures = 0
+
+
+def write_route_stats(rows: List[tuple], resolution: int) -> None:
+    """
+    Прибавляет (route, bucket_start, count, total_ms, histogram) к строкам
+    RouteStat. Пустые строки создаются первыми, чтобы транзакция сразу
+    взяла блокировку на запись и слияние не потеряло чужие данные.
+    """
+    with transaction.atomic():
+        RouteStat.objects.bulk_create(
+            [RouteStat(route=route, resolution=resolution, bucket_start=start,
+                       histogram=histogram.empty().tobytes())
+             for route, start, *_ in rows],
+            ignore_conflicts=True,
+        )
+        existing = {
+            (stat.route, stat.bucket_start): stat
+            for stat in RouteStat.objects.select_for_update().filter(
+                resolution=resolution,
+                bucket_start__in={start for _, start, *_ in rows},
+                route__in={route for route, *_ in rows},
+            )
+        }
+        for route, start, count, total_ms, hist in rows:
+            stat = existing[(route, start)]
+            stat.count += count
+            stat.total_ms += total_ms
+            stat.histogram = histogram.merge(
+                histogram.from_bytes(stat.histogram), hist).tobytes()
+        RouteStat.objects.bulk_update(
+            [existing[(route, start)] for route, start, *_ in rows],
+            ['count', 'total_ms', 'histogram'], batch_size=500)
+
+
+buffer = CounterBuffer(
+    flush_every=getattr(settings, 'COUNTER_FLUSH_EVERY', 100),
+    flush_interval=getattr(settings, 'COUNTER_FLUSH_INTERVAL', 5.0),
+    max_failures=getattr(settings, 'COUNTER_FLUSH_MAX_FAILURES', 5),
+)
+route_stats = RouteStatsBuffer(
+    max_failures=getattr(settings, 'COUNTER_FLUSH_MAX_FAILURES', 5))
+
+
+def flush_all() -> None:
+    buffer.flush()
+    route_stats.flush()
+
+
+def flush_in_thread() -> None:
+    """Сброс буферов из фонового потока; соединение потока закрывается."""
+    try:
+        flush_all()
+    finally:
+        connections.close_all()
+
+
+_flusher: Optional[threading.Thread] = None
+_flusher_lock = threading.Lock()
+_flush_requested = threading.Event()
+
+
+def start_periodic_flush(interval: float) -> None:
+    """
+    Запускает поток, который сбрасывает буферы раз в interval секунд и
+    по request_flush().
+
+    Без него сброс по времени срабатывает только на следующем запросе,
+    и простаивающий процесс держит счётчики до завершения.
+
+    Для БД SQLite в памяти (тесты) поток не запускается: его соединение
+    либо видит другую БД, либо делит с основным таблицы, которые SQLite
+    в общей памяти блокирует без ожидания, и запросы падают с
+    "database table is locked". Счётчики тогда пишутся при завершении
+    процесса.
+    """
+    global _flusher
+    if connections['default'].is_in_memory_db():
+        return
+    with _flusher_lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        _flusher = threading.Thread(target=_flush_periodically,
+                                    args=(interval,), name='counter-flush',
+                                    daemon=True)
+        _flusher.start()
+
+
+def request_flush() -> None:
+    """Будит поток сброса; запрос, заполнивший буфер, запись не ждёт."""
+    _flush_requested.set()
+
+
+def _flush_periodically(interval: float) -> None:
+    while True:
+        _flush_requested.wait(interval)
+        _flush_requested.clear()
+        try:
+            flush_in_thread()
+        except Exception as e:
+            logger.error(f"Periodic counter flush failed: {e}")
+
+
+atexit.register(flush_all)
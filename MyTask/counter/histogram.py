@@ -0,0 +1,51 @@
+import math
+from array import array
+from typing import Iterable, List
+
+# Границы корзин задержки в мс: 0.25 * sqrt(2) ** i, примерно до 60 с.
+# Последняя корзина — всё, что больше.
+BOUNDS_MS: List[float] = [0.25 * 2 ** (i / 2) for i in range(37)]
+SIZE = len(BOUNDS_MS) + 1
+
+
+def empty() -> array:
+    return array('I', bytes(4 * SIZE))
+
+
+def bucket_index(elapsed_ms: float) -> int:
+    if elapsed_ms <= BOUNDS_MS[0]:
+        return 0
+    index = math.ceil(2 * math.log2(elapsed_ms / BOUNDS_MS[0]))
+    return min(index, SIZE - 1)
+
+
+def from_bytes(data: bytes) -> array:
+    hist = array('I')
+    hist.frombytes(bytes(data))
+    return hist if len(hist) == SIZE else empty()
+
+
+def merge(target: array, other: Iterable[int]) -> array:
+    for index, value in enumerate(other):
+        target[index] += value
+    return target
+
+
+def percentile(hist: array, q: float) -> float:
+    """
+    Оценка перцентиля по гистограмме.
+
+    Returns:
+        float: Верхняя граница корзины, в которую попал перцентиль, мс.
+    """
+    total = sum(hist)
+    if not total:
+        return 0.0
+
+    rank = q * total
+    seen = 0
+    for index, value in enumerate(hist):
+        seen += value
+        if seen >= rank:
+            return BOUNDS_MS[min(index, len(BOUNDS_MS) - 1)]
+    return BOUNDS_MS[-1]
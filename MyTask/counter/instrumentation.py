@@ -0,0 +1,68 @@
+import time
+
+from MyTask import metrics
+
+DB_QUERIES = metrics.counter(
+    'db_queries_total', 'Число SQL-запросов.', ('alias',))
+DB_QUERY_SECONDS = metrics.counter(
+    'db_query_seconds_total', 'Суммарное время SQL-запросов.', ('alias',))
+CELERY_PUBLISH_LATENCY = metrics.histogram(
+    'celery_publish_duration_seconds',
+    'Время постановки задачи Celery в брокер.', ('task',))
+
+# Если публикация упала, after_task_publish не придёт и запись останется.
+PUBLISH_PENDING_LIMIT = 1000
+_publish_started = {}
+
+
+class QueryMetrics:
+    """execute_wrapper соединения: считает запросы и их время."""
+
+    def __init__(self, alias: str):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            DB_QUERIES.inc(self.alias)
+            DB_QUERY_SECONDS.inc(self.alias,
+                                 amount=time.perf_counter() - started)
+
+
+def install_query_metrics(sender, connection, **kwargs):
+    """
+    Обработчик connection_created. Сигнал приходит на каждое
+    переподключение, поэтому обёртка ставится один раз на соединение.
+    """
+    if not any(isinstance(wrapper, QueryMetrics)
+               for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(QueryMetrics(connection.alias))
+
+
+def task_publish_started(sender=None, headers=None, **kwargs):
+    if headers and 'id' in headers:
+        if len(_publish_started) > PUBLISH_PENDING_LIMIT:
+            _publish_started.clear()
+        _publish_started[headers['id']] = time.perf_counter()
+
+
+def task_published(sender=None, headers=None, **kwargs):
+    started = _publish_started.pop((headers or {}).get('id'), None)
+    if started is not None:
+        CELERY_PUBLISH_LATENCY.observe(time.perf_counter() - started,
+                                       sender or 'unknown')
+
+
+def connect_signals() -> None:
+    from celery.signals import after_task_publish, before_task_publish
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(install_query_metrics,
+                               dispatch_uid='counter.query_metrics')
+    before_task_publish.connect(task_publish_started,
+                                dispatch_uid='counter.publish_started',
+                                weak=False)
+    after_task_publish.connect(task_published,
+                               dispatch_uid='counter.published', weak=False)
@@ -1,16 +1,90 @@
-from .models import Session_counter
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from MyTask import metrics
+from .buffer import buffer, request_flush, route_stats, start_periodic_flush
+
+REQUEST_LATENCY = metrics.histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса.',
+    ('route', 'method'))
+
+
+def route_name(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else '<unresolved>'
 
 
 class CountMiddleware:
+    """
+    Учёт обращений и задержек по маршрутам.
+
+    Работает в обоих режимах. Учёт идёт в памяти (под ASGI — без
+    переключения потоков), а запись в БД делает поток сброса буферов:
+    ответ её не ждёт ни в одном режиме.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        start_periodic_flush(buffer.flush_interval)
 
     def __call__(self, request):
-        url = request.path
+        if self.async_mode:
+            return self.__acall__(request)
 
-        session, _ = Session_counter.objects.get_or_create(address_url=url)
-        session.count += 1
-        session.save()
+        started = time.perf_counter()
 
         response = self.get_response(request)
+
+        if self.record(request, response, started):
+            request_flush()
         return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+
+        response = await self.get_response(request)
+
+        if self.record(request, response, started):
+            request_flush()
+        return response
+
+    @staticmethod
+    def record(request, response, started: float) -> bool:
+        """
+        Учитывает запрос по имени маршрута, а не по пути: id в URL не
+        порождают новых строк счётчиков. Успешные ответы без маршрута
+        отдаёт middleware раньше URL-резолвера (статика WhiteNoise), они
+        не учитываются.
+
+        Returns:
+            bool: True, если пора сбросить буферы.
+        """
+        if getattr(request, 'resolver_match', None) is None and \
+                response.status_code < 400:
+            return False
+        elapsed = time.perf_counter() - started
+        route = route_name(request)
+        route_stats.record(route, elapsed * 1000)
+        REQUEST_LATENCY.observe(elapsed, route, request.method)
+        return buffer.add(route)
+
+
+class AsyncCountMiddleware(CountMiddleware):
+    """
+    CountMiddleware только для async; для ASGI (daphne).
+
+    Встроенные middleware Django (MiddlewareMixin) в async-режиме
+    вызывают process_request и process_response через sync_to_async, а
+    WhiteNoise умеет только sync, поэтому полностью async цепочка
+    переключает потоки на каждом из них. Этот middleware стоит первым в
+    MIDDLEWARE, а SyncChainMiddleware — последним: всё между ними
+    собирается как sync и вызывается одним переходом в поток, а учёт
+    запроса остаётся в event loop.
+    """
+    sync_capable = False
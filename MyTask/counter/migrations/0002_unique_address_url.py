@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:56
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    Session_counter = apps.get_model('counter', 'Session_counter')
+    duplicates = (Session_counter.objects.values('address_url')
+                  .annotate(rows=Count('id'), total=Sum('count'))
+                  .filter(rows__gt=1))
+    for row in duplicates:
+        rows = Session_counter.objects.filter(
+            address_url=row['address_url']).order_by('id')
+        keep = rows.first()
+        rows.exclude(id=keep.id).delete()
+        keep.count = row['total']
+        keep.save(update_fields=['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('counter', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='session_counter',
+            name='address_url',
+            field=models.CharField(max_length=500, null=True, unique=True),
+        ),
+    ]
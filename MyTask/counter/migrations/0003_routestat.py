@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('counter', '0002_unique_address_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route', models.CharField(max_length=200)),
+                ('resolution', models.IntegerField(default=60)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('histogram', models.BinaryField(default=b'')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('resolution', 'bucket_start', 'route'), name='counter_routestat_bucket_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+from collections import Counter
+
+from django.db import migrations, models
+from django.urls import Resolver404, resolve
+
+
+def fold_paths(apps, schema_editor):
+    """
+    Сводит строки, записанные по пути запроса, к имени маршрута.
+
+    До перехода на имена в address_url лежал request.path, после — имя
+    view; пути начинаются с '/', имена — нет. Путь без маршрута
+    попадает в '<unresolved>', как и в counter.middleware.route_name.
+    """
+    Session_counter = apps.get_model('counter', 'Session_counter')
+    totals = Counter()
+    for address_url, count in Session_counter.objects.values_list(
+            'address_url', 'count'):
+        if not address_url:
+            continue
+        if address_url.startswith('/'):
+            try:
+                address_url = resolve(address_url).view_name
+            except Resolver404:
+                address_url = '<unresolved>'
+        totals[address_url] += count
+
+    Session_counter.objects.all().delete()
+    Session_counter.objects.bulk_create(
+        [Session_counter(address_url=route, count=count)
+         for route, count in totals.items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('counter', '0003_routestat'),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_paths, migrations.RunPython.noop),
+        migrations.RenameField(
+            model_name='session_counter',
+            old_name='address_url',
+            new_name='route',
+        ),
+        migrations.AlterField(
+            model_name='session_counter',
+            name='route',
+            field=models.CharField(max_length=200, unique=True),
+        ),
+    ]
@@ -2,5 +2,33 @@ from django.db import models
 
 
 class Session_counter(models.Model):
-    address_url = models.CharField(max_length=500, null=True)
+    """
+    Всего запросов к маршруту. route — имя view из resolver_match
+    (counter.middleware.route_name), а не путь: id в URL не порождают
+    новых строк.
+    """
+    route = models.CharField(max_length=200, unique=True)
     count = models.IntegerField(default=0)
+
+
+class RouteStat(models.Model):
+    """
+    Запросы к маршруту за интервал времени.
+
+    histogram — упакованный array('I') счётчиков по лог-шкале
+    counter.histogram.BOUNDS_MS. resolution — длина интервала в секундах:
+    60 для свежих данных, 3600 после свёртки.
+    """
+    route = models.CharField(max_length=200)
+    resolution = models.IntegerField(default=60)
+    bucket_start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    histogram = models.BinaryField(default=b'')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['resolution', 'bucket_start', 'route'],
+                name='counter_routestat_bucket_uniq'),
+        ]
@@ -0,0 +1,62 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import histogram
+from .buffer import write_route_stats
+from .models import RouteStat
+
+
+@shared_task
+def rollup_route_stats() -> int:
+    """
+    Свёртка поминутной статистики маршрутов в почасовую.
+
+    Минутные строки старше COUNTER_MINUTE_RETENTION секунд (по целым
+    часам) суммируются в строки с resolution=3600 и удаляются порциями.
+    Часовые строки старше COUNTER_HOUR_RETENTION секунд удаляются.
+
+    Returns:
+        int: Количество свёрнутых минутных строк.
+    """
+    now = timezone.now()
+    minute_cutoff = (now - timedelta(
+        seconds=getattr(settings, 'COUNTER_MINUTE_RETENTION', 86400))
+    ).replace(minute=0, second=0, microsecond=0)
+    hour_cutoff = now - timedelta(
+        seconds=getattr(settings, 'COUNTER_HOUR_RETENTION', 30 * 86400))
+    chunk_size = getattr(settings, 'COUNTER_ROLLUP_CHUNK_SIZE', 1000)
+
+    rolled = 0
+    while True:
+        stats = list(RouteStat.objects.filter(
+            resolution=60, bucket_start__lt=minute_cutoff
+        ).order_by('bucket_start')[:chunk_size])
+        if not stats:
+            break
+
+        hours = defaultdict(lambda: [0, 0.0, histogram.empty()])
+        for stat in stats:
+            hour = hours[(stat.route, stat.bucket_start.replace(minute=0))]
+            hour[0] += stat.count
+            hour[1] += stat.total_ms
+            histogram.merge(hour[2], histogram.from_bytes(stat.histogram))
+
+        with transaction.atomic():
+            write_route_stats(
+                [(route, start, count, total_ms, hist)
+                 for (route, start), (count, total_ms, hist)
+                 in hours.items()],
+                resolution=3600,
+            )
+            RouteStat.objects.filter(
+                pk__in=[stat.pk for stat in stats]).delete()
+        rolled += len(stats)
+
+    RouteStat.objects.filter(resolution=3600,
+                             bucket_start__lt=hour_cutoff).delete()
+    return rolled
@@ -1,3 +1,67 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, TestCase
+
+from . import middleware
+from .buffer import CounterBuffer, buffer
+from .models import Session_counter
+
+
+class CountMiddlewareTests(TestCase):
+    def setUp(self):
+        buffer.take()
+
+    def test_asgi_request_is_counted_on_event_loop(self):
+        with mock.patch.object(middleware.AsyncCountMiddleware, '__acall__',
+                               autospec=True,
+                               side_effect=middleware.CountMiddleware
+                               .__acall__) as acall, \
+                mock.patch.object(middleware, 'request_flush') as flush, \
+                mock.patch.object(buffer, 'flush_every', 1):
+            async_to_sync(AsyncClient().get)('/counter/routes/')
+
+        acall.assert_called_once()
+        # Запись в БД уходит в поток сброса, запрос её не ждёт.
+        flush.assert_called_once_with()
+        self.assertEqual(buffer.take(), {'counter:route_stats': 1})
+
+
+class CounterBufferTests(TestCase):
+    def setUp(self):
+        # Запросы других тестов пишет поток сброса общего буфера через
+        # своё соединение, мимо отката транзакции; поэтому здесь свои
+        # имена маршрутов.
+        buffer.take()
+
+    def rows(self):
+        return dict(Session_counter.objects.filter(
+            route__in=['test:index', 'test:search']
+        ).values_list('route', 'count'))
+
+    def test_flush_adds_deltas_to_existing_rows(self):
+        Session_counter.objects.create(route='test:index', count=5)
+        counter = CounterBuffer(flush_every=3)
+        self.assertFalse(counter.add('test:index'))
+        counter.add('test:index')
+        self.assertTrue(counter.add('test:search'))
+
+        counter.flush()
+
+        self.assertEqual(self.rows(), {'test:index': 7, 'test:search': 1})
+        self.assertEqual(counter.take(), {})
+
+    def test_failed_flush_is_restored_until_max_failures(self):
+        counter = CounterBuffer(max_failures=2)
+        counter.add('test:index')
+        with mock.patch.object(CounterBuffer, '_write',
+                               side_effect=RuntimeError('locked')), \
+                self.assertLogs('counter.buffer', 'ERROR'):
+            counter.flush()
+            self.assertEqual(counter.take(), {'test:index': 1})
+
+            counter.restore({'test:index': 1})
+            counter.flush()
+        # Вторая неудача подряд: накопленное отброшено.
+        self.assertEqual(counter.take(), {})
+        self.assertEqual(self.rows(), {})
@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+app_name = 'counter'
+urlpatterns = [
+    path('routes/', views.route_stats, name='route_stats'),
+]
@@ -1,3 +1,86 @@
-from django.shortcuts import render
+from collections import defaultdict
+from datetime import timedelta
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods
+
+from MyTask.metrics import REGISTRY
+from . import histogram
+from .models import RouteStat
+
+
+def is_local_request(request) -> bool:
+    allowed = getattr(settings, 'COUNTER_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    return request.META.get('REMOTE_ADDR') in allowed
+
+
+def summarize(stats) -> dict:
+    count = sum(stat.count for stat in stats)
+    total_ms = sum(stat.total_ms for stat in stats)
+    hist = histogram.empty()
+    for stat in stats:
+        histogram.merge(hist, histogram.from_bytes(stat.histogram))
+    return {
+        'count': count,
+        'avg_ms': round(total_ms / count, 3) if count else 0,
+        'p50_ms': round(histogram.percentile(hist, 0.5), 3),
+        'p99_ms': round(histogram.percentile(hist, 0.99), 3),
+    }
+
+
+@require_http_methods(["GET"])
+def route_stats(request):
+    """
+    p50/p99 и число запросов по маршрутам за последние minutes минут.
+
+    С параметром route дополнительно возвращает ряд по интервалам.
+    Доступно только с адресов COUNTER_ALLOWED_IPS.
+    """
+    if not is_local_request(request):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    try:
+        minutes = min(int(request.GET.get('minutes', 60)), 60 * 24 * 31)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid minutes'}, status=400)
+
+    since = timezone.now() - timedelta(minutes=minutes)
+    stats = RouteStat.objects.filter(bucket_start__gte=since)
+    route = request.GET.get('route')
+    if route:
+        stats = stats.filter(route=route)
+
+    by_route = defaultdict(list)
+    for stat in stats.order_by('bucket_start'):
+        by_route[stat.route].append(stat)
+
+    data = {'routes': [
+        {'route': name, **summarize(rows)}
+        for name, rows in sorted(by_route.items())
+    ]}
+    if route:
+        data['timeline'] = [
+            {'bucket_start': stat.bucket_start.isoformat(),
+             'resolution': stat.resolution, **summarize([stat])}
+            for stat in by_route.get(route, [])
+        ]
+    return JsonResponse(data, status=200)
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    Метрики процесса в текстовом формате Prometheus.
+
+    Значения накапливаются в памяти процесса с момента запуска, поэтому
+    каждый воркер нужно опрашивать отдельно. Доступно только с адресов
+    COUNTER_ALLOWED_IPS.
+    """
+    if not is_local_request(request):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    return HttpResponse(REGISTRY.exposition(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def test_database():
+    """
+    Временная БД для бенчмарков, как у test runner.
+
+    Для SQLite база создаётся файлом, а не в памяти: в памяти запись из
+    пула потоков упирается в блокировки shared cache.
+    """
+    workdir = tempfile.mkdtemp()
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            workdir, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0,
+                                                  autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,90 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+
+from counter.middleware import CountMiddleware
+from custom_commands.benchmarking import test_database
+
+COUNT = 'counter.middleware.CountMiddleware'
+ASYNC_COUNT = 'counter.middleware.AsyncCountMiddleware'
+SYNC_CHAIN = 'MyTask.middleware.SyncChainMiddleware'
+SYNC_COUNT = 'custom_commands.management.commands.bench_asgi.SyncCountMiddleware'
+
+
+class SyncCountMiddleware(CountMiddleware):
+    """CountMiddleware в прежнем виде: только sync."""
+    async_capable = False
+
+
+def middleware_variants():
+    """
+    sync-only — прежняя цепочка (sync CountMiddleware на старом месте);
+    async — без SyncChainMiddleware, всё async-capable; current —
+    текущие настройки (AsyncCountMiddleware первым, SyncChainMiddleware
+    последним).
+    """
+    chain = [path for path in settings.MIDDLEWARE
+             if path not in (ASYNC_COUNT, SYNC_CHAIN)]
+    return (
+        ('sync-only', [*chain, SYNC_COUNT]),
+        ('async', [*chain, COUNT]),
+        ('current', list(settings.MIDDLEWARE)),
+    )
+
+
+async def run_load(path: str, requests: int, concurrency: int):
+    client = AsyncClient()
+    latencies = []
+
+    async def worker(count: int):
+        for _ in range(count):
+            started = time.perf_counter()
+            await client.get(path)
+            latencies.append(time.perf_counter() - started)
+
+    share, extra = divmod(requests, concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(share + (i < extra))
+                           for i in range(concurrency)))
+    return time.perf_counter() - started, latencies
+
+
+def report(latencies, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает варианты цепочки middleware под ASGI: '
+            'запросы в секунду, p50 и p99.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/counter/routes/')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=100)
+
+    def handle(self, *args, **options):
+        with test_database():
+            for name, middleware in middleware_variants():
+                with override_settings(
+                        MIDDLEWARE=middleware,
+                        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                    asyncio.run(run_load(options['path'], options['warmup'],
+                                         options['concurrency']))
+                    elapsed, latencies = asyncio.run(run_load(
+                        options['path'], options['requests'],
+                        options['concurrency']))
+                result = report(latencies, elapsed)
+                self.stdout.write(
+                    f"{name:>14}: {result['rps']:8.1f} req/s  "
+                    f"p50 {result['p50_ms']:7.2f} ms  "
+                    f"p99 {result['p99_ms']:7.2f} ms")
@@ -0,0 +1,100 @@
+import asyncio
+import statistics
+import time
+
+from channels.layers import channel_layers
+from django.core.management.base import BaseCommand
+
+from chat.codecs import JSON, encode_frames
+from chat.consumers import ChatConsumer
+from chat.outbound import OutboundQueue
+
+
+class Member:
+    """Участник комнаты: ChatConsumer.chat_message с подменённым send."""
+
+    def __init__(self, layer, channel: str, done):
+        self.layer = layer
+        self.channel = channel
+        self.done = done
+        self.consumer = ChatConsumer()
+        self.consumer.codec = JSON
+        # Вместо кадра batch передаём дальше число сообщений в нём.
+        self.consumer.outbound = OutboundQueue(self.sent, len, self.closed)
+
+    async def sent(self, frame):
+        self.done(frame if isinstance(frame, int) else 1)
+
+    async def closed(self, code):
+        raise RuntimeError(f'Member disconnected with code {code}')
+
+    async def run(self):
+        while True:
+            event = await self.layer.receive(self.channel)
+            await self.consumer.chat_message(event)
+
+
+def build_event(mode: str, text: str) -> dict:
+    payload = {'username': 'bench', 'message': text}
+    if mode == 'per-member':
+        return {'type': 'chat_message', **payload}
+    return {'type': 'chat_message', **encode_frames(payload)}
+
+
+async def measure(size: int, mode: str, rounds: int, text: str):
+    layer = channel_layers.make_backend('default')
+    group = f'bench_{size}'
+    remaining = 0
+    finished = None
+
+    def done(count: int):
+        nonlocal remaining
+        remaining -= count
+        if remaining == 0:
+            finished.set()
+
+    members = []
+    for _ in range(size):
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        members.append(Member(layer, channel, done))
+    tasks = [asyncio.create_task(member.run()) for member in members]
+
+    latencies = []
+    try:
+        for _ in range(rounds):
+            remaining = size
+            finished = asyncio.Event()
+            started = time.perf_counter()
+            await layer.group_send(group, build_event(mode, text))
+            await finished.wait()
+            latencies.append(time.perf_counter() - started)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for member in members:
+            await member.consumer.outbound.stop()
+        await layer.close()
+    return latencies
+
+
+class Command(BaseCommand):
+    help = ('Задержка рассылки сообщения чата по размеру комнаты: '
+            'кодирование у каждого участника против готового кадра.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000,5000')
+        parser.add_argument('--rounds', type=int, default=50)
+        parser.add_argument('--message-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        text = 'Сообщение ' * (options['message_size'] // 10)
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            for mode in ('per-member', 'pre-encoded'):
+                latencies = sorted(asyncio.run(measure(
+                    size, mode, options['rounds'], text)))
+                self.stdout.write(
+                    f"{size:>6} участников  {mode:>11}: "
+                    f"p50 {statistics.median(latencies) * 1000:8.2f} ms  "
+                    f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:8.2f} ms")
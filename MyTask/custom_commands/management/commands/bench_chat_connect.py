@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+
+from authentication.models import User
+from chat import routing
+from chat.middleware import JWTAuthMiddlewareStack
+from company.models import Company, Department
+from counter.instrumentation import DB_QUERIES
+from custom_commands.benchmarking import test_database
+
+
+def total_queries() -> float:
+    return sum(value for _, _, value in DB_QUERIES.samples())
+
+
+def create_room(users: int):
+    owner = User.objects.create_user(email='owner@bench.local',
+                                     username='owner', password='bench')
+    company = Company.objects.create(name='Bench', owner=owner)
+    department = Department.objects.create(name='Bench', company=company)
+    members = User.objects.bulk_create([
+        User(email=f'user{i}@bench.local', username=f'user{i}')
+        for i in range(users)
+    ])
+    department.personnel.add(owner, *members)
+    return department, [owner.token] + [member.token for member in members]
+
+
+async def connect_all(app, path: str, tokens, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect(token: str):
+        async with semaphore:
+            communicator = WebsocketCommunicator(
+                app, path,
+                headers=[(b'authorization', f'Token {token}'.encode())])
+            connected, _ = await communicator.connect(timeout=30)
+            assert connected, 'connection rejected'
+            await communicator.receive_from(timeout=30)
+            await communicator.disconnect()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connect(token) for token in tokens))
+    return time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = ('Подключения к чату в секунду и запросов к БД на подключение '
+            'с холодным и прогретым кешем прав.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def handle(self, *args, **options):
+        app = JWTAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns))
+        with test_database():
+            department, tokens = create_room(options['users'])
+            path = f'/ws/chat/department_{department.id}/'
+
+            for name in ('cold', 'warm'):
+                queries = total_queries()
+                elapsed = asyncio.run(connect_all(
+                    app, path, tokens, options['concurrency']))
+                per_connect = (total_queries() - queries) / len(tokens)
+                self.stdout.write(
+                    f"{name:>5}: {len(tokens) / elapsed:8.1f} connects/s  "
+                    f"{per_connect:5.2f} запросов на подключение")
@@ -0,0 +1,328 @@
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import django
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils import timezone
+
+from authentication.models import User
+from chat import routing
+from chat.history import recent_history
+from chat.middleware import JWTAuthMiddlewareStack
+from chat.models import Message
+from chat.writer import message_writer
+from company.models import Company, Department
+from custom_commands.benchmarking import test_database
+
+
+def room_sizes(distribution: str, clients: int, rooms: int,
+               skew: float) -> List[int]:
+    """
+    Размеры комнат: первая — общий чат компании, остальные — отделы.
+
+    zipf: размер k-й комнаты пропорционален 1 / k ** skew;
+    uniform: поровну.
+    """
+    if distribution == 'uniform':
+        weights = [1.0] * rooms
+    else:
+        weights = [1 / (rank ** skew) for rank in range(1, rooms + 1)]
+    total = sum(weights)
+    sizes = [max(1, int(clients * weight / total)) for weight in weights]
+    sizes[0] += clients - sum(sizes)
+    if sizes[0] < 1:
+        raise CommandError('Not enough clients for the number of rooms')
+    return sizes
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+    samples = sorted(samples)
+
+    def at(q):
+        return round(samples[min(len(samples) - 1,
+                                 int(len(samples) * q))] * 1000, 3)
+    return {'p50_ms': at(0.5), 'p99_ms': at(0.99),
+            'max_ms': round(samples[-1] * 1000, 3)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, timeout=5, cwd=settings.BASE_DIR
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def create_rooms(sizes: List[int], history: int):
+    """
+    Компания с отделами под комнаты из sizes. Каждый пользователь состоит
+    в отделе своей комнаты; участники общего чата — в отделе 'general',
+    который сам как комната не используется.
+
+    Returns:
+        list: [(room_name, [token, ...]), ...]
+    """
+    owner = User.objects.create_user(email='owner@bench.local',
+                                     username='owner', password='bench')
+    company = Company.objects.create(name='Bench', owner=owner)
+    general = Department.objects.create(name='general', company=company)
+    general.personnel.add(owner)
+
+    users = iter(User.objects.bulk_create([
+        User(email=f'user{i}@bench.local', username=f'user{i}')
+        for i in range(sum(sizes) - 1)
+    ]))
+
+    rooms = []
+    for index, size in enumerate(sizes):
+        if index == 0:
+            members = [owner] + [next(users) for _ in range(size - 1)]
+            department = general
+            room_name = 'company'
+        else:
+            members = [next(users) for _ in range(size)]
+            department = Department.objects.create(name=f'room{index}',
+                                                   company=company)
+            room_name = f'department_{department.id}'
+        department.personnel.add(*members)
+
+        Message.objects.bulk_create([
+            Message(message=f'history {i}', user=members[i % len(members)],
+                    company=company,
+                    department=None if index == 0 else department)
+            for i in range(history)
+        ])
+        rooms.append((room_name, [member.token for member in members]))
+    return rooms
+
+
+class Client:
+    def __init__(self, app, room_name: str, token: str):
+        self.room_name = room_name
+        self.communicator = WebsocketCommunicator(
+            app, f'/ws/chat/{room_name}/',
+            headers=[(b'authorization', f'Token {token}'.encode())])
+        self.reader = None
+
+    async def connect(self, timeout: float):
+        started = time.perf_counter()
+        connected, code = await self.communicator.connect(timeout=timeout)
+        if not connected:
+            raise CommandError(f'Connection to {self.room_name} rejected '
+                               f'with code {code}')
+        accepted = time.perf_counter()
+        frame = json.loads(await self.communicator.receive_from(timeout))
+        assert frame['type'] == 'history', frame
+        history = time.perf_counter() - accepted
+        frame = json.loads(await self.communicator.receive_from(timeout))
+        assert frame['type'] == 'presence', frame
+        return accepted - started, history
+
+    async def read(self, deliveries: 'Deliveries'):
+        """Отмечает время получения каждого сообщения бенчмарка."""
+        while True:
+            frame = json.loads(await self.communicator.receive_from(
+                timeout=3600))
+            now = time.perf_counter()
+            if frame.get('type') == 'presence_diff':
+                continue
+            messages = frame['messages'] if frame.get('type') == 'batch' \
+                else [frame]
+            for message in messages:
+                deliveries.received(self.room_name, message['message'], now)
+
+
+class Deliveries:
+    """Время получения сообщений по (комната, текст)."""
+
+    def __init__(self):
+        self.times = defaultdict(list)
+        self._waiting = {}
+
+    def received(self, room_name: str, text: str, moment: float) -> None:
+        key = (room_name, text)
+        self.times[key].append(moment)
+        waiting = self._waiting.get(key)
+        if waiting is not None and len(self.times[key]) >= waiting[0]:
+            waiting[1].set()
+
+    async def wait(self, room_name: str, text: str, members: int,
+                   timeout: float) -> List[float]:
+        key = (room_name, text)
+        if len(self.times[key]) < members:
+            event = asyncio.Event()
+            self._waiting[key] = (members, event)
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            finally:
+                del self._waiting[key]
+        return self.times[key]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест чата внутри процесса: тысячи клиентов '
+            'WebsocketCommunicator по комнатам компании, скорость '
+            'подключения, задержка истории и рассылки. Результат — JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=2000)
+        parser.add_argument('--rooms', type=int, default=20,
+                            help='Комнат всего, включая общий чат.')
+        parser.add_argument('--distribution', choices=('zipf', 'uniform'),
+                            default='zipf')
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='Показатель распределения zipf.')
+        parser.add_argument('--room-sizes', default='',
+                            help='Явные размеры комнат через запятую; '
+                                 'первая — общий чат.')
+        parser.add_argument('--history', type=int, default=100,
+                            help='Сообщений в каждой комнате до начала.')
+        parser.add_argument('--messages', type=int, default=20,
+                            help='Сообщений на комнату при рассылке.')
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--timeout', type=float, default=60)
+        parser.add_argument('--output', default='',
+                            help='Файл для JSON с результатами.')
+
+    def handle(self, *args, **options):
+        if options['room_sizes']:
+            sizes = [int(size) for size in options['room_sizes'].split(',')]
+        else:
+            sizes = room_sizes(options['distribution'], options['clients'],
+                               options['rooms'], options['skew'])
+
+        # Отдельный каталог сокетов: рассылка не должна уходить в
+        # запущенные на этом хосте процессы daphne.
+        layers = json.loads(json.dumps(settings.CHANNEL_LAYERS))
+        layers['default'].setdefault('CONFIG', {})['socket_dir'] = \
+            tempfile.mkdtemp(prefix='bench-channels-')
+
+        with test_database(), override_settings(CHANNEL_LAYERS=layers,
+                                                RATE_LIMIT_ENABLED=False):
+            rooms = create_rooms(sizes, options['history'])
+            recent_history.clear()
+            # ChatConsumer печатает каждое подключение.
+            with open(os.devnull, 'w') as devnull, \
+                    contextlib.redirect_stdout(devnull):
+                results = asyncio.run(self.run(rooms, options))
+
+        report = {
+            'version': {
+                'git': git_revision(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'started_at': timezone.now().isoformat(),
+            'config': {
+                key: options[key] for key in (
+                    'clients', 'rooms', 'distribution', 'skew', 'history',
+                    'messages', 'concurrency')
+            },
+            'room_sizes': sizes,
+            **results,
+        }
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    async def run(self, rooms, options):
+        app = JWTAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns))
+        timeout = options['timeout']
+        clients = {room_name: [Client(app, room_name, token)
+                               for token in tokens]
+                   for room_name, tokens in rooms}
+        everyone = [client for members in clients.values()
+                    for client in members]
+
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def connect(client):
+            async with semaphore:
+                return await client.connect(timeout)
+
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(connect(client)
+                                         for client in everyone))
+        connect_seconds = time.perf_counter() - started
+
+        deliveries = Deliveries()
+        for client in everyone:
+            client.reader = asyncio.create_task(client.read(deliveries))
+
+        latencies = []
+
+        async def broadcast(room_name, members):
+            sender = members[0].communicator
+            fanout = []
+            for seq in range(options['messages']):
+                text = f'bench {seq}'
+                sent = time.perf_counter()
+                await sender.send_to(text_data=json.dumps({'message': text}))
+                try:
+                    times = await deliveries.wait(room_name, text,
+                                                  len(members), timeout)
+                except asyncio.TimeoutError:
+                    raise CommandError(f'Fan-out in {room_name} timed out '
+                                       f'at message {seq}')
+                fanout.append(max(times) - sent)
+                latencies.extend(moment - sent for moment in times)
+            return fanout
+
+        started = time.perf_counter()
+        fanouts = await asyncio.gather(*(
+            broadcast(room_name, members)
+            for room_name, members in clients.items()))
+        broadcast_seconds = time.perf_counter() - started
+
+        for client in everyone:
+            client.reader.cancel()
+        await asyncio.gather(*(client.reader for client in everyone),
+                             return_exceptions=True)
+        for client in everyone:
+            await client.communicator.disconnect()
+        await message_writer.flush()
+        await get_channel_layer().close()
+
+        return {
+            'connect': {
+                'clients': len(everyone),
+                'seconds': round(connect_seconds, 3),
+                'per_second': round(len(everyone) / connect_seconds, 1),
+                **percentiles([accept for accept, _ in timings]),
+            },
+            'history': percentiles([history for _, history in timings]),
+            'broadcast': {
+                'messages': sum(len(fanout) for fanout in fanouts),
+                'deliveries': len(latencies),
+                'seconds': round(broadcast_seconds, 3),
+                'deliveries_per_second': round(
+                    len(latencies) / broadcast_seconds, 1),
+                'fanout': percentiles([latency for fanout in fanouts
+                                       for latency in fanout]),
+                'delivery': percentiles(latencies),
+                'fanout_by_room': {
+                    room_name: {'members': len(clients[room_name]),
+                                **percentiles(fanout)}
+                    for room_name, fanout in zip(clients, fanouts)
+                },
+            },
+        }
@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.codecs import JSON, MSGPACK, decode
+from chat.history import HistoryEntry
+
+
+def build_entries(count: int, text: str):
+    return [HistoryEntry(f'user{i % 50}', text, id=i + 1)
+            for i in range(count)]
+
+
+def timed(func, rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = ('Размер и время кодирования страницы истории чата '
+            'в JSON и MessagePack.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,50,500')
+        parser.add_argument('--rounds', type=int, default=200)
+        parser.add_argument('--message-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        text = 'Сообщение ' * (options['message_size'] // 10)
+        rounds = options['rounds']
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            for codec in (JSON, MSGPACK):
+                name = codec.subprotocol or 'json'
+
+                # Холодный буфер: каждый элемент кодируется заново.
+                cold = timed(lambda: codec.history(
+                    'history', build_entries(size, text), False), rounds)
+                entries = build_entries(size, text)
+                frame = codec.history('history', entries, False)
+                warm = timed(lambda: codec.history(
+                    'history', entries, False), rounds)
+
+                if codec.binary:
+                    parse = timed(lambda: decode(bytes_data=frame), rounds)
+                else:
+                    parse = timed(lambda: decode(text_data=frame), rounds)
+
+                self.stdout.write(
+                    f"{size:>5} сообщений  {name:>15}: "
+                    f"{len(frame):>8} байт  "
+                    f"кодирование {cold * 1e6:8.1f} мкс "
+                    f"(из буфера {warm * 1e6:7.1f})  "
+                    f"разбор {parse * 1e6:8.1f} мкс")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('send_mail', '0001_pending_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingnotification',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,3 +1,28 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class PendingNotification(models.Model):
+    """
+    Уведомление, ожидающее отправки в дайджесте получателю.
+
+    claim — метка задачи, которая сейчас отправляет строку; пустая —
+    строка свободна. Строки удаляются только после отправки письма,
+    поэтому переживают перезапуск воркеров и брокера. attempts — число
+    неудачных отправок дайджеста с этой строкой.
+    """
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True, default='')
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'claim', 'id'],
+                         name='notification_recipient'),
+            models.Index(fields=['claim', 'created_at'],
+                         name='notification_claim_created'),
+        ]
@@ -0,0 +1,88 @@
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PendingNotification
+
+
+def digest_window() -> float:
+    return getattr(settings, 'NOTIFICATION_DIGEST_WINDOW', 60.0)
+
+
+def enqueue_notification(recipient: str, subject: str, message: str) -> None:
+    """
+    Кладёт уведомление в буфер получателя.
+
+    Первое уведомление в пустом буфере ставит send_digest с задержкой
+    NOTIFICATION_DIGEST_WINDOW секунд; всё, что придёт за это время,
+    уйдёт одним письмом. Задача ставится после коммита транзакции, чтобы
+    воркер увидел строку.
+    """
+    from .tasks import send_digest
+
+    with transaction.atomic():
+        first = not PendingNotification.objects.filter(
+            recipient=recipient, claim='').exists()
+        PendingNotification.objects.create(
+            recipient=recipient, subject=subject, message=message)
+        if first:
+            transaction.on_commit(lambda: send_digest.apply_async(
+                args=[recipient], countdown=digest_window()))
+
+
+def claim_notifications(recipients: Optional[Iterable[str]] = None,
+                        created_before=None) -> str:
+    """
+    Помечает свободные уведомления меткой текущей отправки.
+
+    Одна строка достаётся одной отправке, даже если для получателя
+    одновременно сработали отложенная задача и периодическая проверка.
+
+    Returns:
+        str: Метка; строки ищутся по ней.
+    """
+    claim = uuid.uuid4().hex
+    pending = PendingNotification.objects.filter(claim='')
+    if recipients is not None:
+        pending = pending.filter(recipient__in=list(recipients))
+    if created_before is not None:
+        pending = pending.filter(created_at__lte=created_before)
+    pending.update(claim=claim, claimed_at=timezone.now())
+    return claim
+
+
+def release_claim(claim: str) -> None:
+    PendingNotification.objects.filter(claim=claim).update(
+        claim='', claimed_at=None)
+
+
+def build_digests(claim: str) -> List[Tuple[EmailMessage, List[int]]]:
+    """
+    Одно письмо на получателя из уведомлений с меткой claim.
+
+    Returns:
+        list: [(письмо, id строк, из которых оно собрано), ...]
+    """
+    grouped = {}
+    for row_id, recipient, subject, message in \
+            PendingNotification.objects.filter(claim=claim).order_by(
+                'recipient', 'id').values_list(
+                'id', 'recipient', 'subject', 'message'):
+        grouped.setdefault(recipient, []).append((row_id, subject, message))
+
+    digests = []
+    for recipient, items in grouped.items():
+        if len(items) == 1:
+            _, subject, body = items[0]
+        else:
+            subject = f'Обновления задач: {len(items)}'
+            body = '\n\n'.join(f'{subject}\n{message}'
+                                for _, subject, message in items)
+        digests.append((EmailMessage(subject=subject, body=body,
+                                     to=[recipient]),
+                        [row_id for row_id, _, _ in items]))
+    return digests
@@ -1,7 +1,25 @@
+import logging
+import smtplib
+from datetime import timedelta
+
 from celery import shared_task
-from django.core.mail import send_mail
+from django.conf import settings
+from django.core.mail import get_connection, send_mail
+from django.db.models import F, Q
+from django.utils import timezone
 from typing import List
 
+from .models import PendingNotification
+from .notifications import (build_digests, claim_notifications,
+                            digest_window, release_claim)
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, относящиеся к одному письму (адрес, содержимое): остальные
+# письма можно отправлять через то же подключение.
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused,
+                  smtplib.SMTPResponseException)
+
 
 @shared_task
 def send_email_task(subject: str, message: str,
@@ -33,3 +51,93 @@ def send_email_task(subject: str, message: str,
         fail_silently=False,
     )
 
+
+def _record_failure(row_ids: List[int], recipient: str,
+                    error: Exception) -> None:
+    """
+    Возвращает строки неотправленного дайджеста в буфер с attempts + 1.
+    После NOTIFICATION_MAX_ATTEMPTS неудач строки удаляются.
+    """
+    PendingNotification.objects.filter(pk__in=row_ids).update(
+        claim='', claimed_at=None, attempts=F('attempts') + 1)
+    dropped, _ = PendingNotification.objects.filter(
+        pk__in=row_ids,
+        attempts__gte=getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5),
+    ).delete()
+    if dropped:
+        logger.error(f"Dropped {dropped} notifications for {recipient} "
+                     f"after repeated failures: {error}")
+    else:
+        logger.warning(f"Digest for {recipient} failed, will retry: {error}")
+
+
+def _send_claimed(claim: str) -> int:
+    """
+    Отправляет дайджесты по метке через одно SMTP-подключение.
+
+    Каждый дайджест отправляется отдельно, его строки удаляются сразу
+    после успеха, поэтому ошибка на одном получателе не приводит к
+    повторной отправке уже доставленных писем. Строки неудавшегося
+    дайджеста возвращаются в буфер со счётчиком попыток. Если ошибка не
+    относится к конкретному письму (соединение), отправка прекращается
+    и исключение пробрасывается; оставшиеся строки освобождаются без
+    увеличения счётчика.
+    """
+    digests = build_digests(claim)
+    if not digests:
+        return 0
+    sent = 0
+    try:
+        with get_connection(fail_silently=False) as connection:
+            for digest, row_ids in digests:
+                try:
+                    connection.send_messages([digest])
+                except Exception as e:
+                    _record_failure(row_ids, digest.to[0], e)
+                    if isinstance(e, MESSAGE_ERRORS):
+                        continue
+                    raise
+                PendingNotification.objects.filter(pk__in=row_ids).delete()
+                sent += 1
+    finally:
+        release_claim(claim)
+    return sent
+
+
+@shared_task
+def send_digest(recipient: str) -> int:
+    """
+    Отправляет получателю одним письмом всё, что накопилось в буфере.
+
+    Returns:
+        int: Количество отправленных писем (0 или 1).
+    """
+    return _send_claimed(claim_notifications([recipient]))
+
+
+@shared_task
+def flush_notifications() -> int:
+    """
+    Периодическая проверка буфера уведомлений.
+
+    Отправляет уведомления, чья отложенная send_digest потерялась
+    (перезапуск воркера или брокера) или не удалась, — все получатели
+    за одно SMTP-подключение, каждому отдельным письмом. Метки
+    отправок, не завершившихся за NOTIFICATION_CLAIM_TIMEOUT секунд,
+    снимаются.
+
+    Returns:
+        int: Количество отправленных писем.
+    """
+    now = timezone.now()
+    stale = now - timedelta(
+        seconds=getattr(settings, 'NOTIFICATION_CLAIM_TIMEOUT', 600))
+    PendingNotification.objects.filter(
+        ~Q(claim=''), claimed_at__lt=stale).update(claim='', claimed_at=None)
+
+    # Запас в одно окно: свежие строки ещё ждут свою send_digest.
+    overdue = now - timedelta(seconds=2 * digest_window())
+    recipients = PendingNotification.objects.filter(
+        claim='', created_at__lte=overdue).values_list(
+        'recipient', flat=True).distinct()
+    return _send_claimed(claim_notifications(recipients))
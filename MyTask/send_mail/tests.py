@@ -1,3 +1,80 @@
-from django.test import TestCase
+import smtplib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import tasks
+from .models import PendingNotification
+from .notifications import enqueue_notification
+
+send_messages = EmailBackend.send_messages
+
+
+def refuse(*addresses):
+    """send_messages, отклоняющий письма на addresses."""
+    def fake(backend, messages):
+        for message in messages:
+            if message.to[0] in addresses:
+                raise smtplib.SMTPRecipientsRefused(
+                    {message.to[0]: (550, b'No such user')})
+        return send_messages(backend, messages)
+    return fake
+
+
+@override_settings(NOTIFICATION_MAX_ATTEMPTS=2)
+class DigestTests(TestCase):
+    def enqueue(self, recipient, count=1):
+        with mock.patch.object(tasks.send_digest, 'apply_async'):
+            for i in range(count):
+                enqueue_notification(recipient, f'Task {i}', f'Body {i}')
+
+    def make_overdue(self):
+        PendingNotification.objects.update(
+            created_at=timezone.now() - timedelta(hours=1))
+
+    def test_digest_coalesces_notifications(self):
+        self.enqueue('a@example.com', 3)
+
+        self.assertEqual(tasks.send_digest('a@example.com'), 1)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Обновления задач: 3')
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_bad_recipient_does_not_resend_others(self):
+        for recipient in ('a@example.com', 'bad@example.com',
+                          'c@example.com'):
+            self.enqueue(recipient)
+        self.make_overdue()
+
+        with mock.patch.object(EmailBackend, 'send_messages',
+                               refuse('bad@example.com')), \
+                self.assertLogs('send_mail.tasks') as logs:
+            self.assertEqual(tasks.flush_notifications(), 2)
+            self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                             ['a@example.com', 'c@example.com'])
+            row = PendingNotification.objects.get()
+            self.assertEqual((row.recipient, row.claim, row.attempts),
+                             ('bad@example.com', '', 1))
+
+            self.assertEqual(tasks.flush_notifications(), 0)
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(PendingNotification.objects.exists())
+        self.assertIn('Dropped 1 notifications', logs.output[-1])
+
+    def test_connection_error_releases_without_attempt(self):
+        self.enqueue('a@example.com')
+
+        with mock.patch.object(EmailBackend, 'open',
+                               side_effect=smtplib.SMTPConnectError(
+                                   421, b'Try later')):
+            with self.assertRaises(smtplib.SMTPConnectError):
+                tasks.send_digest('a@example.com')
+
+        row = PendingNotification.objects.get()
+        self.assertEqual((row.claim, row.attempts), ('', 0))
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from company.services import get_membership
+from MyTask.conditional import bump_versions
+from .models import Subtask, Task
+
+
+def _task_scopes(employee_id, customer_id):
+    scopes = [f'user:{user_id}' for user_id in (employee_id, customer_id)
+              if user_id]
+    if employee_id:
+        membership = get_membership(employee_id)
+        if membership and membership.company_id:
+            scopes.append(f'company:{membership.company_id}')
+    return scopes
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_changed(sender, instance, **kwargs):
+    bump_versions(*_task_scopes(instance.employee_id, instance.customer_id))
+
+
+@receiver(post_save, sender=Subtask)
+@receiver(post_delete, sender=Subtask)
+def subtask_changed(sender, instance, **kwargs):
+    task = Task.objects.filter(pk=instance.task_id).values_list(
+        'employee_id', 'customer_id').first()
+    if task:
+        bump_versions(*(f'user:{user_id}' for user_id in task if user_id))
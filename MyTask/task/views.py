@@ -9,10 +9,11 @@ from .models import Task, Subtask
 from .forms import TaskForm, SubtaskForm
 from rest_framework import authentication
 from django.conf import settings
-from send_mail.tasks import send_email_task
+from send_mail.notifications import enqueue_notification
 from datetime import date
 from authentication.models import User
 from company.models import Department
+from MyTask.ratelimit import rate_limit
 from loguru import logger
 import jwt
 import json
@@ -179,6 +180,7 @@ def render_subtask_card(request: HttpRequest, subtask: Subtask) -> str:
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('task_write', ip_rate='120/m', user_rate='60/m')
 def add_task(request: HttpRequest) -> JsonResponse:
     payload, error = get_user_payload(request)
     if error:
@@ -214,6 +216,7 @@ def add_task(request: HttpRequest) -> JsonResponse:
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('task_write', ip_rate='120/m', user_rate='60/m')
 def add_subtask(request: HttpRequest) -> JsonResponse:
     data, error = parse_json_body(request)
     if error:
@@ -250,6 +253,7 @@ def add_subtask(request: HttpRequest) -> JsonResponse:
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('task_write', ip_rate='120/m', user_rate='60/m')
 def delete_task_ajax(request: HttpRequest) -> JsonResponse:
     data, error = parse_json_body(request)
     if error:
@@ -278,6 +282,7 @@ def delete_task_ajax(request: HttpRequest) -> JsonResponse:
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('task_write', ip_rate='120/m', user_rate='60/m')
 def delete_subtask_ajax(request: HttpRequest) -> JsonResponse:
     data, error = parse_json_body(request)
     if error:
@@ -309,6 +314,7 @@ def delete_subtask_ajax(request: HttpRequest) -> JsonResponse:
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('task_write', ip_rate='120/m', user_rate='60/m')
 def edit_subtask_ajax(request: HttpRequest) -> JsonResponse:
     data, error = parse_json_body(request)
     if error:
@@ -346,6 +352,7 @@ def edit_subtask_ajax(request: HttpRequest) -> JsonResponse:
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('task_write', ip_rate='120/m', user_rate='60/m')
 def toggle_subtask_ajax(request: HttpRequest) -> JsonResponse:
     data, error = parse_json_body(request)
     if error:
@@ -378,6 +385,7 @@ def toggle_subtask_ajax(request: HttpRequest) -> JsonResponse:
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('task_write', ip_rate='120/m', user_rate='60/m')
 def edit_task_ajax(request: HttpRequest) -> JsonResponse:
     data, error = parse_json_body(request)
     if error:
@@ -431,6 +439,7 @@ def edit_task_ajax(request: HttpRequest) -> JsonResponse:
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('task_write', ip_rate='120/m', user_rate='60/m')
 def update_task_status(request: HttpRequest) -> JsonResponse:
     data, error = parse_json_body(request)
     if error:
@@ -452,10 +461,10 @@ def update_task_status(request: HttpRequest) -> JsonResponse:
         task = Task.objects.get(id=task_id)
         task.status = new_status
         task.save()
-        send_email_task.delay(
+        enqueue_notification(
+            recipient=task.customer.email,
             subject="Изменение статуса задачи",
-            message=f"Задача '{task.title}' стала в статус '{new_status}'.",
-            recipient_list=[task.customer.email]
+            message=f"Задача '{task.title}' стала в статус '{new_status}'."
         )
         logger.info(f"Task updated: {task}")
         return JsonResponse({'status': task.status})
@@ -469,6 +478,7 @@ def update_task_status(request: HttpRequest) -> JsonResponse:
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('task_write', ip_rate='120/m', user_rate='60/m')
 def update_subtask_status(request: HttpRequest) -> JsonResponse:
     data, error = parse_json_body(request)
     if error:
@@ -502,6 +512,7 @@ def update_subtask_status(request: HttpRequest) -> JsonResponse:
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('task_write', ip_rate='120/m', user_rate='60/m')
 def take_task_ajax(request: HttpRequest) -> JsonResponse:
     payload, error = get_user_payload(request)
     if error:
@@ -526,10 +537,10 @@ def take_task_ajax(request: HttpRequest) -> JsonResponse:
     try:
         task = Task.objects.get(id=task_id)
         task.take_task(user)
-        send_email_task.delay(
+        enqueue_notification(
+            recipient=task.customer.email,
             subject="Назначение задачи",
-            message=f"Задача '{task.title}' была назначена {user.username}.",
-            recipient_list=[task.customer.email]
+            message=f"Задача '{task.title}' была назначена {user.username}."
         )
         logger.info(f"Task taken by {user.username}")
         return JsonResponse({'success': True, 'username': user.username})